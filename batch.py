@@ -0,0 +1,19 @@
+import os
+from typing import Any, Dict, List, Sequence, Tuple
+from fastapi import HTTPException, status
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Upper bound on the ids of one batch lookup, so a single $in stays cheap
+BATCH_MAX_IDS = int(os.getenv("BATCH_MAX_IDS", "100"))
+
+def check_size(ids: Sequence[str]):
+    if len(ids) > BATCH_MAX_IDS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {BATCH_MAX_IDS} ids per request")
+
+def in_order(ids: Sequence[str], found: Dict[str, Any]) -> Tuple[List[Any], List[str]]:
+    """Results in request order, plus the requested ids that were not found."""
+    items = [found[value] for value in ids if value in found]
+    missing = list(dict.fromkeys(value for value in ids if value not in found))
+    return items, missing
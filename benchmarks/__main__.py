@@ -0,0 +1,64 @@
+"""Run the benchmark suite and compare it against the stored baseline.
+
+    python -m benchmarks                      # micro + load on in-memory repositories
+    python -m benchmarks --mongo url          # load against MONGO_DB_URL
+    python -m benchmarks --update-baseline    # record the current numbers
+
+Exits with status 1 when any benchmark regressed beyond BENCH_TOLERANCE,
+and with status 2 when there is no baseline to compare against, so a
+missing baseline never passes as "no regressions".
+Baselines are machine specific; record one on the machine that compares.
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+# Set before the app modules load: per-request INFO lines and a log file
+# would be measured along with the code under test
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("LOG_FILE", "")
+
+from benchmarks import baseline
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("--suite", choices=["all", "micro", "load"], default="all")
+    parser.add_argument("--mongo", choices=["memory", "url"], default="memory")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--movies", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier for micro-benchmark rounds")
+    parser.add_argument("--tolerance", type=float, default=baseline.BENCH_TOLERANCE)
+    parser.add_argument("--baseline", default=baseline.BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = {}
+    if args.suite in ("all", "micro"):
+        from benchmarks import micro
+        results.update(micro.run(args.scale))
+    if args.suite in ("all", "load"):
+        from benchmarks import load
+        results.update(asyncio.run(load.run(args.mongo, args.duration, args.concurrency, args.movies, seed_value=args.seed)))
+
+    print(baseline.render(results))
+
+    if args.update_baseline:
+        # Merge so a partial run only replaces the benchmarks it measured
+        baseline.save({**baseline.load(args.baseline), **results}, args.baseline)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    reference = baseline.load(args.baseline)
+    if not reference:
+        print(f"SKIPPED: no baseline at {args.baseline}; run with --update-baseline to record one")
+        return 2
+    regressions = baseline.compare(results, reference, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+import json
+import math
+import os
+from typing import Dict, List, Sequence
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BASELINE_PATH = os.getenv("BENCH_BASELINE", os.path.join(os.path.dirname(__file__), "baseline.json"))
+# Allowed slowdown relative to the baseline before a benchmark counts as regressed
+BENCH_TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "0.25"))
+
+def percentile(samples: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile of `samples`, q in [0, 100]."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(math.ceil(q / 100 * len(ordered)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+def summarize(latencies: Sequence[float], elapsed: float, errors: int = 0) -> dict:
+    """Throughput and latency percentiles (ms) for one benchmark's per-call latencies (s)."""
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "ops_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+def load(path: str = BASELINE_PATH) -> Dict[str, dict]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+def save(results: Dict[str, dict], path: str = BASELINE_PATH):
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float = BENCH_TOLERANCE) -> List[str]:
+    """Describe every benchmark that got slower than its baseline by more than `tolerance`."""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        if result["ops_per_sec"] < reference["ops_per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: {result['ops_per_sec']:.1f} ops/s, baseline {reference['ops_per_sec']:.1f}")
+        if result["p95_ms"] > reference["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']:.3f} ms, baseline {reference['p95_ms']:.3f}")
+        if result.get("errors", 0) > reference.get("errors", 0):
+            regressions.append(f"{name}: {result['errors']} errors, baseline {reference.get('errors', 0)}")
+    return regressions
+
+def render(results: Dict[str, dict]) -> str:
+    lines = [f"{'benchmark':<32} {'count':>8} {'ops/s':>12} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'errors':>7}"]
+    for name, result in sorted(results.items()):
+        lines.append(
+            f"{name:<32} {result['count']:>8} {result['ops_per_sec']:>12.1f} "
+            f"{result['p50_ms']:>10.3f} {result['p95_ms']:>10.3f} {result['p99_ms']:>10.3f} {result['errors']:>7}"
+        )
+    return "\n".join(lines)
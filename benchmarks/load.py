@@ -0,0 +1,166 @@
+import asyncio
+import random
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Dict, List
+import httpx
+from benchmarks.baseline import summarize
+
+# Relative weights of the request mix; reads dominate like on the real site
+MIX = {
+    "get_movie": 35,
+    "list_movies": 15,
+    "batch_get_movies": 5,
+    "get_comments": 15,
+    "comment_tree": 5,
+    "reply_to_comment": 5,
+    "rate_movie": 10,
+    "get_ratings": 5,
+    "rating_summary": 5,
+}
+
+class LoadState:
+    def __init__(self, headers: dict, movie_ids: List[str], comment_ids: Dict[str, List[str]]):
+        self.headers = headers
+        self.movie_ids = movie_ids
+        self.comment_ids = comment_ids
+
+async def get_movie(client, state, rng):
+    return await client.get(f"/movies/{rng.choice(state.movie_ids)}")
+
+async def list_movies(client, state, rng):
+    return await client.get("/movies", params={"limit": 20, "genre": rng.choice(["Drama", "Comedy"])})
+
+async def batch_get_movies(client, state, rng):
+    return await client.post("/movies/batch-get", json={"ids": rng.sample(state.movie_ids, min(20, len(state.movie_ids)))})
+
+async def get_comments(client, state, rng):
+    return await client.get(f"/movie/{rng.choice(state.movie_ids)}/comments")
+
+async def comment_tree(client, state, rng):
+    return await client.get(f"/movie/{rng.choice(state.movie_ids)}/comments/tree")
+
+async def reply_to_comment(client, state, rng):
+    movie_id = rng.choice(state.movie_ids)
+    parent_id = rng.choice(state.comment_ids[movie_id])
+    response = await client.post(
+        f"/movie/{movie_id}/comment/{parent_id}",
+        json={"content": "Benchmark reply", "movie_id": movie_id},
+        headers=state.headers
+    )
+    if response.status_code == 200:
+        state.comment_ids[movie_id].append(response.json()["id"])
+    return response
+
+async def rate_movie(client, state, rng):
+    movie_id = rng.choice(state.movie_ids)
+    return await client.post(f"/movie/{movie_id}/rate", json={"rating": rng.randint(0, 10), "movie_id": movie_id}, headers=state.headers)
+
+async def get_ratings(client, state, rng):
+    return await client.get(f"/movie/{rng.choice(state.movie_ids)}/ratings")
+
+async def rating_summary(client, state, rng):
+    return await client.get(f"/movie/{rng.choice(state.movie_ids)}/rating-summary")
+
+SCENARIOS = {
+    "get_movie": get_movie,
+    "list_movies": list_movies,
+    "batch_get_movies": batch_get_movies,
+    "get_comments": get_comments,
+    "comment_tree": comment_tree,
+    "reply_to_comment": reply_to_comment,
+    "rate_movie": rate_movie,
+    "get_ratings": get_ratings,
+    "rating_summary": rating_summary,
+}
+
+async def seed(client: httpx.AsyncClient, rng: random.Random, movies: int, comments_per_movie: int) -> LoadState:
+    username = f"bench-{rng.getrandbits(32):08x}"
+    response = await client.post("/signup", json={
+        # The signup body is a full User, so it needs an (ignored) id
+        "id": "",
+        "username": username,
+        "password": "benchmark-password",
+        "email": f"{username}@example.com",
+        "firstName": "Bench",
+        "lastName": "Mark"
+    })
+    response.raise_for_status()
+    response = await client.post("/login", data={"username": username, "password": "benchmark-password"})
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    movie_ids, comment_ids = [], {}
+    for i in range(movies):
+        response = await client.post("/movies", headers=headers, json={
+            "title": f"Benchmark Movie {i}",
+            "release_date": f"20{i % 25:02d}-01-01",
+            "genre": "Drama" if i % 2 else "Comedy",
+            "director": "Jane Doe",
+            "synopsis": "A movie that exists to be measured.",
+            "runtime": 90 + i % 60,
+            "language": "English"
+        })
+        response.raise_for_status()
+        movie_id = response.json()["id"]
+        movie_ids.append(movie_id)
+        comment_ids[movie_id] = []
+        for _ in range(comments_per_movie):
+            response = await client.post(f"/movie/{movie_id}/comment", headers=headers, json={"content": "Benchmark comment", "movie_id": movie_id})
+            response.raise_for_status()
+            comment_ids[movie_id].append(response.json()["id"])
+    return LoadState(headers, movie_ids, comment_ids)
+
+@asynccontextmanager
+async def app_client(mongo: str):
+    """ASGI client for the app, backed by in-memory repositories or MONGO_DB_URL."""
+    from main import app
+    from repositories import get_repos, memory_repositories
+    transport = httpx.ASGITransport(app=app)
+    if mongo == "memory":
+        # No lifespan: it would connect to Mongo, and nothing in the mix needs it
+        repos = memory_repositories()
+        app.dependency_overrides[get_repos] = lambda: repos
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                yield client
+        finally:
+            app.dependency_overrides.pop(get_repos, None)
+    else:
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                yield client
+
+async def drive(client: httpx.AsyncClient, state: LoadState, rng: random.Random, duration: float, concurrency: int) -> Dict[str, dict]:
+    names = list(MIX)
+    weights = [MIX[name] for name in names]
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    # One seeded generator per worker keeps runs reproducible
+    worker_rngs = [random.Random(rng.getrandbits(64)) for _ in range(concurrency)]
+    deadline = time.perf_counter() + duration
+
+    async def worker(worker_rng: random.Random):
+        while time.perf_counter() < deadline:
+            name = worker_rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            response = await SCENARIOS[name](client, state, worker_rng)
+            latencies[name].append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors[name] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(worker_rng) for worker_rng in worker_rngs))
+    elapsed = time.perf_counter() - start
+
+    results = {f"load.{name}": summarize(samples, elapsed, errors[name]) for name, samples in latencies.items()}
+    all_samples = [sample for samples in latencies.values() for sample in samples]
+    results["load.total"] = summarize(all_samples, elapsed, sum(errors.values()))
+    return results
+
+async def run(mongo: str = "memory", duration: float = 10.0, concurrency: int = 16, movies: int = 50, comments_per_movie: int = 5, seed_value: int = 1) -> Dict[str, dict]:
+    rng = random.Random(seed_value)
+    async with app_client(mongo) as client:
+        state = await seed(client, rng, movies, comments_per_movie)
+        return await drive(client, state, rng, duration, concurrency)
@@ -0,0 +1,76 @@
+import os
+import time
+from datetime import datetime
+from typing import Callable, Dict
+from bson import ObjectId
+from dotenv import load_dotenv
+
+load_dotenv()
+# jwt_token reads these at import time; benchmarks must not need a real .env
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+
+from fastapi import HTTPException
+from benchmarks.baseline import summarize
+from hashing import Hash
+from jwt_token import create_access_token, verify_token
+from routers.comments import convert_id_to_str
+from schemas import schemas
+from serialization import MOVIE_FIELDS, dumps, to_out
+
+MOVIE = {
+    "_id": ObjectId(),
+    "title": "Benchmark Movie",
+    "genre": "Drama",
+    "director": "Jane Doe",
+    "synopsis": "A movie that exists to be measured. " * 8,
+    "runtime": 120,
+    "language": "English",
+    "release_date": datetime(2024, 8, 14),
+    "user_id": str(ObjectId()),
+}
+COMMENT = {
+    "_id": ObjectId(),
+    "content": "Great movie",
+    "movie_id": str(MOVIE["_id"]),
+    "user_id": str(ObjectId()),
+    "parent_id": None,
+    "ancestors": [],
+    "depth": 0,
+}
+
+def measure(fn: Callable[[], object], rounds: int, inner: int) -> dict:
+    """Time `rounds` batches of `inner` calls; each batch yields one per-call latency."""
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(rounds):
+        batch_start = time.perf_counter()
+        for _ in range(inner):
+            fn()
+        latencies.append((time.perf_counter() - batch_start) / inner)
+    elapsed = time.perf_counter() - start
+    result = summarize(latencies, elapsed)
+    # Throughput counts calls, not batches
+    result["ops_per_sec"] *= inner
+    result["count"] *= inner
+    return result
+
+def run(scale: float = 1.0) -> Dict[str, dict]:
+    rounds = max(int(200 * scale), 10)
+    token = create_access_token({"sub": str(ObjectId())})
+    credentials_exception = HTTPException(status_code=401)
+    password_hash = Hash.bcrypt("benchmark-password")
+
+    def movie_response():
+        return schemas.MovieResponse(id=str(MOVIE["_id"]), **{key: MOVIE[key] for key in MOVIE if key != "_id"})
+
+    return {
+        "micro.convert_id_to_str": measure(lambda: convert_id_to_str(COMMENT), rounds, 1000),
+        "micro.verify_token": measure(lambda: verify_token(token, credentials_exception), rounds, 100),
+        "micro.movie_response": measure(movie_response, rounds, 100),
+        "micro.movie_response_json": measure(lambda: movie_response().json(), rounds, 100),
+        "micro.to_out_dumps": measure(lambda: dumps(to_out(MOVIE, MOVIE_FIELDS)), rounds, 100),
+        # bcrypt is deliberately slow; a handful of single calls is enough
+        "micro.hash_verify": measure(lambda: Hash.verify(password_hash, "benchmark-password"), max(int(10 * scale), 3), 1),
+    }
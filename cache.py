@@ -0,0 +1,212 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence
+import orjson
+
+_MISSING = object()
+
+class TTLCache:
+    """Bounded in-process LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class MemoryBackend:
+    """Per-process response cache storage: bounded LRU entries plus tag versions.
+
+    Tag versions come from one increasing counter and at most `max_tags` are
+    kept. A forgotten tag reads as the highest version evicted so far, which
+    no entry recorded before that eviction can match, so eviction only ever
+    costs a miss.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 30.0, max_tags: Optional[int] = None):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.max_tags = maxsize if max_tags is None else max_tags
+        self.versions: "OrderedDict[str, int]" = OrderedDict()
+        self._counter = 0
+        self._floor = 0
+
+    async def get(self, key: str) -> Optional[tuple]:
+        return self.entries.get(key)
+
+    async def set(self, key: str, entry: tuple, ttl: Optional[float] = None):
+        self.entries.set(key, entry, ttl)
+
+    async def tag_versions(self, tags: Sequence[str]) -> List[int]:
+        return [self.versions.get(tag, self._floor) for tag in tags]
+
+    async def bump_tags(self, tags: Sequence[str]):
+        for tag in tags:
+            self._counter += 1
+            self.versions[tag] = self._counter
+            self.versions.move_to_end(tag)
+        # Bumps append in counter order, so the oldest is also the lowest
+        while len(self.versions) > self.max_tags:
+            _, version = self.versions.popitem(last=False)
+            self._floor = max(self._floor, version)
+
+class SharedBackend:
+    """Response cache storage in a shared key-value store, so every worker sees
+    the same entries and invalidations.
+
+    `client` needs the async get/set(ex=)/mget/incr subset of redis-py's
+    asyncio client; LocalKVStore provides it in memory for tests.
+    """
+
+    def __init__(self, client, prefix: str = "cache:", ttl: float = 30.0):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    async def get(self, key: str) -> Optional[tuple]:
+        raw = await self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        entry = orjson.loads(raw)
+        return entry["value"], entry["tags"]
+
+    async def set(self, key: str, entry: tuple, ttl: Optional[float] = None):
+        value, tags = entry
+        raw = orjson.dumps({"value": value, "tags": tags}, default=str)
+        await self.client.set(self.prefix + key, raw, ex=max(int(self.ttl if ttl is None else ttl), 1))
+
+    async def tag_versions(self, tags: Sequence[str]) -> List[int]:
+        values = await self.client.mget([self.prefix + "tag:" + tag for tag in tags])
+        return [int(value) if value is not None else 0 for value in values]
+
+    async def bump_tags(self, tags: Sequence[str]):
+        for tag in tags:
+            await self.client.incr(self.prefix + "tag:" + tag)
+
+class LocalKVStore:
+    """In-process stand-in for a shared key-value store such as Redis."""
+
+    def __init__(self):
+        self._data: Dict[str, tuple] = {}
+
+    async def get(self, key: str):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    async def set(self, key: str, value, ex: Optional[int] = None):
+        self._data[key] = (time.monotonic() + ex if ex else None, value)
+
+    async def mget(self, keys: Sequence[str]) -> list:
+        return [await self.get(key) for key in keys]
+
+    async def incr(self, key: str) -> int:
+        value = int(await self.get(key) or 0) + 1
+        self._data[key] = (None, str(value).encode())
+        return value
+
+class ResponseCache:
+    """Read-through cache with tag invalidation and single-flight loading.
+
+    Every entry records the versions of its tags when its load started; it
+    is a hit only while all of them are unchanged. Invalidating a key or tag
+    bumps its version, so a load racing with an invalidation can never
+    store a value that looks fresh. Concurrent misses on one key share a
+    single load.
+    """
+
+    def __init__(self, backend, ttl: Optional[float] = None):
+        self.backend = backend
+        self.ttl = ttl
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]], tags: Sequence[str] = (), variant: str = "") -> Any:
+        """Return the cached value for `key`, loading it on a miss.
+
+        Variants (e.g. different field selections) are stored separately but
+        are all invalidated together with their key.
+        """
+        entry_key = f"{key}|{variant}" if variant else key
+        entry = await self.backend.get(entry_key)
+        if entry is not None:
+            value, recorded = entry
+            if await self.backend.tag_versions(list(recorded)) == list(recorded.values()):
+                self.hits += 1
+                return value
+
+        inflight = self._inflight.get(entry_key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[entry_key] = future
+        try:
+            all_tags = ["key:" + key, *tags]
+            versions = await self.backend.tag_versions(all_tags)
+            value = await loader()
+            await self.backend.set(entry_key, (value, dict(zip(all_tags, versions))), self.ttl)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # Mark the exception retrieved in case no other request was waiting
+            future.exception()
+            raise
+        finally:
+            del self._inflight[entry_key]
+
+    async def invalidate(self, keys: Sequence[str] = (), tags: Sequence[str] = ()):
+        await self.backend.bump_tags(["key:" + key for key in keys] + list(tags))
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "10000"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "30"))
+
+# Process-local by default; call configure_response_cache() at startup to
+# plug in a SharedBackend so invalidations reach every worker. Handlers also
+# key entries by their ETag, so a worker that missed an invalidation still
+# never pairs an old body with a new version.
+response_cache = ResponseCache(MemoryBackend(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL_SECONDS))
+
+def configure_response_cache(backend):
+    response_cache.backend = backend
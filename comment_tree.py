@@ -0,0 +1,66 @@
+from typing import Dict, List
+from pymongo import UpdateOne
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from schemas import schemas
+
+# Every comment stores `ancestors` (the ids from its thread root down to its
+# parent) and `depth` (len(ancestors)), so a whole thread or any subtree can be
+# fetched with one indexed query instead of one round trip per level.
+
+def path_fields(parent: dict = None) -> dict:
+    if parent is None:
+        return {"ancestors": [], "depth": 0}
+    return {
+        "ancestors": parent.get("ancestors", []) + [str(parent["_id"])],
+        "depth": parent.get("depth", 0) + 1,
+    }
+
+def build_tree(comments: List[dict]) -> List[schemas.CommentNode]:
+    """Assemble comments sorted by depth into nested nodes in a single pass.
+
+    Comments whose parent is not part of the slice become top-level nodes.
+    """
+    nodes: Dict[str, schemas.CommentNode] = {}
+    roots = []
+    for comment in comments:
+        node = schemas.CommentNode(
+            id=str(comment["_id"]),
+            **{key: comment[key] for key in comment if key != "_id"}
+        )
+        nodes[node.id] = node
+        parent = nodes.get(comment.get("parent_id"))
+        if parent is None:
+            roots.append(node)
+        else:
+            parent.replies.append(node)
+    return roots
+
+async def backfill_comment_paths(db: AsyncIOMotorDatabase, batch_size: int = 1000) -> int:
+    """Populate `ancestors`/`depth` on comments written before they were stored.
+
+    Returns the number of comments changed.
+    """
+    result = await db["comments"].update_many({"parent_id": None}, {"$set": path_fields()})
+    updated = result.modified_count
+    frontier = {}
+    async for comment in db["comments"].find({"parent_id": None}, {"_id": 1}):
+        frontier[str(comment["_id"])] = path_fields(comment)
+
+    while frontier:
+        next_frontier = {}
+        parent_ids = list(frontier)
+        for start in range(0, len(parent_ids), batch_size):
+            chunk = parent_ids[start:start + batch_size]
+            updates = []
+            async for comment in db["comments"].find({"parent_id": {"$in": chunk}}, {"_id": 1, "parent_id": 1}):
+                fields = frontier[comment["parent_id"]]
+                updates.append(UpdateOne({"_id": comment["_id"]}, {"$set": fields}))
+                next_frontier[str(comment["_id"])] = {
+                    "ancestors": fields["ancestors"] + [str(comment["_id"])],
+                    "depth": fields["depth"] + 1,
+                }
+            if updates:
+                result = await db["comments"].bulk_write(updates, ordered=False)
+                updated += result.modified_count
+        frontier = next_frontier
+    return updated
@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from pymongo import UpdateOne
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from dotenv import load_dotenv
+import periodic
+
+load_dotenv()
+
+logger = logging.getLogger("counters")
+
+# Movies carry comment_count, rating_count, rating_sum and last_activity_at;
+# comments carry reply_count (direct replies). Writes keep them current with
+# atomic $inc/$max updates next to the insert, so list endpoints can show
+# counts and average ratings without touching comments or ratings. The two
+# writes are not transactional; the reconciler repairs any drift.
+
+# In-app reconcile interval; 0 (the default) leaves reconciling to a single
+# `python -m counters` job instead of one full scan per worker
+COUNTER_RECONCILE_INTERVAL_SECONDS = float(os.getenv("COUNTER_RECONCILE_INTERVAL_SECONDS", "0"))
+COUNTER_RECONCILE_BATCH_SIZE = int(os.getenv("COUNTER_RECONCILE_BATCH_SIZE", "500"))
+# rating_sum is built from float $inc deltas; rounding below this is not drift
+RATING_SUM_TOLERANCE = 1e-6
+
+MOVIE_COUNTERS = ("comment_count", "rating_count", "rating_sum")
+
+def now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def new_movie_counters() -> dict:
+    return {"comment_count": 0, "rating_count": 0, "rating_sum": 0, "last_activity_at": None}
+
+def rating_added(rating: float, at: datetime) -> dict:
+    return {"$inc": {"rating_count": 1, "rating_sum": rating}, "$max": {"last_activity_at": at}}
+
+def rating_changed(previous: float, rating: float, at: datetime) -> dict:
+    return {"$inc": {"rating_sum": rating - previous}, "$max": {"last_activity_at": at}}
+
+def comment_added(at: datetime) -> dict:
+    return {"$inc": {"comment_count": 1}, "$max": {"last_activity_at": at}}
+
+REPLY_ADDED = {"$inc": {"reply_count": 1}}
+
+async def _group_by(db: AsyncIOMotorDatabase, collection: str, key: str, values: List[str], extra: dict) -> Dict[str, dict]:
+    pipeline = [
+        {"$match": {key: {"$in": values}}},
+        {"$group": {"_id": f"${key}", "count": {"$sum": 1}, "last_id": {"$max": "$_id"}, **extra}},
+    ]
+    return {row["_id"]: row async for row in db[collection].aggregate(pipeline)}
+
+def _differs(field: str, current, expected) -> bool:
+    if field == "rating_sum" and current is not None:
+        return abs(current - expected) > RATING_SUM_TOLERANCE
+    return current != expected
+
+def _guarded(document: dict, fields) -> dict:
+    # Compare-and-set on the values read, so a write racing the batch wins and
+    # the next run picks the movie up again
+    return {"_id": document["_id"], **{field: document.get(field) for field in fields}}
+
+async def reconcile_movies(db: AsyncIOMotorDatabase, batch_size: int = COUNTER_RECONCILE_BATCH_SIZE) -> int:
+    repaired = 0
+    last_id = None
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        movies = await db["movies"].find(query, {field: 1 for field in (*MOVIE_COUNTERS, "last_activity_at")}).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not movies:
+            return repaired
+        last_id = movies[-1]["_id"]
+        movie_ids = [str(movie["_id"]) for movie in movies]
+        comments, ratings = await asyncio.gather(
+            _group_by(db, "comments", "movie_id", movie_ids, {}),
+            _group_by(db, "ratings", "movie_id", movie_ids, {"sum": {"$sum": "$rating"}}),
+        )
+
+        updates = []
+        for movie in movies:
+            movie_id = str(movie["_id"])
+            comment_row, rating_row = comments.get(movie_id, {}), ratings.get(movie_id, {})
+            expected = {
+                "comment_count": comment_row.get("count", 0),
+                "rating_count": rating_row.get("count", 0),
+                "rating_sum": rating_row.get("sum", 0),
+            }
+            # ObjectIds embed their creation time, which bounds the latest activity
+            activity = [row["last_id"].generation_time for row in (comment_row, rating_row) if row]
+            if activity and movie.get("last_activity_at") is None:
+                expected["last_activity_at"] = max(activity)
+            if any(_differs(field, movie.get(field), value) for field, value in expected.items()):
+                updates.append(UpdateOne(_guarded(movie, expected), {"$set": expected}))
+        if updates:
+            result = await db["movies"].bulk_write(updates, ordered=False)
+            repaired += result.modified_count
+
+async def reconcile_replies(db: AsyncIOMotorDatabase, batch_size: int = COUNTER_RECONCILE_BATCH_SIZE) -> int:
+    repaired = 0
+    last_id = None
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        comments = await db["comments"].find(query, {"reply_count": 1}).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not comments:
+            return repaired
+        last_id = comments[-1]["_id"]
+        replies = await _group_by(db, "comments", "parent_id", [str(comment["_id"]) for comment in comments], {})
+
+        updates = []
+        for comment in comments:
+            expected = replies.get(str(comment["_id"]), {}).get("count", 0)
+            if comment.get("reply_count") != expected:
+                updates.append(UpdateOne(_guarded(comment, ("reply_count",)), {"$set": {"reply_count": expected}}))
+        if updates:
+            result = await db["comments"].bulk_write(updates, ordered=False)
+            repaired += result.modified_count
+
+async def reconcile(db: AsyncIOMotorDatabase, batch_size: int = COUNTER_RECONCILE_BATCH_SIZE) -> dict:
+    """Recount every counter from the source collections and fix the ones that drifted.
+
+    Also backfills documents written before the counters existed.
+    """
+    report = {
+        "movies": await reconcile_movies(db, batch_size),
+        "comments": await reconcile_replies(db, batch_size),
+    }
+    logger.info("Counter reconciliation repaired %s movies and %s comments", report["movies"], report["comments"])
+    return report
+
+async def run_reconciler(db: AsyncIOMotorDatabase, interval: Optional[float] = None):
+    """Reconcile at startup and then every `interval` seconds; runs as a background task."""
+    interval = COUNTER_RECONCILE_INTERVAL_SECONDS if interval is None else interval
+    await periodic.run_periodically(lambda: reconcile(db), interval, logger, "Counter reconciliation")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recount denormalized movie and comment counters")
+    parser.add_argument("--batch-size", type=int, default=COUNTER_RECONCILE_BATCH_SIZE)
+    parser.add_argument("--interval", type=float, default=0, help="Keep running, reconciling every INTERVAL seconds")
+    args = parser.parse_args(argv)
+    periodic.main(lambda db: reconcile(db, args.batch_size), args.interval, logger, "Counter reconciliation")
+
+if __name__ == "__main__":
+    main()
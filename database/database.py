@@ -1,33 +1,66 @@
-from motor.motor_asyncio import AsyncIOMotorClient
+from typing import Optional
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 from dotenv import load_dotenv
 import os
 import asyncio
+import metrics
 
 load_dotenv()
 
 # Load the MongoDB connection URL from the environment variable
 MONGO_DB_URL = os.getenv("MONGO_DB_URL")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "my_database")
 
-# Check if the MONGODB_URL is correctly loaded
-if not MONGO_DB_URL:
-    raise ValueError("MONGO_DB_URL environment variable not set")
+# Connection pool settings, sized per worker process
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "0")) or None
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "0")) or None
+# Comma separated, e.g. "zstd,snappy,zlib"
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "")
 
-# Create a Motor client
-client = AsyncIOMotorClient(MONGO_DB_URL)
+client: Optional[AsyncIOMotorClient] = None
 
-# Access a specific database
-database = client.get_database("my_database")  # Change to your database name
+def connect() -> AsyncIOMotorClient:
+    """Create the shared Motor client; every caller in the process reuses it."""
+    global client
+    if client is None:
+        # Check if the MONGODB_URL is correctly loaded
+        if not MONGO_DB_URL:
+            raise ValueError("MONGO_DB_URL environment variable not set")
+        options = {
+            "maxPoolSize": MONGO_MAX_POOL_SIZE,
+            "minPoolSize": MONGO_MIN_POOL_SIZE,
+            "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+            "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        }
+        if MONGO_COMPRESSORS:
+            options["compressors"] = MONGO_COMPRESSORS
+        client = AsyncIOMotorClient(
+            MONGO_DB_URL,
+            event_listeners=metrics.mongo_listeners(),
+            **{key: value for key, value in options.items() if value is not None}
+        )
+    return client
 
-# Access a specific collection
-my_collection = database.get_collection("my_collection")  # Change to your collection name
+async def warm_pool():
+    # Concurrent pings force the driver to open up to minPoolSize connections
+    # now rather than on the first requests
+    await asyncio.gather(*(connect().admin.command("ping") for _ in range(max(MONGO_MIN_POOL_SIZE, 1))))
 
-def get_db():
-    return database
+def close():
+    global client
+    if client is not None:
+        client.close()
+        client = None
+
+def get_db() -> AsyncIOMotorDatabase:
+    return connect().get_database(MONGO_DB_NAME)
 
 async def test_connection():
     try:
         # Perform a ping operation to confirm a successful connection
-        await client.admin.command('ping')
+        await connect().admin.command('ping')
         print("Pinged your deployment. You successfully connected to MongoDB!")
     except Exception as e:
         print("An error occurred:", e)
@@ -0,0 +1,199 @@
+import argparse
+import asyncio
+import logging
+import os
+from typing import Dict, List
+from pymongo import ASCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+from motor.motor_asyncio import AsyncIOMotorDatabase
+import rating_stats
+import comment_tree
+import title_index
+
+logger = logging.getLogger("indexes")
+
+# Run explain() on every registered query at startup and refuse to start if
+# any of them needs a collection scan
+VERIFY_QUERY_PLANS = os.getenv("VERIFY_QUERY_PLANS", "false").lower() in ("1", "true", "yes")
+
+# Declarative registry of every index the app relies on, synced at startup.
+# The movie listing indexes put equality filters first, then the sort key,
+# then `_id` as the tie-breaker, so a filtered page is a bounded index range
+# scan no matter how deep the cursor is.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "movies": [
+        IndexModel([("release_date", ASCENDING), ("_id", ASCENDING)], name="release_date_id"),
+        IndexModel([("genre", ASCENDING), ("_id", ASCENDING)], name="genre_id"),
+        IndexModel([("genre", ASCENDING), ("release_date", ASCENDING), ("_id", ASCENDING)], name="genre_release_date_id"),
+        IndexModel([("language", ASCENDING), ("_id", ASCENDING)], name="language_id"),
+        IndexModel([("language", ASCENDING), ("release_date", ASCENDING), ("_id", ASCENDING)], name="language_release_date_id"),
+        IndexModel([("director", ASCENDING), ("_id", ASCENDING)], name="director_id"),
+        IndexModel([("director", ASCENDING), ("release_date", ASCENDING), ("_id", ASCENDING)], name="director_release_date_id"),
+        IndexModel([("user_id", ASCENDING), ("_id", ASCENDING)], name="user_id_id"),
+        # Title prefix lookups while the in-memory title index is loading
+        IndexModel([("title_key", ASCENDING), ("_id", ASCENDING)], name="title_key_id"),
+        # Movies retitled since the last title index refresh
+        IndexModel([("title_updated_at", ASCENDING)], name="title_updated_at", sparse=True),
+        IndexModel(
+            [("title", TEXT), ("director", TEXT), ("synopsis", TEXT)],
+            weights={"title": 10, "director": 5, "synopsis": 1},
+            name="movie_text",
+        ),
+    ],
+    "comments": [
+        IndexModel([("movie_id", ASCENDING), ("parent_id", ASCENDING), ("_id", ASCENDING)], name="movie_id_parent_id_id"),
+        # Comment threads are fetched by movie or by subtree, in depth order
+        IndexModel([("movie_id", ASCENDING), ("depth", ASCENDING), ("_id", ASCENDING)], name="movie_id_depth_id"),
+        IndexModel([("ancestors", ASCENDING), ("depth", ASCENDING), ("_id", ASCENDING)], name="ancestors_depth_id"),
+        # Reply counts are recounted by parent in counters.reconcile_replies
+        IndexModel([("parent_id", ASCENDING)], name="parent_id"),
+    ],
+    "ratings": [
+        # Serves a movie's ratings and the min/max probes after a re-rating
+        IndexModel([("movie_id", ASCENDING), ("rating", ASCENDING)], name="movie_id_rating"),
+        # One rating per user and movie; also serves a user's ratings in movie_id order
+        IndexModel([("user_id", ASCENDING), ("movie_id", ASCENDING)], name="user_id_movie_id_unique", unique=True),
+        # Users who rated since the last neighbor list refresh
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+    ],
+    "users": [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+    ],
+}
+
+# One representative of every filter/sort shape the routers send, checked by
+# verify_query_plans(). The values are placeholders; only the plan matters.
+QUERY_SHAPES = [
+    ("get_movies", "movies", {}, [("_id", ASCENDING)]),
+    ("get_movies by release_date", "movies", {}, [("release_date", ASCENDING), ("_id", ASCENDING)]),
+    ("get_movies by genre", "movies", {"genre": "Drama"}, [("_id", ASCENDING)]),
+    ("get_movies by genre and release_date", "movies", {"genre": "Drama"}, [("release_date", ASCENDING), ("_id", ASCENDING)]),
+    ("get_movies by language", "movies", {"language": "English"}, [("_id", ASCENDING)]),
+    ("get_movies by director", "movies", {"director": "John Doe"}, [("_id", ASCENDING)]),
+    ("movies by owner", "movies", {"user_id": "1"}, [("_id", ASCENDING)]),
+    ("suggest_movies fallback", "movies", {"title_key": {"$gte": "the", "$lt": "thf"}}, [("title_key", ASCENDING), ("_id", ASCENDING)]),
+    ("title index refresh", "movies", {"$or": [{"_id": {"$gte": "0"}}, {"title_updated_at": {"$gte": 0}}]}, None),
+    ("get_comments", "comments", {"movie_id": "1", "parent_id": None}, None),
+    ("get_nested_comments", "comments", {"movie_id": "1", "parent_id": "1"}, None),
+    ("get_comment_tree", "comments", {"movie_id": "1"}, [("depth", ASCENDING), ("_id", ASCENDING)]),
+    ("get_comment_tree by root", "comments", {"ancestors": "1"}, [("depth", ASCENDING), ("_id", ASCENDING)]),
+    ("get_all_ratings", "ratings", {"movie_id": "1"}, None),
+    ("rate_movie", "ratings", {"user_id": "1", "movie_id": "1"}, None),
+    ("rating extremes", "ratings", {"movie_id": "1"}, [("rating", ASCENDING)]),
+    ("get_user_ratings", "ratings", {"user_id": "1"}, [("movie_id", ASCENDING)]),
+    ("recommendations refresh", "ratings", {"updated_at": {"$gte": 0}}, None),
+    ("login", "users", {"username": "user"}, None),
+]
+
+def _options(document: dict) -> dict:
+    return {"unique": bool(document.get("unique", False)), "weights": document.get("weights")}
+
+async def sync_indexes(db: AsyncIOMotorDatabase, drop_unmanaged: bool = False) -> dict:
+    """Create missing registry indexes and report any that have drifted.
+
+    Drift is an index whose keys or options differ from the registry, or an
+    index the registry does not know about. Drifted indexes are reported but
+    never rebuilt automatically; unmanaged ones are only dropped on request.
+    """
+    report = {"created": [], "drift": [], "dropped": [], "failed": []}
+    for collection, indexes in INDEXES.items():
+        existing = {info["name"]: info async for info in db[collection].list_indexes()}
+        for index in indexes:
+            expected = index.document
+            info = existing.pop(expected["name"], None)
+            if info is None:
+                try:
+                    await db[collection].create_indexes([index])
+                    report["created"].append(f"{collection}.{expected['name']}")
+                except OperationFailure as exc:
+                    # e.g. duplicate usernames or ratings already stored block a unique index
+                    report["failed"].append(f"{collection}.{expected['name']}: {exc}")
+                continue
+            # Text index keys are stored as _fts/_ftsx, so those compare by weights only
+            keys_match = "weights" in expected or dict(info["key"]) == dict(expected["key"])
+            if not keys_match or _options(info) != _options(expected):
+                report["drift"].append(f"{collection}.{expected['name']}: differs from registry")
+
+        for name in existing:
+            if name == "_id_":
+                continue
+            if drop_unmanaged:
+                await db[collection].drop_index(name)
+                report["dropped"].append(f"{collection}.{name}")
+            else:
+                report["drift"].append(f"{collection}.{name}: not in registry")
+
+    for entry in report["created"]:
+        logger.info("Created index %s", entry)
+    for entry in report["drift"]:
+        logger.warning("Index drift on %s", entry)
+    for entry in report["failed"]:
+        logger.error("Could not create index %s", entry)
+    return report
+
+def _plan_stages(plan: dict):
+    yield plan.get("stage")
+    for child in ("inputStage", "queryPlan"):
+        if child in plan:
+            yield from _plan_stages(plan[child])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+async def verify_query_plans(db: AsyncIOMotorDatabase) -> List[str]:
+    """Explain every registered query shape and return those that fall back to a COLLSCAN."""
+    failures = []
+    for name, collection, query, sort in QUERY_SHAPES:
+        command = {"find": collection, "filter": query}
+        if sort:
+            command["sort"] = dict(sort)
+        explanation = await db.command("explain", command, verbosity="queryPlanner")
+        if "COLLSCAN" in _plan_stages(explanation["queryPlanner"]["winningPlan"]):
+            failures.append(f"{name} ({collection} {query}) uses a COLLSCAN")
+    return failures
+
+def unique_failures(report: dict) -> List[str]:
+    """Failed index builds that the app relies on for correctness, e.g.
+    signup leaning on users.username to reject duplicate usernames."""
+    unique = {f"{collection}.{index.document['name']}" for collection, indexes in INDEXES.items() for index in indexes if index.document.get("unique")}
+    return [entry for entry in report["failed"] if entry.split(":", 1)[0] in unique]
+
+async def ensure_indexes(db: AsyncIOMotorDatabase):
+    report = await sync_indexes(db)
+    failures = unique_failures(report)
+    if failures:
+        raise RuntimeError(
+            "Unique indexes could not be built; remove the duplicates "
+            "(python -m database.indexes --dedupe-ratings for ratings) and restart: " + "; ".join(failures)
+        )
+    if VERIFY_QUERY_PLANS:
+        failures = await verify_query_plans(db)
+        if failures:
+            raise RuntimeError("Query plan verification failed: " + "; ".join(failures))
+        logger.info("All registered queries are served by indexes")
+
+async def main():
+    parser = argparse.ArgumentParser(description="Sync the index registry and check query plans")
+    parser.add_argument("--drop-unmanaged", action="store_true", help="Drop indexes that are not in the registry")
+    parser.add_argument("--verify", action="store_true", help="Exit non-zero if any registered query needs a COLLSCAN")
+    parser.add_argument("--dedupe-ratings", action="store_true", help="Keep only each user's latest rating per movie before syncing")
+    parser.add_argument("--backfill-comment-paths", action="store_true", help="Store ancestors/depth on comments written before they existed")
+    parser.add_argument("--backfill-title-keys", action="store_true", help="Store title_key on movies written before it existed")
+    args = parser.parse_args()
+
+    from database.database import get_db
+    db = get_db()
+    if args.dedupe_ratings:
+        print({"ratings_removed": await rating_stats.dedupe_ratings(db)})
+    if args.backfill_comment_paths:
+        print({"comment_paths_backfilled": await comment_tree.backfill_comment_paths(db)})
+    if args.backfill_title_keys:
+        print({"title_keys_backfilled": await title_index.backfill_title_keys(db)})
+    print(await sync_indexes(db, drop_unmanaged=args.drop_unmanaged))
+    if args.verify:
+        failures = await verify_query_plans(db)
+        for failure in failures:
+            print(failure)
+        raise SystemExit(1 if failures else 0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
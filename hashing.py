@@ -1,12 +1,102 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Tuple
+from dotenv import load_dotenv
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+load_dotenv()
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# "thread" works well because bcrypt releases the GIL; "process" isolates it fully
+HASH_POOL = os.getenv("HASH_POOL", "thread")
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hash jobs allowed to wait or run at once before new ones are rejected
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", "64"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+class HashQueueFull(RuntimeError):
+    pass
+
+# Module-level job functions so they can be pickled for a process pool
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+def _verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
 
 class Hash:
+    _executor: Optional[Executor] = None
+    _lock = threading.Lock()
+    _pending = 0
+    _metrics = {"submitted": 0, "completed": 0, "rejected": 0, "failed": 0, "seconds_total": 0.0}
+
     @staticmethod
     def bcrypt(password: str) -> str:
         return pwd_context.hash(password)
 
     @staticmethod
     def verify(hashed_password: str, plain_password: str) -> bool:
-        return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+        return pwd_context.verify(plain_password, hashed_password)
+
+    @classmethod
+    async def bcrypt_async(cls, password: str) -> str:
+        return await cls._submit(_hash, password)
+
+    @classmethod
+    async def verify_async(cls, hashed_password: str, plain_password: str) -> bool:
+        return await cls._submit(_verify, plain_password, hashed_password)
+
+    @classmethod
+    async def verify_and_update_async(cls, hashed_password: str, plain_password: str) -> Tuple[bool, Optional[str]]:
+        """Verify a password and return a replacement hash if its cost factor is outdated."""
+        return await cls._submit(_verify_and_update, plain_password, hashed_password)
+
+    @classmethod
+    def metrics(cls) -> dict:
+        with cls._lock:
+            return {**cls._metrics, "pending": cls._pending}
+
+    @classmethod
+    def shutdown(cls):
+        with cls._lock:
+            executor, cls._executor = cls._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    @classmethod
+    def _get_executor(cls) -> Executor:
+        with cls._lock:
+            if cls._executor is None:
+                pool = ProcessPoolExecutor if HASH_POOL == "process" else ThreadPoolExecutor
+                cls._executor = pool(max_workers=HASH_WORKERS)
+            return cls._executor
+
+    @classmethod
+    async def _submit(cls, func, *args):
+        with cls._lock:
+            if cls._pending >= HASH_MAX_PENDING:
+                cls._metrics["rejected"] += 1
+                raise HashQueueFull("Too many pending password hashing jobs")
+            cls._pending += 1
+            cls._metrics["submitted"] += 1
+        start = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(cls._get_executor(), func, *args)
+        except Exception:
+            with cls._lock:
+                cls._metrics["failed"] += 1
+            raise
+        finally:
+            with cls._lock:
+                cls._pending -= 1
+        with cls._lock:
+            cls._metrics["completed"] += 1
+            cls._metrics["seconds_total"] += time.perf_counter() - start
+        return result
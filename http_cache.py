@@ -0,0 +1,88 @@
+import hashlib
+import os
+from typing import Optional
+from fastapi import Request, Response
+from dotenv import load_dotenv
+from cache import TTLCache
+from repositories import VersionRepo
+
+load_dotenv()
+
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "0"))
+HTTP_CACHE_STALE_WHILE_REVALIDATE = int(os.getenv("HTTP_CACHE_STALE_WHILE_REVALIDATE", "0"))
+# How long a worker trusts its copy of a version counter. Bumps made by this
+# worker are seen immediately; bumps made by other workers within this delay.
+VERSION_CACHE_TTL_SECONDS = float(os.getenv("VERSION_CACHE_TTL_SECONDS", "1"))
+
+# Version counters live in the versions repository (the `versions` collection), keyed like
+# "movie:<id>", "movies", "ratings:<movie_id>", "user-ratings:<user_id>" or
+# "comments:<movie_id>".
+# Write endpoints bump every key whose representation they change.
+version_cache = TTLCache(maxsize=100000, ttl=VERSION_CACHE_TTL_SECONDS)
+
+def movie_key(movie_id: str) -> str:
+    return f"movie:{movie_id}"
+
+def ratings_key(movie_id: str) -> str:
+    return f"ratings:{movie_id}"
+
+def user_ratings_key(user_id: str) -> str:
+    return f"user-ratings:{user_id}"
+
+def comments_key(movie_id: str) -> str:
+    return f"comments:{movie_id}"
+
+MOVIES_KEY = "movies"
+
+async def current_version(versions: VersionRepo, key: str) -> int:
+    version = version_cache.get(key)
+    if version is None:
+        version = await versions.get(key)
+        version_cache.set(key, version)
+    return version
+
+async def bump(versions: VersionRepo, *keys: str):
+    """Bump version counters after a write; call only once the write succeeded."""
+    await versions.bump(keys)
+    for key in keys:
+        version_cache.delete(key)
+
+def make_etag(key: str, version: int, variant: str = "") -> str:
+    digest = hashlib.blake2b(f"{key}:{version}:{variant}".encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+def cache_headers(etag: str) -> dict:
+    cache_control = f"public, max-age={HTTP_CACHE_MAX_AGE}"
+    if HTTP_CACHE_STALE_WHILE_REVALIDATE:
+        cache_control += f", stale-while-revalidate={HTTP_CACHE_STALE_WHILE_REVALIDATE}"
+    return {"ETag": etag, "Cache-Control": cache_control}
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+async def conditional(request: Request, response: Response, versions: VersionRepo, key: str) -> Optional[Response]:
+    """Tag a public read with its ETag and Cache-Control headers.
+
+    Returns a 304 response when the client already holds the current
+    version, in which case the handler must return it without querying.
+    The query string is part of the tag, so every filter or page of a list
+    endpoint is cached separately.
+    """
+    etag = make_etag(key, await current_version(versions, key), request.url.query)
+    headers = cache_headers(etag)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+def cache_variant(response: Response) -> str:
+    """Response-cache variant for a read tagged by conditional().
+
+    The ETag names the key, its version and the query, so a cached body is
+    only ever served under the version it was loaded for, even on a worker
+    whose process-local invalidations missed a write.
+    """
+    return response.headers["etag"]
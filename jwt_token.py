@@ -16,6 +16,9 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
 
+# User fields copied into the token so stateless auth can skip the users lookup
+PROFILE_CLAIMS = ("username", "email", "firstName", "lastName")
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     if expires_delta:
@@ -32,7 +35,10 @@ def verify_token(token: str, credentials_exception: HTTPException):
         id: str = payload.get("sub")
         if id is None:
             raise credentials_exception
-        token_data = TokenData(id=id)
+        token_data = TokenData(
+            id=id,
+            **{claim: payload[claim] for claim in PROFILE_CLAIMS if claim in payload}
+        )
         return token_data
     except JWTError:
         raise credentials_exception
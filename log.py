@@ -1,13 +1,89 @@
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
-logger = logging.getLogger("movieListingApi")
-logger.setLevel(logging.DEBUG)
-file_handler = RotatingFileHandler("app.log", maxBytes=1024*1024, backupCount=5)
-file_handler.setLevel(logging.DEBUG)
+import os
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import orjson
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" for one structured record per line, "text" for the classic format
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Fraction of INFO and lower records kept per logger, e.g. "movies=0.1,comments=0.05"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+# Rotating log file; empty logs to the console only
+LOG_FILE = os.getenv("LOG_FILE", "app.log")
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS})
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode()
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of hot-path records; warnings and errors always pass."""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        rate = self.rates.get(record.name)
+        return rate is None or random.random() < rate
+
+class DeferredQueueHandler(QueueHandler):
+    # The stock prepare() formats the message on the calling thread. Handing the
+    # record over as-is moves all formatting to the listener thread; log calls
+    # pass lazy %-style args, which are not mutated after the call.
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+def parse_sample_rates(value: str) -> dict:
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 console_handler = logging.StreamHandler()
 console_handler.setLevel(logging.INFO)
-formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-file_handler.setFormatter(formatter)
 console_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
\ No newline at end of file
+handlers = [console_handler]
+if LOG_FILE:
+    file_handler = RotatingFileHandler(LOG_FILE, maxBytes=1024*1024, backupCount=5)
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(formatter)
+    handlers.append(file_handler)
+
+# Request handlers only enqueue records; a background thread does the I/O
+log_queue = queue.SimpleQueue()
+queue_handler = DeferredQueueHandler(log_queue)
+queue_handler.addFilter(SamplingFilter(parse_sample_rates(LOG_SAMPLE_RATES)))
+listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+# Attached to the root logger so the per-router loggers share the pipeline
+root_logger = logging.getLogger()
+root_logger.setLevel(LOG_LEVEL)
+root_logger.addHandler(queue_handler)
+
+logger = logging.getLogger("movieListingApi")
+
+listener.start()
+atexit.register(listener.stop)
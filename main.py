@@ -1,37 +1,72 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from pymongo import MongoClient
-from routers import auth, rating, movie, comments
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from routers import auth, rating, movie, comments, leaderboard, export, profiles, recommend
 from log import logger
+from database import database
+from database.indexes import ensure_indexes
+from hashing import Hash
+import title_index
+import metrics
+import profiling
+import counters
+import recommendations
 from dotenv import load_dotenv
-import os
+import asyncio
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI()
-
-
-MONGO_DB_URL = os.getenv("MONGO_DB_URL")
-client = MongoClient(MONGO_DB_URL)
-db = client["movie_database"]  
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("Application startup")
+    # One Motor client and pool per worker, shared by every router through get_db
+    app.state.mongo_client = database.connect()
+    app.state.db = database.get_db()
+    await database.warm_pool()
+    await ensure_indexes(app.state.db)
+    # Loaded in the background and then refreshed with new titles; /movies/suggest falls back to Mongo until it is ready
+    app.state.title_index_task = asyncio.create_task(title_index.run_refresher(app.state.db))
+    # Repairs counter drift and backfills counters on documents that predate them.
+    # Off by default: run one `python -m counters --interval N` job instead of a scan per worker
+    app.state.reconciler_task = None
+    if counters.COUNTER_RECONCILE_INTERVAL_SECONDS > 0:
+        app.state.reconciler_task = asyncio.create_task(counters.run_reconciler(app.state.db))
+    # Usually run as its own process with `python -m recommendations --interval N`
+    app.state.recommendations_task = None
+    if recommendations.RECOMMEND_REFRESH_INTERVAL_SECONDS > 0:
+        app.state.recommendations_task = asyncio.create_task(recommendations.run_refresher(app.state.db))
+    yield
+    logger.info("Application shutdown")
+    app.state.title_index_task.cancel()
+    if app.state.reconciler_task is not None:
+        app.state.reconciler_task.cancel()
+    if app.state.recommendations_task is not None:
+        app.state.recommendations_task.cancel()
+    Hash.shutdown()
+    database.close()
 
-app.state.db = db
+# Handlers that still return models are serialized with orjson too
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(profiling.ProfilingMiddleware)
 
 # Include routers
 app.include_router(auth.router)
 app.include_router(rating.router)
+# Registered before the movie router so /movies/top is not captured by /movies/{movie_id}
+app.include_router(leaderboard.router)
 app.include_router(movie.router)
 app.include_router(comments.router)
-
-@app.on_event("startup")
-async def startup_event():
-    logger.info("Application startup")
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    logger.info("Application shutdown")
+app.include_router(export.router)
+app.include_router(profiles.router)
+app.include_router(recommend.router)
 
 @app.get("/")
 def index():
     logger.info("Received request to root endpoint")
     return {"message": "Movie listing API"}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
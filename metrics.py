@@ -0,0 +1,198 @@
+import bisect
+import time
+from typing import Dict, Iterable, List, Sequence, Tuple
+from pymongo import monitoring
+from hashing import Hash
+
+# Metrics are updated from the event loop and from the driver's threads
+# without locks. Each update is a few bytecodes under the GIL; a rare lost
+# increment under thread contention is the accepted price for keeping the
+# hot path free of lock traffic.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in list(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+class Histogram:
+    """Histogram with fixed buckets; an observation is one bisect and two adds."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Per label set: [count per bucket..., count above the last bucket], sum
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series.setdefault(labels, [[0] * (len(self.buckets) + 1), 0.0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total) in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            cumulative += counts[-1]
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        yield f"{self.name} {self.callback()}"
+
+class CallbackCounter(Gauge):
+    """Counter whose running total is kept elsewhere and read at scrape time."""
+
+    type = "counter"
+
+class Registry:
+    def __init__(self):
+        self.metrics: List = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+http_requests_total = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route and status code.", ("method", "route", "status")))
+http_request_duration_seconds = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route")))
+mongodb_commands_total = registry.register(Counter(
+    "mongodb_commands_total", "MongoDB commands by collection, operation and outcome.", ("collection", "command", "outcome")))
+mongodb_command_duration_seconds = registry.register(Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command duration by collection and operation.", ("collection", "command")))
+mongodb_pool_wait_seconds = registry.register(Histogram(
+    "mongodb_pool_wait_seconds", "Time spent waiting to check a connection out of the pool."))
+registry.register(Gauge(
+    "password_hash_pending", "Password hashing jobs queued or running.", lambda: Hash.metrics()["pending"]))
+registry.register(CallbackCounter(
+    "password_hash_jobs_rejected_total", "Password hashing jobs rejected because the queue was full.", lambda: Hash.metrics()["rejected"]))
+
+class MetricsMiddleware:
+    """ASGI middleware recording request count, status and latency per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # FastAPI records the matched route on the scope; using its template
+            # rather than the raw path keeps label cardinality bounded
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            elapsed = time.perf_counter() - start
+            http_requests_total.inc(scope["method"], path, str(status_code))
+            http_request_duration_seconds.observe(elapsed, scope["method"], path)
+
+class CommandTimer(monitoring.CommandListener):
+    def __init__(self):
+        self._collections: Dict[Tuple[int, object], str] = {}
+
+    def started(self, event):
+        # getMore names a cursor id here and carries the collection separately
+        target = event.command.get("collection" if event.command_name == "getMore" else event.command_name)
+        collection = target if isinstance(target, str) else event.database_name
+        self._collections[(event.request_id, event.connection_id)] = collection
+
+    def _record(self, event, outcome: str):
+        collection = self._collections.pop((event.request_id, event.connection_id), "unknown")
+        mongodb_commands_total.inc(collection, event.command_name, outcome)
+        mongodb_command_duration_seconds.observe(event.duration_micros / 1e6, collection, event.command_name)
+
+    def succeeded(self, event):
+        self._record(event, "success")
+
+    def failed(self, event):
+        self._record(event, "failure")
+
+class PoolWaitTimer(monitoring.ConnectionPoolListener):
+    def connection_checked_out(self, event):
+        # `duration` covers the wait for a free connection (pymongo >= 4.7)
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            mongodb_pool_wait_seconds.observe(duration)
+
+    def connection_check_out_failed(self, event):
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            mongodb_pool_wait_seconds.observe(duration)
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_created(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): pass
+    def connection_check_out_started(self, event): pass
+    def connection_checked_in(self, event): pass
+
+def mongo_listeners() -> list:
+    return [CommandTimer(), PoolWaitTimer()]
@@ -44,8 +44,11 @@ class Movie(MongoModel):
     runtime: Optional[int]
     language: Optional[str]
     user_id: str  
-    ratings: Optional[List[str]] = []  
-    comments: Optional[List[str]] = [] 
+    # Denormalized counters, kept current by every rating/comment write
+    comment_count: int = 0
+    rating_count: int = 0
+    rating_sum: float = 0
+    last_activity_at: Optional[datetime] = None
 
 # Rating model
 class Rating(MongoModel):
@@ -59,4 +62,6 @@ class Comment(MongoModel):
     movie_id: str 
     user_id: str  
     parent_id: Optional[str] = None 
-    replies: Optional[List[str]] = []  
+    ancestors: List[str] = []
+    depth: int = 0
+    reply_count: int = 0  
@@ -0,0 +1,173 @@
+import argparse
+import asyncio
+import csv
+import io
+import json
+from typing import AsyncIterable, AsyncIterator, Iterable, List, Optional, Tuple, Union
+from pydantic import ValidationError
+from schemas import schemas
+from repositories import MovieRepo
+from title_index import title_index
+import counters
+
+DEFAULT_BATCH_SIZE = 1000
+# Per-row errors kept in a report; the failed count stays exact beyond this
+MAX_REPORTED_ERRORS = 1000
+
+# A decoded line, or the UnicodeDecodeError raised while decoding it
+Line = Union[str, UnicodeDecodeError]
+
+def decode_line(line: bytes) -> Line:
+    try:
+        return line.decode("utf-8").rstrip("\r")
+    except UnicodeDecodeError as exc:
+        return exc
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[Line]:
+    """Split a byte stream into lines without buffering the whole body.
+
+    Lines are decoded one at a time, so a bad byte fails only its own row.
+    """
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield decode_line(line)
+    if buffer:
+        yield decode_line(buffer)
+
+async def iter_records(lines: AsyncIterable[Line], fmt: str) -> AsyncIterator[Line]:
+    """Join the lines of a CSV record whose quoted fields contain newlines.
+
+    A record is complete once its quote characters balance; escaped quotes
+    ("") come in pairs and do not change the parity. NDJSON lines are
+    records as they are.
+    """
+    pending: List[str] = []
+    quotes = 0
+    async for line in lines:
+        if fmt != "csv":
+            yield line
+            continue
+        if isinstance(line, Exception):
+            # The undecodable line takes the record it belongs to with it
+            pending, quotes = [], 0
+            yield line
+            continue
+        pending.append(line)
+        quotes += line.count('"')
+        if quotes % 2 == 0:
+            yield "\n".join(pending)
+            pending, quotes = [], 0
+    if pending:
+        yield ValueError("Unterminated quoted field")
+
+async def iter_rows(lines: AsyncIterable[Line], fmt: str) -> AsyncIterator[Tuple[int, object]]:
+    """Yield (row number, raw row) pairs; CSV headers and blank lines are not rows.
+
+    A raw row is a dict, or the exception raised while decoding or parsing it.
+    """
+    header = None
+    row_number = 0
+    async for record in iter_records(lines, fmt):
+        if isinstance(record, Exception):
+            row = record
+        elif not record.strip():
+            continue
+        elif fmt == "csv":
+            values = next(csv.reader(io.StringIO(record)))
+            if header is None:
+                header = values
+                continue
+            # Empty CSV cells mean "not set", not the empty string
+            row = {key: value for key, value in zip(header, values) if value != ""}
+        else:
+            try:
+                row = json.loads(record)
+                if not isinstance(row, dict):
+                    raise ValueError("Expected a JSON object")
+            except ValueError as exc:
+                row = exc
+        yield row_number, row
+        row_number += 1
+
+def format_validation_error(exc: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in exc.errors())
+
+async def insert_batch(movies: MovieRepo, batch: List[Tuple[int, dict]], report: schemas.ImportReport):
+    documents = [document for _, document in batch]
+    inserted, failed = await movies.insert_many(documents)
+    report.inserted += inserted
+    for index, error in failed.items():
+        add_error(report, batch[index][0], error)
+    for index, document in enumerate(documents):
+        if index not in failed:
+            title_index.add(str(document["_id"]), document["title"])
+
+def add_error(report: schemas.ImportReport, row: int, error: str):
+    report.failed += 1
+    if len(report.errors) < MAX_REPORTED_ERRORS:
+        report.errors.append(schemas.ImportRowError(row=row, error=error))
+
+async def import_movies(
+    movies: MovieRepo,
+    rows: AsyncIterable[Tuple[int, object]],
+    user_id: str,
+    offset: int = 0,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> schemas.ImportReport:
+    """Validate and insert movie rows in unordered batches.
+
+    Rows before `offset` are skipped so an interrupted import can resume from
+    the `next_offset` of its last report. Invalid rows are reported and
+    skipped without aborting their batch.
+    """
+    report = schemas.ImportReport(next_offset=offset)
+    batch: List[Tuple[int, dict]] = []
+    async for row_number, row in rows:
+        if row_number < offset:
+            continue
+        report.next_offset = row_number + 1
+        if isinstance(row, Exception):
+            add_error(report, row_number, str(row))
+            continue
+        try:
+            movie = schemas.Movie(**row)
+        except ValidationError as exc:
+            add_error(report, row_number, format_validation_error(exc))
+            continue
+        document = movie.dict()
+        document["user_id"] = user_id
+        document.update(counters.new_movie_counters())
+        batch.append((row_number, document))
+        if len(batch) >= batch_size:
+            await insert_batch(movies, batch, report)
+            batch = []
+    if batch:
+        await insert_batch(movies, batch, report)
+    return report
+
+async def _lines_from_file(path: str) -> AsyncIterator[Line]:
+    with open(path, "rb") as handle:
+        for line in handle:
+            yield decode_line(line.rstrip(b"\n"))
+
+async def main(argv: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(description="Bulk import movies from an NDJSON or CSV file")
+    parser.add_argument("path")
+    parser.add_argument("--user-id", required=True, help="Id of the user the movies are listed under")
+    parser.add_argument("--format", choices=["ndjson", "csv"], help="Defaults to the file extension")
+    parser.add_argument("--offset", type=int, default=0, help="Row to resume from")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    from database.database import get_db
+    from repositories import motor_repositories
+    fmt = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    rows = iter_rows(_lines_from_file(args.path), fmt)
+    report = await import_movies(motor_repositories(get_db()).movies, rows, args.user_id, args.offset, args.batch_size)
+    print(report.json())
+
+if __name__ == "__main__":
+    asyncio.run(main())
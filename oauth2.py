@@ -1,16 +1,43 @@
 # oauth2.py
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-import database
 from schemas import schemas
 from jwt_token import verify_token
-from motor.motor_asyncio import AsyncIOMotorDatabase
-from bson import ObjectId
-from database.database import get_db
+from repositories import Repositories, get_repos
+from cache import TTLCache
+from dotenv import load_dotenv
+import os
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncIOMotorDatabase = Depends(database.database.get_db)) -> schemas.User:
+load_dotenv()
+
+# Trust the profile claims embedded in the token and skip the users lookup
+AUTH_STATELESS = os.getenv("AUTH_STATELESS", "false").lower() in ("1", "true", "yes")
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+
+def invalidate_user(user_id: str):
+    """Drop a cached user; call whenever a user document changes or is removed."""
+    user_cache.delete(str(user_id))
+
+def clear_user_cache():
+    user_cache.clear()
+
+def user_from_claims(token_data: schemas.TokenData) -> schemas.User:
+    # The password hash is never put in a token, so stateless users carry none
+    return schemas.User(
+        id=token_data.id,
+        username=token_data.username,
+        password="",
+        email=token_data.email,
+        firstName=token_data.firstName,
+        lastName=token_data.lastName,
+    )
+
+async def get_current_user(token: str = Depends(oauth2_scheme), repos: Repositories = Depends(get_repos)) -> schemas.User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -20,8 +47,14 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncIOMotor
     # Verify the token and extract token data
     token_data = verify_token(token, credentials_exception)
     
-    # Query MongoDB using Motor
-    user = await db["users"].find_one({"_id": ObjectId(token_data.id)})
+    if AUTH_STATELESS and token_data.username is not None:
+        return user_from_claims(token_data)
+    
+    cached_user = user_cache.get(token_data.id)
+    if cached_user is not None:
+        return cached_user
+    
+    user = await repos.users.get(token_data.id)
     
     if user is None:
         raise credentials_exception
@@ -33,4 +66,6 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncIOMotor
     }
     
     # Create a Pydantic model instance
-    return schemas.User(**user_data)
+    current_user = schemas.User(**user_data)
+    user_cache.set(token_data.id, current_user)
+    return current_user
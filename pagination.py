@@ -0,0 +1,51 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+from bson import ObjectId
+from bson.errors import InvalidId
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(document: dict, sort_field: str, descending: bool = False) -> str:
+    # The sort travels with the cursor so it cannot be replayed under another one
+    payload = {"id": str(document["_id"]), "s": sort_field, "d": descending}
+    if sort_field != "_id":
+        value = document.get(sort_field)
+        payload["v"] = value.isoformat() if isinstance(value, datetime) else value
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort_field: str, descending: bool = False) -> Tuple[Optional[object], ObjectId]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if payload["s"] != sort_field or payload["d"] != descending:
+            raise ValueError("Cursor was issued for another sort order")
+        last_id = ObjectId(payload["id"])
+        value = payload.get("v")
+        if sort_field == "release_date" and value is not None:
+            value = datetime.fromisoformat(value)
+    except (ValueError, KeyError, TypeError, InvalidId) as exc:
+        raise InvalidCursor("Invalid cursor") from exc
+    return value, last_id
+
+def keyset_filter(cursor: str, sort_field: str, descending: bool = False) -> dict:
+    """Build the filter selecting documents strictly after `cursor` in sort order.
+
+    Missing values sort before every other value, as they do in Mongo; since
+    $gt/$lt never match across types, null is handled with its own branches.
+    """
+    value, last_id = decode_cursor(cursor, sort_field, descending)
+    op = "$lt" if descending else "$gt"
+    if sort_field == "_id":
+        return {"_id": {op: last_id}}
+    ties = {sort_field: value, "_id": {op: last_id}}
+    if value is None:
+        # Ascending, every set value follows the nulls; descending, nothing but nulls does
+        return {"$or": [{sort_field: {"$ne": None}}, ties]} if not descending else ties
+    later = [{sort_field: {op: value}}, ties]
+    if descending:
+        later.append({sort_field: None})
+    return {"$or": later}
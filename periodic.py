@@ -0,0 +1,37 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+# Shared runner for the maintenance jobs (counter reconciling, neighbor list
+# and title index refreshes), both as in-app background tasks and as their
+# `python -m <job> --interval N` processes.
+
+async def run_periodically(job: Callable[[], Awaitable[Any]], interval: float, logger: logging.Logger, name: str):
+    """Run `job` now and then every `interval` seconds until cancelled; an
+    interval of 0 or less runs it once. Failed runs are logged, not raised."""
+    while True:
+        try:
+            await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("%s failed", name)
+        if interval <= 0:
+            return
+        await asyncio.sleep(interval)
+
+def main(job: Callable[[AsyncIOMotorDatabase], Awaitable[Any]], interval: float, logger: logging.Logger, name: str):
+    """Command line entry point: run `job` once and print its report, then
+    keep running it every `interval` seconds if that is positive. Only the
+    first run's failure ends the process."""
+
+    async def run():
+        from database.database import get_db
+        db = get_db()
+        print(await job(db))
+        if interval > 0:
+            await asyncio.sleep(interval)
+            await run_periodically(lambda: job(db), interval, logger, name)
+
+    asyncio.run(run())
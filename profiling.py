@@ -0,0 +1,150 @@
+import collections
+import itertools
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Fraction of requests whose profile is kept regardless of latency
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Keep the profile of every request slower than this; 0 disables the threshold
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+# Requests sending this header with the value of PROFILE_TOKEN are always kept.
+# The token also guards the admin endpoints that serve the profiles.
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "x-profile").lower().encode()
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "20"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# Samples retained for attribution; must cover the slowest request of interest
+PROFILE_HISTORY_SECONDS = float(os.getenv("PROFILE_HISTORY_SECONDS", "60"))
+
+PROFILING_ENABLED = PROFILE_SAMPLE_RATE > 0 or PROFILE_SLOW_MS > 0 or bool(PROFILE_TOKEN)
+
+# Frames executing here mean the loop is idle, i.e. awaiting I/O such as Mongo replies
+_IDLE_FUNCTIONS = {"select", "_run_once", "run_forever", "run_until_complete", "run", "poll"}
+_MAX_STACK_DEPTH = 64
+
+def _frame_label(code) -> str:
+    return f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}"
+
+def classify(stack: Tuple[str, ...], modules: Tuple[str, ...]) -> str:
+    if any("pydantic" in module for module in modules):
+        return "pydantic"
+    if not stack or stack[-1].rsplit(":", 1)[-1] in _IDLE_FUNCTIONS:
+        return "io_wait"
+    return "python"
+
+class StackSampler:
+    """Samples the event loop thread's Python stack at a fixed interval.
+
+    The samples overlapping a request are turned into its profile after the
+    request finished, which is what allows profiling requests that only turn
+    out to be slow. Samples are per thread, not per request, so concurrent
+    requests share them; profile under low concurrency for clean attribution.
+    """
+
+    def __init__(self, interval: float, history: float):
+        self.interval = interval
+        self.samples: Deque[Tuple[float, Tuple[str, ...], str]] = collections.deque(maxlen=max(int(history / interval), 1))
+        self._thread: Optional[threading.Thread] = None
+        self._target: Optional[int] = None
+
+    def ensure_started(self):
+        if self._thread is None:
+            self._target = threading.get_ident()
+            self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            labels, modules = [], []
+            while frame is not None and len(labels) < _MAX_STACK_DEPTH:
+                labels.append(_frame_label(frame.f_code))
+                modules.append(frame.f_code.co_filename)
+                frame = frame.f_back
+            labels.reverse()
+            stack = tuple(labels)
+            self.samples.append((time.perf_counter(), stack, classify(stack, tuple(modules))))
+
+    def window(self, start: float, end: float):
+        return [(stack, kind) for at, stack, kind in list(self.samples) if start <= at <= end]
+
+sampler = StackSampler(PROFILE_INTERVAL_MS / 1000, PROFILE_HISTORY_SECONDS)
+profiles: Deque[dict] = collections.deque(maxlen=PROFILE_BUFFER_SIZE)
+_profile_ids = itertools.count(1)
+
+def token_matches(value: Optional[str]) -> bool:
+    return bool(PROFILE_TOKEN) and value is not None and secrets.compare_digest(value, PROFILE_TOKEN)
+
+def record_profile(scope, status_code: int, start: float, end: float, reason: str):
+    stacks: Dict[str, int] = collections.Counter()
+    breakdown = {"python": 0, "pydantic": 0, "io_wait": 0}
+    for stack, kind in sampler.window(start, end):
+        stacks[";".join(stack)] += 1
+        breakdown[kind] += 1
+    route = scope.get("route")
+    profiles.append({
+        "id": next(_profile_ids),
+        "method": scope["method"],
+        "path": scope["path"],
+        "route": getattr(route, "path", None),
+        "status": status_code,
+        "reason": reason,
+        # Recorded after the response; step back by the duration to the start
+        "started_at": (datetime.now(timezone.utc) - timedelta(seconds=time.perf_counter() - start)).isoformat(),
+        "duration_ms": (end - start) * 1000,
+        "samples": sum(breakdown.values()),
+        "breakdown_ms": {kind: count * PROFILE_INTERVAL_MS for kind, count in breakdown.items()},
+        "stacks": stacks,
+    })
+
+def collapsed_stacks(profile: dict) -> str:
+    """Render a profile in the collapsed format read by flamegraph.pl and speedscope."""
+    return "".join(f"{stack} {count}\n" for stack, count in profile["stacks"].items())
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PROFILING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        sampler.ensure_started()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end = time.perf_counter()
+            # Decide after the fact; only kept requests pay for building a profile
+            reason = None
+            if PROFILE_SLOW_MS and (end - start) * 1000 >= PROFILE_SLOW_MS:
+                reason = "slow"
+            elif PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+                reason = "sampled"
+            else:
+                header = dict(scope["headers"]).get(PROFILE_HEADER)
+                if header is not None and token_matches(header.decode("latin-1")):
+                    reason = "header"
+            if reason is not None:
+                record_profile(scope, status_code, start, end, reason)
@@ -0,0 +1,147 @@
+from typing import Iterable, List, Optional
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from schemas import schemas
+
+# Ratings live on a 0-10 scale split into ten equal-width histogram buckets.
+RATING_MIN = 0.0
+RATING_MAX = 10.0
+HISTOGRAM_BUCKETS = 10
+
+def bucket_for(rating: float) -> int:
+    width = (RATING_MAX - RATING_MIN) / HISTOGRAM_BUCKETS
+    return min(int((rating - RATING_MIN) // width), HISTOGRAM_BUCKETS - 1)
+
+def stats_update(rating: float) -> dict:
+    """Atomic update folding one new rating into a `movie_stats` document."""
+    return {
+        "$inc": {"count": 1, "sum": rating, f"histogram.{bucket_for(rating)}": 1},
+        "$min": {"min": rating},
+        "$max": {"max": rating},
+    }
+
+def summary_from_stats(movie_id: str, stats: Optional[dict]) -> schemas.RatingSummary:
+    if not stats or not stats.get("count"):
+        return schemas.RatingSummary(movie_id=movie_id, histogram=[0] * HISTOGRAM_BUCKETS)
+    histogram = stats.get("histogram", {})
+    return schemas.RatingSummary(
+        movie_id=movie_id,
+        count=stats["count"],
+        sum=stats["sum"],
+        mean=stats["sum"] / stats["count"],
+        min=stats["min"],
+        max=stats["max"],
+        histogram=[histogram.get(str(i), 0) for i in range(HISTOGRAM_BUCKETS)],
+    )
+
+def stats_change(previous: float, rating: float) -> dict:
+    """Atomic update moving one existing rating from `previous` to `rating`."""
+    update = {"$inc": {"sum": rating - previous}, "$min": {"min": rating}, "$max": {"max": rating}}
+    old_bucket, new_bucket = bucket_for(previous), bucket_for(rating)
+    if old_bucket != new_bucket:
+        update["$inc"][f"histogram.{old_bucket}"] = -1
+        update["$inc"][f"histogram.{new_bucket}"] = 1
+    return update
+
+def stale_extremes(stats: Optional[dict], previous: float, rating: float) -> List[str]:
+    """The min/max fields a changed rating may have left stale; $min/$max
+    cannot raise a minimum or lower a maximum back."""
+    if not stats:
+        return []
+    stale = []
+    if previous == stats.get("min") and rating > previous:
+        stale.append("min")
+    if previous == stats.get("max") and rating < previous:
+        stale.append("max")
+    return stale
+
+async def record_rating(db: AsyncIOMotorDatabase, movie_id: str, rating: float, previous: Optional[float] = None):
+    if previous is None:
+        await db["movie_stats"].update_one({"_id": movie_id}, stats_update(rating), upsert=True)
+        return
+    stats = await db["movie_stats"].find_one_and_update(
+        {"_id": movie_id}, stats_change(previous, rating), return_document=ReturnDocument.AFTER
+    )
+    stale = stale_extremes(stats, previous, rating)
+    if not stale:
+        return
+    # One movie_id_rating index probe per stale side
+    extremes = {}
+    for field in stale:
+        direction = ASCENDING if field == "min" else DESCENDING
+        extreme = await db["ratings"].find({"movie_id": movie_id}, {"rating": 1}).sort("rating", direction).limit(1).to_list(length=1)
+        if extreme:
+            extremes[field] = extreme[0]["rating"]
+    # Guarded on the values read: a concurrent $min/$max already moved the
+    # bound past the stale value and wins
+    await db["movie_stats"].update_one(
+        {"_id": movie_id, **{field: stats[field] for field in extremes}}, {"$set": extremes}
+    )
+
+async def get_stats(db: AsyncIOMotorDatabase, movie_id: str) -> Optional[dict]:
+    return await db["movie_stats"].find_one({"_id": movie_id})
+
+async def get_stats_many(db: AsyncIOMotorDatabase, movie_ids: Iterable[str]) -> dict:
+    movie_ids = list(movie_ids)
+    stats = await db["movie_stats"].find({"_id": {"$in": movie_ids}}).to_list(length=len(movie_ids))
+    return {doc["_id"]: doc for doc in stats}
+
+def rating_fields(stats: Optional[dict]) -> dict:
+    """The optional `avg_rating`/`rating_count` fields of a MovieResponse."""
+    if not stats or not stats.get("count"):
+        return {"avg_rating": None, "rating_count": 0}
+    return {"avg_rating": stats["sum"] / stats["count"], "rating_count": stats["count"]}
+
+async def dedupe_ratings(db: AsyncIOMotorDatabase) -> int:
+    """Delete all but the latest rating of each user for each movie, so the
+    unique (user_id, movie_id) index can be built, and rebuild the affected stats.
+
+    Movie counters are repaired by the next counter reconciliation.
+    """
+    pipeline = [
+        {"$group": {"_id": {"user_id": "$user_id", "movie_id": "$movie_id"}, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    removed = 0
+    movie_ids = set()
+    async for row in db["ratings"].aggregate(pipeline, allowDiskUse=True):
+        # ObjectIds grow with insertion time, so the largest is the latest
+        stale = sorted(row["ids"])[:-1]
+        result = await db["ratings"].delete_many({"_id": {"$in": stale}})
+        removed += result.deleted_count
+        movie_ids.add(row["_id"]["movie_id"])
+    if movie_ids:
+        await rebuild_movie_stats(db, list(movie_ids))
+    return removed
+
+async def rebuild_movie_stats(db: AsyncIOMotorDatabase, movie_ids: Optional[List[str]] = None):
+    """Recompute `movie_stats` from the raw ratings, e.g. to backfill existing data."""
+    match = {"movie_id": {"$in": movie_ids}} if movie_ids is not None else {}
+    width = (RATING_MAX - RATING_MIN) / HISTOGRAM_BUCKETS
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "movie_id": "$movie_id",
+                "bucket": {"$min": [
+                    {"$floor": {"$divide": [{"$subtract": ["$rating", RATING_MIN]}, width]}},
+                    HISTOGRAM_BUCKETS - 1,
+                ]},
+            },
+            "count": {"$sum": 1},
+            "sum": {"$sum": "$rating"},
+            "min": {"$min": "$rating"},
+            "max": {"$max": "$rating"},
+        }},
+    ]
+    rebuilt = {}
+    async for row in db["ratings"].aggregate(pipeline):
+        movie_id = row["_id"]["movie_id"]
+        stats = rebuilt.setdefault(movie_id, {"count": 0, "sum": 0.0, "min": row["min"], "max": row["max"], "histogram": {}})
+        stats["count"] += row["count"]
+        stats["sum"] += row["sum"]
+        stats["min"] = min(stats["min"], row["min"])
+        stats["max"] = max(stats["max"], row["max"])
+        stats["histogram"][str(int(row["_id"]["bucket"]))] = row["count"]
+    for movie_id, stats in rebuilt.items():
+        await db["movie_stats"].replace_one({"_id": movie_id}, stats, upsert=True)
@@ -0,0 +1,245 @@
+import argparse
+import asyncio
+import heapq
+import logging
+import os
+from array import array
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from operator import itemgetter
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from scipy import sparse
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from dotenv import load_dotenv
+import periodic
+import rating_stats
+
+load_dotenv()
+
+logger = logging.getLogger("recommendations")
+
+# Item-item collaborative filtering. A periodic job loads the ratings into a
+# sparse user x movie matrix, computes each movie's most similar movies and
+# stores them in `movie_neighbors`, so /movies/{id}/similar is one lookup and
+# /user/{id}/recommendations is the user's ratings plus one $in lookup.
+# Similarities are sparse matrix products over blocks of movies, run in a
+# child process so the scoring never holds a serving event loop's GIL.
+
+RECOMMEND_NEIGHBORS = int(os.getenv("RECOMMEND_NEIGHBORS", "20"))
+# Pairs rated by fewer users than this are too noisy to call similar
+RECOMMEND_MIN_OVERLAP = int(os.getenv("RECOMMEND_MIN_OVERLAP", "2"))
+# How many of a user's ratings seed their recommendations
+RECOMMEND_MAX_USER_RATINGS = int(os.getenv("RECOMMEND_MAX_USER_RATINGS", "500"))
+# In-app refresh interval; 0 leaves refreshing to `python -m recommendations`
+RECOMMEND_REFRESH_INTERVAL_SECONDS = float(os.getenv("RECOMMEND_REFRESH_INTERVAL_SECONDS", "0"))
+# Movies are scored in blocks whose dense movie x block score matrices hold at
+# most this many cells (8 bytes each, a few such matrices at a time)
+RECOMMEND_BLOCK_CELLS = int(os.getenv("RECOMMEND_BLOCK_CELLS", "4000000"))
+
+STATE_ID = "movie_neighbors"
+
+class RatingMatrix:
+    """Sparse user x movie ratings.
+
+    Add ratings, then `compress()` them into scipy matrices: by user (CSR)
+    and by movie (CSC), centred on each user's mean (adjusted cosine) so a
+    movie rated below a user's usual counts against similarity, plus the
+    0/1 pattern of who rated what for counting overlaps. More ratings can be
+    added to a merged or compressed matrix; a rating for a (user, movie) it
+    already holds replaces the old one.
+    """
+
+    def __init__(self):
+        self.user_index: Dict[str, int] = {}
+        self.movie_index: Dict[str, int] = {}
+        self.movie_ids: List[str] = []
+        self.users = np.empty(0, dtype=np.int64)
+        self.movies = np.empty(0, dtype=np.int64)
+        self.ratings = np.empty(0, dtype=np.float64)
+        # Added since the last merge
+        self._users = array("q")
+        self._movies = array("q")
+        self._values = array("d")
+        # Start of the load that last added ratings, see load_matrix
+        self.loaded_at: Optional[datetime] = None
+
+    def add(self, user_id: str, movie_id: str, rating: float):
+        user = self.user_index.setdefault(user_id, len(self.user_index))
+        movie = self.movie_index.get(movie_id)
+        if movie is None:
+            movie = self.movie_index[movie_id] = len(self.movie_ids)
+            self.movie_ids.append(movie_id)
+        self._users.append(user)
+        self._movies.append(movie)
+        self._values.append(rating)
+
+    def merge(self) -> "RatingMatrix":
+        """Fold the added ratings into the user/movie/rating arrays."""
+        if not self._values:
+            return self
+        users = np.concatenate([self.users, np.frombuffer(self._users, dtype=np.int64)])
+        movies = np.concatenate([self.movies, np.frombuffer(self._movies, dtype=np.int64)])
+        ratings = np.concatenate([self.ratings, np.frombuffer(self._values, dtype=np.float64)])
+        self._users, self._movies, self._values = array("q"), array("q"), array("d")
+        # Keep the last rating added for each (user, movie)
+        keys = users * len(self.movie_ids) + movies
+        _, last = np.unique(keys[::-1], return_index=True)
+        keep = len(keys) - 1 - last
+        self.users, self.movies, self.ratings = users[keep], movies[keep], ratings[keep]
+        return self
+
+    def compress(self) -> "RatingMatrix":
+        self.merge()
+        shape = (len(self.user_index), len(self.movie_ids))
+        means = np.bincount(self.users, weights=self.ratings, minlength=shape[0]) / np.bincount(self.users, minlength=shape[0])
+        centred = self.ratings - means[self.users]
+        self.by_user = sparse.csr_matrix((centred, (self.users, self.movies)), shape=shape)
+        self.by_movie = self.by_user.tocsc()
+        # Centred values can be 0, so overlaps and co-raters come from the pattern
+        self.rated_by_user = sparse.csr_matrix((np.ones(len(self.users)), (self.users, self.movies)), shape=shape)
+        self.rated_by_movie = self.rated_by_user.tocsc()
+        self.norms = np.sqrt(np.asarray(self.by_movie.power(2).sum(axis=0)).ravel())
+        return self
+
+    def co_rated(self, movies: np.ndarray) -> np.ndarray:
+        """`movies` and every movie sharing at least one rater with one of them."""
+        raters = np.unique(self.rated_by_movie[:, movies].indices)
+        return np.unique(self.rated_by_user[raters].indices)
+
+    def neighbors(self, movies: np.ndarray, k: int = RECOMMEND_NEIGHBORS, min_overlap: int = RECOMMEND_MIN_OVERLAP) -> List[List[dict]]:
+        """For each of `movies`, the `k` most similar movies with a positive adjusted cosine."""
+        block = max(1, RECOMMEND_BLOCK_CELLS // max(len(self.movie_ids), 1))
+        lists = []
+        for start in range(0, len(movies), block):
+            lists.extend(self._neighbors_block(movies[start:start + block], k, min_overlap))
+        return lists
+
+    def _neighbors_block(self, movies: np.ndarray, k: int, min_overlap: int) -> List[List[dict]]:
+        # One column per movie in the block, one row per candidate neighbor
+        columns = np.arange(len(movies))
+        dots = (self.by_movie.T @ self.by_movie[:, movies]).toarray()
+        overlap = (self.rated_by_movie.T @ self.rated_by_movie[:, movies]).toarray()
+        dots[movies, columns] = 0
+        # A positive dot means both norms are positive, so masked cells are the only 0/0s
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = np.where((dots > 0) & (overlap >= min_overlap), dots / np.outer(self.norms, self.norms[movies]), -np.inf)
+        k = min(k, len(self.movie_ids))
+        if k <= 0:
+            return [[] for _ in movies]
+        top = np.argpartition(-scores, k - 1, axis=0)[:k]
+        top = np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=0), axis=0, kind="stable"), axis=0)
+        return [
+            [{"movie_id": self.movie_ids[other], "score": float(scores[other, column])} for other in top[:, column] if scores[other, column] > -np.inf]
+            for column in columns
+        ]
+
+def neighbor_lists(matrix: RatingMatrix, users: Optional[Iterable[str]] = None, k: int = RECOMMEND_NEIGHBORS, min_overlap: int = RECOMMEND_MIN_OVERLAP) -> Dict[str, List[dict]]:
+    """Neighbor lists of every movie, or of the movies whose lists a change
+    to the ratings of `users` can move.
+
+    A new or changed rating shifts the user's mean, and with it the centred
+    value of every movie they rated. That changes those movies' norms and
+    their dot products with everything they share a rater with, so the
+    lists to redo are those of the user's movies and of the movies
+    co-rated with any of them.
+    """
+    if users is None:
+        movies = np.arange(len(matrix.movie_ids))
+    else:
+        rows = [matrix.user_index[user_id] for user_id in users if user_id in matrix.user_index]
+        movies = matrix.co_rated(np.unique(matrix.rated_by_user[rows].indices))
+    return {matrix.movie_ids[movie]: neighbors for movie, neighbors in zip(movies, matrix.neighbors(movies, k, min_overlap))}
+
+def recommend(ratings: List[dict], neighbors: Dict[str, List[dict]], limit: int) -> List[dict]:
+    """Predict ratings for movies near the ones the user rated, best first.
+
+    A candidate's score is the user's mean plus the similarity weighted
+    average of how far their ratings of its neighbors sit from that mean.
+    """
+    rated = {rating["movie_id"]: rating["rating"] for rating in ratings}
+    if not rated:
+        return []
+    mean = sum(rated.values()) / len(rated)
+    totals: Dict[str, float] = defaultdict(float)
+    weights: Dict[str, float] = defaultdict(float)
+    for movie_id, rating in rated.items():
+        for neighbor in neighbors.get(movie_id, []):
+            candidate = neighbor["movie_id"]
+            if candidate in rated:
+                continue
+            totals[candidate] += neighbor["score"] * (rating - mean)
+            weights[candidate] += neighbor["score"]
+    scores = (
+        (candidate, min(max(mean + totals[candidate] / weight, rating_stats.RATING_MIN), rating_stats.RATING_MAX))
+        for candidate, weight in weights.items()
+    )
+    return [{"movie_id": candidate, "score": score} for candidate, score in heapq.nlargest(limit, scores, key=itemgetter(1))]
+
+async def load_matrix(db: AsyncIOMotorDatabase, matrix: Optional[RatingMatrix] = None, batch_size: int = 10000) -> RatingMatrix:
+    """Add the ratings set since `matrix` was last loaded, or every rating to
+    a new matrix. The result is merged but not compressed; `compute_lists`
+    compresses it."""
+    matrix = RatingMatrix() if matrix is None else matrix
+    started = datetime.now(timezone.utc)
+    query = {} if matrix.loaded_at is None else {"updated_at": {"$gte": matrix.loaded_at}}
+    async for rating in db["ratings"].find(query, {"_id": 0, "user_id": 1, "movie_id": 1, "rating": 1}).batch_size(batch_size):
+        matrix.add(rating["user_id"], rating["movie_id"], rating["rating"])
+    # Ratings set while this ran are at or after `started` and go into the next load
+    matrix.loaded_at = started
+    return matrix.merge()
+
+# Module-level job function so it can be pickled for the process pool
+def compute_lists(matrix: RatingMatrix, users: Optional[List[str]] = None) -> Dict[str, List[dict]]:
+    return neighbor_lists(matrix.compress(), users)
+
+async def refresh(db: AsyncIOMotorDatabase, full: bool = False, matrix: Optional[RatingMatrix] = None) -> dict:
+    """Recompute the neighbor lists that ratings written since the last
+    refresh can change, or every list on the first run and when `full` is set.
+
+    Each user's mean depends on all their ratings, so scoring needs the
+    whole matrix. A `matrix` kept from an earlier run only reads the ratings
+    set since; without one, every run loads the whole collection. Only the
+    scoring and the writes are limited to the affected movies.
+    """
+    from repositories.mongo import MotorNeighborRepo
+
+    started = datetime.now(timezone.utc)
+    state = await db["job_state"].find_one({"_id": STATE_ID})
+    users = None
+    if not full and state is not None:
+        users = await db["ratings"].distinct("user_id", {"updated_at": {"$gte": state["refreshed_at"]}})
+    report = {"full": users is None, "users": len(users) if users is not None else None, "movies": 0}
+    if users is None or users:
+        matrix = await load_matrix(db, matrix)
+        pool = ProcessPoolExecutor(max_workers=1)
+        try:
+            lists = await asyncio.get_running_loop().run_in_executor(pool, compute_lists, matrix, users)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+        await MotorNeighborRepo(db).replace(lists)
+        report["movies"] = len(lists)
+    # Ratings written while this ran are at or after `started` and go into the next run
+    await db["job_state"].update_one({"_id": STATE_ID}, {"$set": {"refreshed_at": started}}, upsert=True)
+    logger.info("Recomputed neighbor lists for %s movies", report["movies"])
+    return report
+
+async def run_refresher(db: AsyncIOMotorDatabase, interval: Optional[float] = None):
+    """Refresh at startup and then every `interval` seconds, keeping the
+    ratings matrix between runs; runs as a background task."""
+    interval = RECOMMEND_REFRESH_INTERVAL_SECONDS if interval is None else interval
+    matrix = RatingMatrix()
+    await periodic.run_periodically(lambda: refresh(db, matrix=matrix), interval, logger, "Neighbor list refresh")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute the movie neighbor lists behind recommendations")
+    parser.add_argument("--full", action="store_true", help="Recompute every movie, not just those affected by ratings since the last run")
+    parser.add_argument("--interval", type=float, default=0, help="Keep running, refreshing every INTERVAL seconds")
+    args = parser.parse_args(argv)
+    matrix = RatingMatrix()
+    # --full applies to the first run; later ones redo only what changed
+    periodic.main(lambda db: refresh(db, args.full and matrix.loaded_at is None, matrix), args.interval, logger, "Neighbor list refresh")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+from repositories.base import (
+    CommentRepo,
+    DuplicateKey,
+    IdRange,
+    LeaderboardRepo,
+    MovieRepo,
+    NeighborRepo,
+    RatingRepo,
+    Repositories,
+    UserRepo,
+    VersionRepo,
+)
+from repositories.memory import memory_repositories
+from repositories.mongo import motor_repositories
+
+def get_repos() -> Repositories:
+    """FastAPI dependency for data access.
+
+    Override it with a shared memory_repositories() instance, e.g. through
+    app.dependency_overrides, to run the app without MongoDB.
+    """
+    from database.database import get_db
+    return motor_repositories(get_db())
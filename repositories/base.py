@@ -0,0 +1,112 @@
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Protocol, Sequence, Tuple
+from bson import ObjectId
+
+# Repositories hand out documents shaped exactly like the Mongo documents they
+# mirror (`_id` as an ObjectId, other fields as stored). `fields` selects a
+# projection; None means the whole document. Ids are accepted as strings and
+# malformed ones simply match nothing.
+
+Fields = Optional[Sequence[str]]
+# `_id` bounds for scans, e.g. {"$gte": ObjectId.from_datetime(since), "$gt": last_id}
+IdRange = Dict[str, ObjectId]
+
+class DuplicateKey(Exception):
+    """A write violated a unique index."""
+
+class MovieRepo(Protocol):
+    async def insert(self, movie: dict) -> str:
+        """Store a movie with zeroed counters; like insert_one, sets `_id` and the counters on the given dict."""
+    async def insert_many(self, movies: List[dict]) -> Tuple[int, Dict[int, str]]:
+        """Unordered insert of complete movie documents, setting `_id` on each.
+        Returns how many were stored and the error of each position that was not."""
+    async def get(self, movie_id: str, fields: Fields = None) -> Optional[dict]: ...
+    async def get_many(self, movie_ids: Sequence[str], fields: Fields = None) -> List[dict]: ...
+    async def exists(self, movie_id: str) -> bool: ...
+    async def list(
+        self,
+        filters: Dict[str, Any],
+        released_from: Any = None,
+        released_to: Any = None,
+        sort: str = "_id",
+        descending: bool = False,
+        cursor: Optional[str] = None,
+        limit: int = 20,
+        fields: Fields = None
+    ) -> List[dict]:
+        """Keyset page of movies matching `filters` exactly; raises InvalidCursor."""
+    async def search(self, text: str, limit: int, fields: Fields = None) -> List[dict]: ...
+    async def titles_with_prefix(self, prefix: str, limit: int) -> List[dict]:
+        """Movies whose normalized title starts with `prefix`, in title order."""
+    async def update_owned(self, movie_id: str, user_id: str, changes: dict) -> Optional[dict]:
+        """Apply `changes` if `user_id` owns the movie; returns the updated movie."""
+    async def delete_owned(self, movie_id: str, user_id: str) -> bool: ...
+    def scan(self, id_range: IdRange, batch_size: int = 1000) -> AsyncIterator[dict]:
+        """Every movie within `id_range`, in `_id` order."""
+
+class RatingRepo(Protocol):
+    async def upsert(self, rating: dict) -> Optional[float]:
+        """Store the user's rating of a movie, replacing any earlier one, and fold
+        the change into the movie's stats and counters. Returns the previous rating."""
+    async def list_for_movie(self, movie_id: str, fields: Fields = None, limit: int = 100) -> List[dict]: ...
+    async def list_for_user(self, user_id: str, fields: Fields = None, after: Optional[str] = None, limit: int = 100) -> List[dict]:
+        """The user's ratings ordered by movie_id, starting after the `after` movie id."""
+    async def stats(self, movie_id: str) -> Optional[dict]: ...
+    async def stats_many(self, movie_ids: Iterable[str]) -> Dict[str, dict]: ...
+    async def delete_stats(self, movie_id: str): ...
+    def scan(self, id_range: IdRange, batch_size: int = 1000, updated_since: Optional[datetime] = None) -> AsyncIterator[dict]:
+        """Ratings within `id_range` in `_id` order; `updated_since` keeps those set at or after it."""
+
+class CommentRepo(Protocol):
+    async def insert(self, comment: dict) -> str:
+        """Store a comment and bump the movie's comment_count and the parent's reply_count."""
+    async def get(self, movie_id: str, comment_id: str, fields: Fields = None) -> Optional[dict]: ...
+    async def children(self, movie_id: str, parent_id: Optional[str], fields: Fields = None, limit: int = 100) -> List[dict]: ...
+    async def thread(self, movie_id: str, root_id: Optional[str] = None, max_depth: Optional[int] = None, limit: int = 500) -> List[dict]:
+        """A movie's comments, or the replies below `root_id`, parents before replies."""
+    def scan(self, id_range: IdRange, batch_size: int = 1000) -> AsyncIterator[dict]: ...
+
+class UserRepo(Protocol):
+    async def insert(self, user: dict) -> str:
+        """Store a user; raises DuplicateKey when the username is taken."""
+    async def get(self, user_id: str) -> Optional[dict]: ...
+    async def get_by_username(self, username: str) -> Optional[dict]: ...
+    async def set_password(self, user_id: str, password_hash: str): ...
+
+class VersionRepo(Protocol):
+    """Version counters behind the HTTP cache's ETags."""
+    async def get(self, key: str) -> int: ...
+    async def bump(self, keys: Sequence[str]): ...
+
+class NeighborRepo(Protocol):
+    """Precomputed similar-movie lists of {movie_id, score}, best first."""
+    async def get(self, movie_id: str) -> List[dict]: ...
+    async def get_many(self, movie_ids: Iterable[str]) -> Dict[str, List[dict]]: ...
+    async def replace(self, lists: Dict[str, List[dict]]): ...
+    async def delete(self, movie_id: str): ...
+
+class LeaderboardRepo(Protocol):
+    """Ranked rows of {_id: movie_id, score, rating_count, rating_sum[, comment_count]}, best first."""
+    async def top_rated(self, limit: int, prior_weight: float) -> List[dict]:
+        """Bayesian average: every movie starts with `prior_weight` votes at the global mean."""
+    async def trending(self, since: datetime, limit: int, comment_weight: float) -> List[dict]:
+        """Rating points (scaled to 0-1 each) plus `comment_weight` per comment since `since`."""
+
+class Repositories:
+    def __init__(
+        self,
+        movies: MovieRepo,
+        ratings: RatingRepo,
+        comments: CommentRepo,
+        users: UserRepo,
+        versions: VersionRepo,
+        neighbors: NeighborRepo,
+        leaderboards: LeaderboardRepo
+    ):
+        self.movies = movies
+        self.ratings = ratings
+        self.comments = comments
+        self.users = users
+        self.versions = versions
+        self.neighbors = neighbors
+        self.leaderboards = leaderboards
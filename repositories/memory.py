@@ -0,0 +1,392 @@
+import operator
+import re
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from bson import ObjectId
+from bson.errors import InvalidId
+from pagination import decode_cursor
+import rating_stats
+import counters
+from title_index import normalize, title_fields
+from repositories.base import DuplicateKey, Fields, IdRange, Repositories
+
+# Dict-backed repositories mirroring the Motor ones, including the secondary
+# indexes the real collections have, so handlers, tests and load benchmarks
+# can run without a database. Stored documents are never handed out directly;
+# callers get copies, as they would from the driver.
+
+# Same weights as the movie_text index
+SEARCH_WEIGHTS = {"title": 10, "director": 5, "synopsis": 1}
+_WORD = re.compile(r"\w+")
+
+def object_id(value: str) -> Optional[ObjectId]:
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return None
+
+def project(document: dict, fields: Fields) -> dict:
+    if fields is None:
+        return dict(document)
+    return {key: document[key] for key in ("_id", *fields) if key in document}
+
+_RANGE_OPERATORS = {"$gt": operator.gt, "$gte": operator.ge, "$lt": operator.lt, "$lte": operator.le}
+
+async def scan(documents: Iterable[dict], id_range: IdRange) -> AsyncIterator[dict]:
+    matching = [
+        document for document in documents
+        if all(_RANGE_OPERATORS[op](document["_id"], bound) for op, bound in id_range.items())
+    ]
+    for document in sorted(matching, key=lambda document: document["_id"]):
+        yield dict(document)
+
+def _updated_at(rating: dict) -> datetime:
+    # Ratings written before updated_at existed were last set when created
+    return rating.get("updated_at", rating["_id"].generation_time)
+
+def _sort_key(document: dict, sort: str) -> tuple:
+    if sort == "_id":
+        return (document["_id"],)
+    # Mongo orders missing values before any date
+    value = document.get(sort)
+    return (value is not None, value, document["_id"])
+
+class MemoryMovieRepo:
+    INDEXED_FIELDS = ("genre", "language", "director", "user_id")
+
+    def __init__(self):
+        self.documents: Dict[ObjectId, dict] = {}
+        self.indexes: Dict[str, Dict[Any, Set[ObjectId]]] = {field: defaultdict(set) for field in self.INDEXED_FIELDS}
+
+    def _index(self, document: dict):
+        for field, index in self.indexes.items():
+            index[document.get(field)].add(document["_id"])
+
+    def _unindex(self, document: dict):
+        for field, index in self.indexes.items():
+            index[document.get(field)].discard(document["_id"])
+
+    async def insert(self, movie: dict) -> str:
+        movie.setdefault("_id", ObjectId())
+        for field, value in counters.new_movie_counters().items():
+            movie.setdefault(field, value)
+        movie.update(title_fields(movie["title"]))
+        self.documents[movie["_id"]] = dict(movie)
+        self._index(movie)
+        return str(movie["_id"])
+
+    async def insert_many(self, movies: List[dict]) -> Tuple[int, Dict[int, str]]:
+        for movie in movies:
+            await self.insert(movie)
+        return len(movies), {}
+
+    async def get(self, movie_id: str, fields: Fields = None) -> Optional[dict]:
+        document = self.documents.get(object_id(movie_id))
+        return project(document, fields) if document is not None else None
+
+    async def get_many(self, movie_ids: Sequence[str], fields: Fields = None) -> List[dict]:
+        ids = dict.fromkeys(oid for oid in map(object_id, movie_ids) if oid in self.documents)
+        return [project(self.documents[oid], fields) for oid in ids]
+
+    async def exists(self, movie_id: str) -> bool:
+        return object_id(movie_id) in self.documents
+
+    async def list(
+        self,
+        filters: Dict[str, Any],
+        released_from: Any = None,
+        released_to: Any = None,
+        sort: str = "_id",
+        descending: bool = False,
+        cursor: Optional[str] = None,
+        limit: int = 20,
+        fields: Fields = None
+    ) -> List[dict]:
+        candidates: Optional[Set[ObjectId]] = None
+        for field, value in filters.items():
+            if field in self.indexes:
+                matches = self.indexes[field].get(value, set())
+                candidates = set(matches) if candidates is None else candidates & matches
+        documents = (self.documents[oid] for oid in candidates) if candidates is not None else self.documents.values()
+        documents = [
+            document for document in documents
+            if all(document.get(field) == value for field, value in filters.items())
+            and (released_from is None or (document.get("release_date") is not None and document["release_date"] >= released_from))
+            and (released_to is None or (document.get("release_date") is not None and document["release_date"] <= released_to))
+        ]
+        if cursor:
+            value, last_id = decode_cursor(cursor, sort, descending)
+            after = (last_id,) if sort == "_id" else (value is not None, value, last_id)
+            if descending:
+                documents = [document for document in documents if _sort_key(document, sort) < after]
+            else:
+                documents = [document for document in documents if _sort_key(document, sort) > after]
+        documents.sort(key=lambda document: _sort_key(document, sort), reverse=descending)
+        spec = tuple(fields) + ((sort,) if sort != "_id" else ()) if fields is not None else None
+        return [project(document, spec) for document in documents[:limit]]
+
+    async def search(self, text: str, limit: int, fields: Fields = None) -> List[dict]:
+        # Word matching with the text index weights; no stemming or stop words
+        terms = set(_WORD.findall(text.lower()))
+        scored = []
+        for document in self.documents.values():
+            score = sum(
+                weight * sum(1 for word in _WORD.findall(str(document.get(field) or "").lower()) if word in terms)
+                for field, weight in SEARCH_WEIGHTS.items()
+            )
+            if score:
+                scored.append((score, document))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [project(document, fields) for _, document in scored[:limit]]
+
+    async def titles_with_prefix(self, prefix: str, limit: int) -> List[dict]:
+        prefix = normalize(prefix)
+        matches = [document for document in self.documents.values() if document.get("title_key", "").startswith(prefix)]
+        matches.sort(key=lambda document: (document["title_key"], document["_id"]))
+        return [project(document, ("title",)) for document in matches[:limit]]
+
+    async def update_owned(self, movie_id: str, user_id: str, changes: dict) -> Optional[dict]:
+        document = self.documents.get(object_id(movie_id))
+        if document is None or document.get("user_id") != user_id:
+            return None
+        if "title" in changes:
+            changes = {**changes, **title_fields(changes["title"], counters.now())}
+        self._unindex(document)
+        document.update(changes)
+        self._index(document)
+        return dict(document)
+
+    async def delete_owned(self, movie_id: str, user_id: str) -> bool:
+        document = self.documents.get(object_id(movie_id))
+        if document is None or document.get("user_id") != user_id:
+            return False
+        self._unindex(document)
+        del self.documents[document["_id"]]
+        return True
+
+    def scan(self, id_range: IdRange, batch_size: int = 1000) -> AsyncIterator[dict]:
+        return scan(self.documents.values(), id_range)
+
+def _apply(document: Optional[dict], update: dict):
+    # The $inc/$max subset the counter updates use
+    if document is None:
+        return
+    for field, amount in update.get("$inc", {}).items():
+        document[field] = (document.get(field) or 0) + amount
+    for field, value in update.get("$max", {}).items():
+        if document.get(field) is None or value > document[field]:
+            document[field] = value
+
+class MemoryRatingRepo:
+    def __init__(self, movies: MemoryMovieRepo):
+        self.movies = movies
+        # One rating per (movie_id, user_id), reachable from either side
+        self.by_movie: Dict[str, Dict[str, dict]] = defaultdict(dict)
+        self.by_user: Dict[str, Dict[str, dict]] = defaultdict(dict)
+        self.movie_stats: Dict[str, dict] = {}
+
+    async def upsert(self, rating: dict) -> Optional[float]:
+        movie_id, user_id, value = rating["movie_id"], rating["user_id"], rating["rating"]
+        document = self.by_movie[movie_id].get(user_id)
+        previous = document["rating"] if document is not None else None
+        if document is None:
+            document = {"_id": ObjectId(), "movie_id": movie_id, "user_id": user_id}
+            self.by_movie[movie_id][user_id] = document
+            self.by_user[user_id][movie_id] = document
+        document["rating"] = value
+        document["updated_at"] = counters.now()
+        if previous == value:
+            return previous
+
+        # Same shape as the $inc/$min/$max updates applied to movie_stats
+        stats = self.movie_stats.setdefault(movie_id, {"_id": movie_id, "count": 0, "sum": 0, "histogram": {}})
+        histogram = stats["histogram"]
+        if previous is None:
+            stats["count"] += 1
+            stats["sum"] += value
+            update = counters.rating_added(value, counters.now())
+        else:
+            stats["sum"] += value - previous
+            old_bucket = str(rating_stats.bucket_for(previous))
+            histogram[old_bucket] -= 1
+            update = counters.rating_changed(previous, value, counters.now())
+        bucket = str(rating_stats.bucket_for(value))
+        histogram[bucket] = histogram.get(bucket, 0) + 1
+        stale = rating_stats.stale_extremes(stats, previous, value) if previous is not None else []
+        stats["min"] = min(stats.get("min", value), value)
+        stats["max"] = max(stats.get("max", value), value)
+        if stale:
+            values = [other["rating"] for other in self.by_movie[movie_id].values()]
+            stats.update((field, min(values) if field == "min" else max(values)) for field in stale)
+        _apply(self.movies.documents.get(object_id(movie_id)), update)
+        return previous
+
+    async def list_for_movie(self, movie_id: str, fields: Fields = None, limit: int = 100) -> List[dict]:
+        return [project(rating, fields) for rating in list(self.by_movie.get(movie_id, {}).values())[:limit]]
+
+    async def list_for_user(self, user_id: str, fields: Fields = None, after: Optional[str] = None, limit: int = 100) -> List[dict]:
+        movie_ids = sorted(movie_id for movie_id in self.by_user.get(user_id, {}) if after is None or movie_id > after)
+        return [project(self.by_user[user_id][movie_id], fields) for movie_id in movie_ids[:limit]]
+
+    async def stats(self, movie_id: str) -> Optional[dict]:
+        stats = self.movie_stats.get(movie_id)
+        return {**stats, "histogram": dict(stats["histogram"])} if stats is not None else None
+
+    async def stats_many(self, movie_ids: Iterable[str]) -> Dict[str, dict]:
+        return {movie_id: await self.stats(movie_id) for movie_id in movie_ids if movie_id in self.movie_stats}
+
+    async def delete_stats(self, movie_id: str):
+        self.movie_stats.pop(movie_id, None)
+
+    def scan(self, id_range: IdRange, batch_size: int = 1000, updated_since: Optional[datetime] = None) -> AsyncIterator[dict]:
+        ratings = (rating for ratings in self.by_movie.values() for rating in ratings.values())
+        if updated_since is not None:
+            ratings = (rating for rating in ratings if _updated_at(rating) >= updated_since)
+        return scan(ratings, id_range)
+
+class MemoryCommentRepo:
+    def __init__(self, movies: MemoryMovieRepo):
+        self.movies = movies
+        self.documents: Dict[ObjectId, dict] = {}
+        self.by_movie: Dict[str, List[ObjectId]] = defaultdict(list)
+        self.by_parent: Dict[tuple, List[ObjectId]] = defaultdict(list)
+        self.by_ancestor: Dict[str, List[ObjectId]] = defaultdict(list)
+
+    async def insert(self, comment: dict) -> str:
+        comment.setdefault("_id", ObjectId())
+        comment.setdefault("reply_count", 0)
+        document = dict(comment)
+        self.documents[document["_id"]] = document
+        self.by_movie[document["movie_id"]].append(document["_id"])
+        self.by_parent[(document["movie_id"], document.get("parent_id"))].append(document["_id"])
+        for ancestor in document.get("ancestors", []):
+            self.by_ancestor[ancestor].append(document["_id"])
+        _apply(self.movies.documents.get(object_id(document["movie_id"])), counters.comment_added(counters.now()))
+        if document.get("parent_id") is not None:
+            _apply(self.documents.get(object_id(document["parent_id"])), counters.REPLY_ADDED)
+        return str(document["_id"])
+
+    async def get(self, movie_id: str, comment_id: str, fields: Fields = None) -> Optional[dict]:
+        document = self.documents.get(object_id(comment_id))
+        if document is None or document["movie_id"] != movie_id:
+            return None
+        return project(document, fields)
+
+    async def children(self, movie_id: str, parent_id: Optional[str], fields: Fields = None, limit: int = 100) -> List[dict]:
+        return [project(self.documents[oid], fields) for oid in self.by_parent.get((movie_id, parent_id), [])[:limit]]
+
+    async def thread(self, movie_id: str, root_id: Optional[str] = None, max_depth: Optional[int] = None, limit: int = 500) -> List[dict]:
+        ids = self.by_movie.get(movie_id, []) if root_id is None else self.by_ancestor.get(root_id, [])
+        documents = [self.documents[oid] for oid in ids]
+        if max_depth is not None:
+            documents = [document for document in documents if document.get("depth", 0) <= max_depth]
+        documents.sort(key=lambda document: (document.get("depth", 0), document["_id"]))
+        return [project(document, None) for document in documents[:limit]]
+
+    def scan(self, id_range: IdRange, batch_size: int = 1000) -> AsyncIterator[dict]:
+        return scan(self.documents.values(), id_range)
+
+class MemoryUserRepo:
+    def __init__(self):
+        self.documents: Dict[ObjectId, dict] = {}
+        self.by_username: Dict[str, ObjectId] = {}
+
+    async def insert(self, user: dict) -> str:
+        if user["username"] in self.by_username:
+            raise DuplicateKey(f"duplicate username {user['username']!r}")
+        user.setdefault("_id", ObjectId())
+        self.documents[user["_id"]] = dict(user)
+        self.by_username[user["username"]] = user["_id"]
+        return str(user["_id"])
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        document = self.documents.get(object_id(user_id))
+        return dict(document) if document is not None else None
+
+    async def get_by_username(self, username: str) -> Optional[dict]:
+        user_id = self.by_username.get(username)
+        return dict(self.documents[user_id]) if user_id is not None else None
+
+    async def set_password(self, user_id: str, password_hash: str):
+        document = self.documents.get(object_id(user_id))
+        if document is not None:
+            document["password"] = password_hash
+
+class MemoryVersionRepo:
+    def __init__(self):
+        self.versions: Dict[str, int] = {}
+
+    async def get(self, key: str) -> int:
+        return self.versions.get(key, 0)
+
+    async def bump(self, keys: Sequence[str]):
+        for key in keys:
+            self.versions[key] = self.versions.get(key, 0) + 1
+
+class MemoryNeighborRepo:
+    def __init__(self):
+        self.lists: Dict[str, List[dict]] = {}
+
+    async def get(self, movie_id: str) -> List[dict]:
+        return [dict(neighbor) for neighbor in self.lists.get(movie_id, [])]
+
+    async def get_many(self, movie_ids: Iterable[str]) -> Dict[str, List[dict]]:
+        return {movie_id: await self.get(movie_id) for movie_id in movie_ids if movie_id in self.lists}
+
+    async def replace(self, lists: Dict[str, List[dict]]):
+        self.lists.update((movie_id, [dict(neighbor) for neighbor in neighbors]) for movie_id, neighbors in lists.items())
+
+    async def delete(self, movie_id: str):
+        self.lists.pop(movie_id, None)
+
+def _ranked(rows: Iterable[dict], limit: int) -> List[dict]:
+    return sorted(rows, key=lambda row: (-row["score"], row["_id"]))[:limit]
+
+class MemoryLeaderboardRepo:
+    """The leaderboard aggregations computed over the memory repositories."""
+
+    def __init__(self, ratings: MemoryRatingRepo, comments: MemoryCommentRepo):
+        self.ratings = ratings
+        self.comments = comments
+
+    async def top_rated(self, limit: int, prior_weight: float) -> List[dict]:
+        rows = [
+            {"_id": movie_id, "rating_count": len(ratings), "rating_sum": sum(rating["rating"] for rating in ratings.values())}
+            for movie_id, ratings in self.ratings.by_movie.items() if ratings
+        ]
+        total_count = sum(row["rating_count"] for row in rows)
+        mean = sum(row["rating_sum"] for row in rows) / total_count if total_count else 0
+        for row in rows:
+            row["score"] = (prior_weight * mean + row["rating_sum"]) / (prior_weight + row["rating_count"])
+        return _ranked(rows, limit)
+
+    async def trending(self, since: datetime, limit: int, comment_weight: float) -> List[dict]:
+        rows: Dict[str, dict] = defaultdict(lambda: {"rating_count": 0, "rating_sum": 0, "comment_count": 0})
+        for ratings in self.ratings.by_movie.values():
+            for rating in ratings.values():
+                if _updated_at(rating) >= since:
+                    row = rows[rating["movie_id"]]
+                    row["rating_count"] += 1
+                    row["rating_sum"] += rating["rating"]
+        for comment in self.comments.documents.values():
+            if comment["_id"].generation_time >= since:
+                rows[comment["movie_id"]]["comment_count"] += 1
+        for movie_id, row in rows.items():
+            row["_id"] = movie_id
+            row["score"] = row["rating_sum"] / rating_stats.RATING_MAX + row["comment_count"] * comment_weight
+        return _ranked(rows.values(), limit)
+
+def memory_repositories() -> Repositories:
+    movies = MemoryMovieRepo()
+    ratings = MemoryRatingRepo(movies)
+    comments = MemoryCommentRepo(movies)
+    return Repositories(
+        movies=movies,
+        ratings=ratings,
+        comments=comments,
+        users=MemoryUserRepo(),
+        versions=MemoryVersionRepo(),
+        neighbors=MemoryNeighborRepo(),
+        leaderboards=MemoryLeaderboardRepo(ratings, comments),
+    )
@@ -0,0 +1,335 @@
+import asyncio
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
+from bson import ObjectId
+from bson.errors import InvalidId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pagination import keyset_filter
+import rating_stats
+import counters
+from title_index import normalize, title_fields
+from repositories.base import DuplicateKey, Fields, IdRange, Repositories
+
+def object_id(value: str) -> Optional[ObjectId]:
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return None
+
+def projection(fields: Fields) -> Optional[dict]:
+    if fields is None:
+        return None
+    # Always name _id so an empty selection never turns into "all fields"
+    return {"_id": 1, **{field: 1 for field in fields}}
+
+def prefix_range(prefix: str) -> dict:
+    # Strings compare by code point, so bumping the last one bounds the prefix
+    if not prefix:
+        return {"$gte": ""}
+    return {"$gte": prefix, "$lt": prefix[:-1] + chr(ord(prefix[-1]) + 1)}
+
+async def scan(collection, id_range: IdRange, batch_size: int, query: Optional[dict] = None) -> AsyncIterator[dict]:
+    query = {**(query or {}), "_id": id_range} if id_range else (query or {})
+    async for document in collection.find(query).sort("_id", ASCENDING).batch_size(batch_size):
+        yield document
+
+class MotorMovieRepo:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.collection = db["movies"]
+
+    async def insert(self, movie: dict) -> str:
+        for field, value in counters.new_movie_counters().items():
+            movie.setdefault(field, value)
+        movie.update(title_fields(movie["title"]))
+        result = await self.collection.insert_one(movie)
+        return str(result.inserted_id)
+
+    async def insert_many(self, movies: List[dict]) -> Tuple[int, Dict[int, str]]:
+        for movie in movies:
+            movie.update(title_fields(movie["title"]))
+        try:
+            result = await self.collection.insert_many(movies, ordered=False)
+        except BulkWriteError as exc:
+            errors = {error["index"]: error.get("errmsg", "Write failed") for error in exc.details.get("writeErrors", [])}
+            return exc.details.get("nInserted", 0), errors
+        return len(result.inserted_ids), {}
+
+    async def get(self, movie_id: str, fields: Fields = None) -> Optional[dict]:
+        return await self.collection.find_one({"_id": object_id(movie_id)}, projection(fields))
+
+    async def get_many(self, movie_ids: Sequence[str], fields: Fields = None) -> List[dict]:
+        ids = list({oid for oid in map(object_id, movie_ids) if oid is not None})
+        return await self.collection.find({"_id": {"$in": ids}}, projection(fields)).to_list(length=len(ids))
+
+    async def exists(self, movie_id: str) -> bool:
+        return bool(await self.collection.count_documents({"_id": object_id(movie_id)}, limit=1))
+
+    async def list(
+        self,
+        filters: Dict[str, Any],
+        released_from: Any = None,
+        released_to: Any = None,
+        sort: str = "_id",
+        descending: bool = False,
+        cursor: Optional[str] = None,
+        limit: int = 20,
+        fields: Fields = None
+    ) -> List[dict]:
+        query = dict(filters)
+        if released_from is not None or released_to is not None:
+            query["release_date"] = {}
+            if released_from is not None:
+                query["release_date"]["$gte"] = released_from
+            if released_to is not None:
+                query["release_date"]["$lte"] = released_to
+        if cursor:
+            query = {"$and": [query, keyset_filter(cursor, sort, descending)]}
+
+        direction = DESCENDING if descending else ASCENDING
+        sort_spec = [("_id", direction)] if sort == "_id" else [(sort, direction), ("_id", direction)]
+        # The sort field is fetched even when not selected, for the next cursor
+        spec = projection(tuple(fields) + ((sort,) if sort != "_id" else ())) if fields is not None else None
+        return await self.collection.find(query, spec).sort(sort_spec).limit(limit).to_list(length=limit)
+
+    async def search(self, text: str, limit: int, fields: Fields = None) -> List[dict]:
+        # Ranked by the weighted text index over title, director and synopsis
+        score = {"score": {"$meta": "textScore"}}
+        movies = await self.collection.find(
+            {"$text": {"$search": text}}, {**(projection(fields) or {}), **score}
+        ).sort([("score", {"$meta": "textScore"})]).limit(limit).to_list(length=limit)
+        for movie in movies:
+            movie.pop("score", None)
+        return movies
+
+    async def titles_with_prefix(self, prefix: str, limit: int) -> List[dict]:
+        # A bounded range on the title_key index, in the in-memory index's order
+        return await self.collection.find(
+            {"title_key": prefix_range(normalize(prefix))}, {"title": 1}
+        ).sort([("title_key", ASCENDING), ("_id", ASCENDING)]).limit(limit).to_list(length=limit)
+
+    async def update_owned(self, movie_id: str, user_id: str, changes: dict) -> Optional[dict]:
+        if "title" in changes:
+            changes = {**changes, **title_fields(changes["title"], counters.now())}
+        return await self.collection.find_one_and_update(
+            {"_id": object_id(movie_id), "user_id": user_id},
+            {"$set": changes},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def delete_owned(self, movie_id: str, user_id: str) -> bool:
+        result = await self.collection.delete_one({"_id": object_id(movie_id), "user_id": user_id})
+        return bool(result.deleted_count)
+
+    def scan(self, id_range: IdRange, batch_size: int = 1000) -> AsyncIterator[dict]:
+        return scan(self.collection, id_range, batch_size)
+
+class MotorRatingRepo:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.collection = db["ratings"]
+
+    async def upsert(self, rating: dict) -> Optional[float]:
+        # One round trip on the unique (user_id, movie_id) index; the server
+        # retries the upsert itself if a concurrent one inserts first
+        key = {"user_id": rating["user_id"], "movie_id": rating["movie_id"]}
+        before = await self.collection.find_one_and_update(
+            key,
+            {"$set": {"rating": rating["rating"], "updated_at": counters.now()}},
+            projection={"rating": 1},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+        previous = before["rating"] if before is not None else None
+        if previous == rating["rating"]:
+            return previous
+        movie_update = counters.rating_added(rating["rating"], counters.now()) if previous is None else counters.rating_changed(previous, rating["rating"], counters.now())
+        await asyncio.gather(
+            rating_stats.record_rating(self.db, rating["movie_id"], rating["rating"], previous),
+            self.db["movies"].update_one({"_id": object_id(rating["movie_id"])}, movie_update)
+        )
+        return previous
+
+    async def list_for_movie(self, movie_id: str, fields: Fields = None, limit: int = 100) -> List[dict]:
+        return await self.collection.find({"movie_id": movie_id}, projection(fields)).to_list(length=limit)
+
+    async def list_for_user(self, user_id: str, fields: Fields = None, after: Optional[str] = None, limit: int = 100) -> List[dict]:
+        query = {"user_id": user_id, "movie_id": {"$gt": after}} if after is not None else {"user_id": user_id}
+        cursor = self.collection.find(query, projection(fields)).sort("movie_id", ASCENDING).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def stats(self, movie_id: str) -> Optional[dict]:
+        return await rating_stats.get_stats(self.db, movie_id)
+
+    async def stats_many(self, movie_ids: Iterable[str]) -> Dict[str, dict]:
+        return await rating_stats.get_stats_many(self.db, movie_ids)
+
+    async def delete_stats(self, movie_id: str):
+        await self.db["movie_stats"].delete_one({"_id": movie_id})
+
+    def scan(self, id_range: IdRange, batch_size: int = 1000, updated_since: Optional[datetime] = None) -> AsyncIterator[dict]:
+        return scan(self.collection, id_range, batch_size, updated_since_filter(updated_since) if updated_since is not None else None)
+
+class MotorCommentRepo:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.collection = db["comments"]
+
+    async def insert(self, comment: dict) -> str:
+        comment.setdefault("reply_count", 0)
+        result = await self.collection.insert_one(comment)
+        updates = [self.db["movies"].update_one({"_id": object_id(comment["movie_id"])}, counters.comment_added(counters.now()))]
+        if comment.get("parent_id") is not None:
+            updates.append(self.collection.update_one({"_id": object_id(comment["parent_id"])}, counters.REPLY_ADDED))
+        await asyncio.gather(*updates)
+        return str(result.inserted_id)
+
+    async def get(self, movie_id: str, comment_id: str, fields: Fields = None) -> Optional[dict]:
+        oid = object_id(comment_id)
+        if oid is None:
+            return None
+        return await self.collection.find_one({"_id": oid, "movie_id": movie_id}, projection(fields))
+
+    async def children(self, movie_id: str, parent_id: Optional[str], fields: Fields = None, limit: int = 100) -> List[dict]:
+        return await self.collection.find({"movie_id": movie_id, "parent_id": parent_id}, projection(fields)).to_list(length=limit)
+
+    async def thread(self, movie_id: str, root_id: Optional[str] = None, max_depth: Optional[int] = None, limit: int = 500) -> List[dict]:
+        query = {"movie_id": movie_id} if root_id is None else {"ancestors": root_id}
+        if max_depth is not None:
+            query["depth"] = {"$lte": max_depth}
+        return await self.collection.find(query).sort([("depth", 1), ("_id", 1)]).limit(limit).to_list(length=limit)
+
+    def scan(self, id_range: IdRange, batch_size: int = 1000) -> AsyncIterator[dict]:
+        return scan(self.collection, id_range, batch_size)
+
+class MotorUserRepo:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.collection = db["users"]
+
+    async def insert(self, user: dict) -> str:
+        # The unique index on users.username rejects duplicates atomically
+        try:
+            result = await self.collection.insert_one(user)
+        except DuplicateKeyError as exc:
+            raise DuplicateKey(str(exc)) from exc
+        return str(result.inserted_id)
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"_id": object_id(user_id)})
+
+    async def get_by_username(self, username: str) -> Optional[dict]:
+        return await self.collection.find_one({"username": username})
+
+    async def set_password(self, user_id: str, password_hash: str):
+        await self.collection.update_one({"_id": object_id(user_id)}, {"$set": {"password": password_hash}})
+
+class MotorVersionRepo:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.collection = db["versions"]
+
+    async def get(self, key: str) -> int:
+        document = await self.collection.find_one({"_id": key})
+        return document["v"] if document else 0
+
+    async def bump(self, keys: Sequence[str]):
+        await self.collection.bulk_write(
+            [UpdateOne({"_id": key}, {"$inc": {"v": 1}}, upsert=True) for key in keys],
+            ordered=False
+        )
+
+class MotorNeighborRepo:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.collection = db["movie_neighbors"]
+
+    async def get(self, movie_id: str) -> List[dict]:
+        document = await self.collection.find_one({"_id": movie_id}, {"neighbors": 1})
+        return document["neighbors"] if document else []
+
+    async def get_many(self, movie_ids: Iterable[str]) -> Dict[str, List[dict]]:
+        movie_ids = list(movie_ids)
+        documents = await self.collection.find({"_id": {"$in": movie_ids}}, {"neighbors": 1}).to_list(length=len(movie_ids))
+        return {document["_id"]: document["neighbors"] for document in documents}
+
+    async def replace(self, lists: Dict[str, List[dict]]):
+        if lists:
+            await self.collection.bulk_write(
+                [ReplaceOne({"_id": movie_id}, {"neighbors": neighbors}, upsert=True) for movie_id, neighbors in lists.items()],
+                ordered=False
+            )
+
+    async def delete(self, movie_id: str):
+        await self.collection.delete_one({"_id": movie_id})
+
+def top_rated_pipeline(limit: int, prior_weight: float) -> list:
+    return [
+        {"$group": {"_id": "$movie_id", "rating_count": {"$sum": 1}, "rating_sum": {"$sum": "$rating"}}},
+        # Window over the whole result set to get the global mean without a second query
+        {"$setWindowFields": {"output": {
+            "total_count": {"$sum": "$rating_count"},
+            "total_sum": {"$sum": "$rating_sum"},
+        }}},
+        {"$addFields": {"score": {"$divide": [
+            {"$add": [
+                {"$multiply": [prior_weight, {"$divide": ["$total_sum", "$total_count"]}]},
+                "$rating_sum",
+            ]},
+            {"$add": [prior_weight, "$rating_count"]},
+        ]}}},
+        {"$sort": {"score": -1, "_id": 1}},
+        {"$limit": limit},
+        {"$project": {"score": 1, "rating_count": 1, "rating_sum": 1}},
+    ]
+
+def updated_since_filter(since: datetime) -> dict:
+    # A re-rating keeps its _id, so ratings are windowed on updated_at; ratings
+    # written before updated_at existed fall back to their _id's creation time
+    return {"$or": [
+        {"updated_at": {"$gte": since}},
+        {"updated_at": {"$exists": False}, "_id": {"$gte": ObjectId.from_datetime(since)}},
+    ]}
+
+def trending_pipeline(since: datetime, limit: int, comment_weight: float) -> list:
+    # Comments are never edited, and their ObjectIds embed when they were made
+    created = {"_id": {"$gte": ObjectId.from_datetime(since)}}
+    return [
+        {"$match": updated_since_filter(since)},
+        {"$group": {"_id": "$movie_id", "rating_count": {"$sum": 1}, "rating_sum": {"$sum": "$rating"}}},
+        {"$unionWith": {"coll": "comments", "pipeline": [
+            {"$match": created},
+            {"$group": {"_id": "$movie_id", "comment_count": {"$sum": 1}}},
+        ]}},
+        {"$group": {
+            "_id": "$_id",
+            "rating_count": {"$sum": "$rating_count"},
+            "rating_sum": {"$sum": "$rating_sum"},
+            "comment_count": {"$sum": "$comment_count"},
+        }},
+        {"$addFields": {"score": {"$add": [
+            {"$divide": ["$rating_sum", rating_stats.RATING_MAX]},
+            {"$multiply": ["$comment_count", comment_weight]},
+        ]}}},
+        {"$sort": {"score": -1, "_id": 1}},
+        {"$limit": limit},
+    ]
+
+class MotorLeaderboardRepo:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.ratings = db["ratings"]
+
+    async def top_rated(self, limit: int, prior_weight: float) -> List[dict]:
+        return await self.ratings.aggregate(top_rated_pipeline(limit, prior_weight)).to_list(length=limit)
+
+    async def trending(self, since: datetime, limit: int, comment_weight: float) -> List[dict]:
+        return await self.ratings.aggregate(trending_pipeline(since, limit, comment_weight)).to_list(length=limit)
+
+def motor_repositories(db: AsyncIOMotorDatabase) -> Repositories:
+    return Repositories(
+        movies=MotorMovieRepo(db),
+        ratings=MotorRatingRepo(db),
+        comments=MotorCommentRepo(db),
+        users=MotorUserRepo(db),
+        versions=MotorVersionRepo(db),
+        neighbors=MotorNeighborRepo(db),
+        leaderboards=MotorLeaderboardRepo(db),
+    )
@@ -2,11 +2,11 @@ import logging
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from motor.motor_asyncio import AsyncIOMotorDatabase
-from jwt_token import ACCESS_TOKEN_EXPIRE_MINUTES, create_access_token 
+from jwt_token import ACCESS_TOKEN_EXPIRE_MINUTES, PROFILE_CLAIMS, create_access_token 
 import schemas.schemas as schemas
-from hashing import Hash
-from bson import ObjectId
+from hashing import Hash, HashQueueFull
+import oauth2
+from repositories import DuplicateKey, Repositories, get_repos
 
 logger = logging.getLogger("auth")
 
@@ -14,21 +14,22 @@ router = APIRouter(
     tags=["Auth"]
 )
 
-# Dependency to get the MongoDB database
-def get_db() -> AsyncIOMotorDatabase:
-    from database.database import get_db
-    return get_db()
+def hashing_overloaded() -> HTTPException:
+    logger.warning("Password hashing queue is full")
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server busy, please retry",
+        headers={"Retry-After": "1"},
+    )
 
 @router.post("/signup", response_model=schemas.UserResponse, status_code=status.HTTP_201_CREATED)
-async def create_user(request: schemas.User, db: AsyncIOMotorDatabase = Depends(get_db)):
+async def create_user(request: schemas.User, repos: Repositories = Depends(get_repos)):
     logger.info("Received request to create a new user")
     
-    existing_user = await db["users"].find_one({"username": request.username})
-    if existing_user:
-        logger.warning(f"Username {request.username} already exists")
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already taken")
-
-    hashed_password = Hash.bcrypt(request.password)
+    try:
+        hashed_password = await Hash.bcrypt_async(request.password)
+    except HashQueueFull:
+        raise hashing_overloaded()
     
     new_user = {
         "username": request.username,
@@ -41,49 +42,66 @@ async def create_user(request: schemas.User, db: AsyncIOMotorDatabase = Depends(
         "comments": []
     }
     
-    result = await db["users"].insert_one(new_user)
-    created_user = await db["users"].find_one({"_id": result.inserted_id})
+    # The unique index on users.username rejects duplicates atomically
+    try:
+        user_id = await repos.users.insert(new_user)
+    except DuplicateKey:
+        logger.warning("Username %s already exists", request.username)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already taken")
     
-    # Convert ObjectId to string for response
-    created_user["id"] = str(created_user["_id"])
-    created_user.pop("_id", None)
+    # Build the response from the inserted document instead of re-reading it
+    created_user = {key: new_user[key] for key in new_user if key != "_id"}
+    created_user["id"] = user_id
     
     logger.info("User created successfully")
     return schemas.UserResponse(**created_user)
 
 @router.get("/user/{id}", response_model=schemas.User)
-async def get_user(id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
-    logger.info(f"Received request to retrieve user with id {id}")
+async def get_user(id: str, repos: Repositories = Depends(get_repos)):
+    logger.info("Received request to retrieve user with id %s", id)
     
-    user = await db["users"].find_one({"_id": ObjectId(id)})
+    user = await repos.users.get(id)
     if not user:
-        logger.warning(f"User with id {id} does not exist")
+        logger.warning("User with id %s does not exist", id)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User does not exist")
     
     # Convert ObjectId to string for response
     user["id"] = str(user["_id"])
     user.pop("_id", None)
     
-    logger.info(f"User with id {id} retrieved successfully")
+    logger.info("User with id %s retrieved successfully", id)
     return schemas.User(**user)
 
 @router.post("/login", response_model=schemas.Token)
-async def login(request: OAuth2PasswordRequestForm = Depends(), db: AsyncIOMotorDatabase = Depends(get_db)):
-    logger.info(f"Received request to login with username {request.username}")
+async def login(request: OAuth2PasswordRequestForm = Depends(), repos: Repositories = Depends(get_repos)):
+    logger.info("Received request to login with username %s", request.username)
     
-    user = await db["users"].find_one({"username": request.username})
+    user = await repos.users.get_by_username(request.username)
     if not user:
-        logger.warning(f"User with username {request.username} does not exist")
+        logger.warning("User with username %s does not exist", request.username)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid username or password")
     
-    if not Hash.verify(user["password"], request.password):
-        logger.warning(f"Incorrect password for user with username {request.username}")
+    try:
+        verified, new_hash = await Hash.verify_and_update_async(user["password"], request.password)
+    except HashQueueFull:
+        raise hashing_overloaded()
+    if not verified:
+        logger.warning("Incorrect password for user with username %s", request.username)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid username or password")
 
+    # The stored hash was made with an outdated cost factor; upgrade it transparently
+    if new_hash is not None:
+        await repos.users.set_password(str(user["_id"]), new_hash)
+        oauth2.invalidate_user(str(user["_id"]))
+        logger.info("Password hash upgraded for user with username %s", request.username)
+
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    claims = {"sub": str(user["_id"])}
+    if oauth2.AUTH_STATELESS:
+        claims.update({claim: user[claim] for claim in PROFILE_CLAIMS if claim in user})
     access_token = create_access_token(
-        data={"sub": str(user["_id"])}, expires_delta=access_token_expires
+        data=claims, expires_delta=access_token_expires
     )
     
-    logger.info(f"Login successful for user with username {request.username}")
+    logger.info("Login successful for user with username %s", request.username)
     return schemas.Token(access_token=access_token, token_type="bearer")
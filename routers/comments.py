@@ -1,19 +1,17 @@
 import logging
-from fastapi import APIRouter, Depends, HTTPException, status
-from motor.motor_asyncio import AsyncIOMotorDatabase
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from typing import List, Optional
 import schemas.schemas as schemas, oauth2 as oauth2
-from bson import ObjectId
+from comment_tree import build_tree, path_fields
+from repositories import Repositories, get_repos
+import http_cache
+from cache import response_cache
+from serialization import COMMENT_FIELDS, BSONResponse, respond, select_fields, to_out
 
 logger = logging.getLogger("comments")
 
 router = APIRouter(tags=["Comments"])
 
-# Dependency to get the MongoDB database
-def get_db() -> AsyncIOMotorDatabase:
-    from database.database import get_db
-    return get_db()
-
 def convert_id_to_str(comment):
     return {
         "id": str(comment["_id"]),
@@ -24,10 +22,10 @@ def convert_id_to_str(comment):
 async def create_comment(
     movie_id: str, 
     request: schemas.Comment, 
-    db: AsyncIOMotorDatabase = Depends(get_db), 
+    repos: Repositories = Depends(get_repos), 
     get_current_user: schemas.User = Depends(oauth2.get_current_user)
 ):
-    logger.info(f"Received request to create a new comment for movie with id {movie_id}")
+    logger.info("Received request to create a new comment for movie with id %s", movie_id)
    
     request_data = request.dict(exclude={"movie_id"})
     
@@ -35,70 +33,110 @@ async def create_comment(
         **request_data,
         "user_id": str(get_current_user.id),
         "movie_id": movie_id,
-        "parent_id": None
+        "parent_id": None,
+        **path_fields()
     }
     
-    result = await db["comments"].insert_one(new_comment)
-    created_comment = await db["comments"].find_one({"_id": result.inserted_id})
-    
-    if created_comment is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Comment not found")
+    await repos.comments.insert(new_comment)
+    # The movie's comment_count changes too
+    await response_cache.invalidate(keys=[http_cache.comments_key(movie_id), http_cache.movie_key(movie_id)], tags=[http_cache.MOVIES_KEY])
+    await http_cache.bump(repos.versions, http_cache.comments_key(movie_id), http_cache.movie_key(movie_id), http_cache.MOVIES_KEY)
     
-    logger.info(f"Comment created successfully for movie with id {movie_id}")
-    return schemas.CommentResponse(**convert_id_to_str(created_comment))
+    logger.info("Comment created successfully for movie with id %s", movie_id)
+    return schemas.CommentResponse(**convert_id_to_str(new_comment))
 
 @router.get("/movie/{movie_id}/comments", response_model=List[schemas.CommentResponse])
-async def get_comments(movie_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
-    logger.info(f"Received request to retrieve comments for movie with id {movie_id}")
-    comments = await db["comments"].find({"movie_id": movie_id, "parent_id": None}).to_list(length=100)
-    
-    if not comments:
-        logger.info(f"No comments found for movie with id {movie_id}")
-        return [] 
-    
-    logger.info(f"Comments retrieved successfully for movie with id {movie_id}")
-    return [schemas.CommentResponse(**convert_id_to_str(comment)) for comment in comments]
+async def get_comments(movie_id: str, request: Request, response: Response, fields: Optional[str] = None, repos: Repositories = Depends(get_repos)):
+    logger.info("Received request to retrieve comments for movie with id %s", movie_id)
+    selected = select_fields(fields, COMMENT_FIELDS)
+    not_modified = await http_cache.conditional(request, response, repos.versions, http_cache.comments_key(movie_id))
+    if not_modified:
+        return not_modified
+
+    async def load():
+        comments = await repos.comments.children(movie_id, None, selected)
+        
+        if not comments:
+            logger.info("No comments found for movie with id %s", movie_id)
+            return [] 
+        
+        logger.info("Comments retrieved successfully for movie with id %s", movie_id)
+        return [to_out(comment, selected) for comment in comments]
+
+    return respond(await response_cache.get_or_load(http_cache.comments_key(movie_id), load, variant=http_cache.cache_variant(response)), response)
 
 @router.post("/movie/{movie_id}/comment/{parent_id}", response_model=schemas.CommentResponse)
 async def create_nested_comment(
     movie_id: str, 
     parent_id: str, 
     request: schemas.Comment, 
-    db: AsyncIOMotorDatabase = Depends(get_db), 
+    repos: Repositories = Depends(get_repos), 
     get_current_user: schemas.User = Depends(oauth2.get_current_user)
 ):
-    logger.info(f"Received request to create a new nested comment for movie with id {movie_id} and parent comment with id {parent_id}")
+    logger.info("Received request to create a new nested comment for movie with id %s and parent comment with id %s", movie_id, parent_id)
     
+    parent = await repos.comments.get(movie_id, parent_id, ("ancestors", "depth"))
+    if parent is None:
+        logger.warning("Parent comment with id %s not found for movie with id %s", parent_id, movie_id)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Parent comment not found")
+
     request_data = request.dict(exclude={"movie_id", "parent_id"})
     
     new_comment = {
         **request_data,
         "user_id": str(get_current_user.id),
         "movie_id": movie_id,
-        "parent_id": parent_id
+        "parent_id": parent_id,
+        **path_fields(parent)
     }
     
-    result = await db["comments"].insert_one(new_comment)
-    created_comment = await db["comments"].find_one({"_id": result.inserted_id})
+    await repos.comments.insert(new_comment)
+    # Also the parent's reply_count
+    await response_cache.invalidate(keys=[http_cache.comments_key(movie_id), http_cache.movie_key(movie_id)], tags=[http_cache.MOVIES_KEY])
+    await http_cache.bump(repos.versions, http_cache.comments_key(movie_id), http_cache.movie_key(movie_id), http_cache.MOVIES_KEY)
     
-    if created_comment is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Comment not found")
-    
-    logger.info(f"Nested comment created successfully for movie with id {movie_id} and parent comment with id {parent_id}")
-    return schemas.CommentResponse(**convert_id_to_str(created_comment))
+    logger.info("Nested comment created successfully for movie with id %s and parent comment with id %s", movie_id, parent_id)
+    return schemas.CommentResponse(**convert_id_to_str(new_comment))
 
 @router.get("/movie/{movie_id}/comment/{parent_id}", response_model=List[schemas.CommentResponse])
 async def get_nested_comments(
     movie_id: str, 
     parent_id: str, 
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    fields: Optional[str] = None,
+    repos: Repositories = Depends(get_repos)
 ):
-    logger.info(f"Received request to retrieve nested comments for movie with id {movie_id} and parent comment with id {parent_id}")
-    comments = await db["comments"].find({"movie_id": movie_id, "parent_id": parent_id}).to_list(length=100)
+    logger.info("Received request to retrieve nested comments for movie with id %s and parent comment with id %s", movie_id, parent_id)
+    selected = select_fields(fields, COMMENT_FIELDS)
+    comments = await repos.comments.children(movie_id, parent_id, selected)
     
     if not comments:
-        logger.info(f"No nested comments found for movie with id {movie_id} and parent comment with id {parent_id}")
+        logger.info("No nested comments found for movie with id %s and parent comment with id %s", movie_id, parent_id)
         return [] 
     
-    logger.info(f"Nested comments retrieved successfully for movie with id {movie_id} and parent comment with id {parent_id}")
-    return [schemas.CommentResponse(**convert_id_to_str(comment)) for comment in comments]
+    logger.info("Nested comments retrieved successfully for movie with id %s and parent comment with id %s", movie_id, parent_id)
+    return BSONResponse([to_out(comment, selected) for comment in comments])
+
+@router.get("/movie/{movie_id}/comments/tree", response_model=schemas.CommentTree)
+async def get_comment_tree(
+    movie_id: str,
+    root_id: Optional[str] = None,
+    max_depth: Optional[int] = Query(None, ge=0),
+    limit: int = Query(500, ge=1, le=5000),
+    repos: Repositories = Depends(get_repos)
+):
+    logger.info("Received request to retrieve comment tree for movie with id %s", movie_id)
+    base_depth = 0
+    if root_id is not None:
+        root = await repos.comments.get(movie_id, root_id, ("depth",))
+        if root is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Comment not found")
+        base_depth = root.get("depth", 0) + 1
+
+    # Threads come sorted by depth, so every parent is ahead of its replies and
+    # a size-bounded slice is always a complete set of upper levels
+    comments = await repos.comments.thread(
+        movie_id, root_id, base_depth + max_depth if max_depth is not None else None, limit + 1
+    )
+    
+    logger.info("Comment tree retrieved successfully for movie with id %s", movie_id)
+    return schemas.CommentTree(items=build_tree(comments[:limit]), truncated=len(comments) > limit)
@@ -0,0 +1,67 @@
+import logging
+import os
+from datetime import datetime
+from typing import AsyncIterator, Literal, Optional
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from bson import ObjectId
+from bson.errors import InvalidId
+from schemas import schemas
+import oauth2
+from repositories import Repositories, get_repos
+
+logger = logging.getLogger("export")
+
+router = APIRouter(tags=["Export"])
+
+# Documents fetched per getMore and written per response chunk
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+def export_line(document: dict) -> bytes:
+    document["id"] = str(document.pop("_id"))
+    # orjson writes datetimes natively; ObjectIds fall through to str
+    return orjson.dumps(document, default=str) + b"\n"
+
+async def stream_documents(documents: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    chunk = []
+    async for document in documents:
+        chunk.append(export_line(document))
+        if len(chunk) >= EXPORT_BATCH_SIZE:
+            yield b"".join(chunk)
+            chunk = []
+    if chunk:
+        yield b"".join(chunk)
+
+@router.get("/export/{collection}")
+async def export_collection(
+    collection: Literal["movies", "ratings", "comments"],
+    since: Optional[datetime] = None,
+    after_id: Optional[str] = None,
+    repos: Repositories = Depends(get_repos),
+    get_current_user: schemas.User = Depends(oauth2.get_current_user)
+):
+    """Stream a collection as NDJSON in `_id` order.
+
+    `since` keeps documents created at or after that time and `after_id`
+    resumes after the last id of a previous export. Ratings are re-rated in
+    place, so for them `since` matches when they were last set, and an
+    incremental export also carries re-ratings of older ratings. Changes to
+    already exported movies and comments are not picked up.
+    """
+    logger.info("Received request to export %s", collection)
+    id_filter = {}
+    if since is not None and collection != "ratings":
+        id_filter["$gte"] = ObjectId.from_datetime(since)
+    if after_id is not None:
+        try:
+            id_filter["$gt"] = ObjectId(after_id)
+        except InvalidId:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid after_id")
+
+    if collection == "ratings":
+        documents = repos.ratings.scan(id_filter, EXPORT_BATCH_SIZE, updated_since=since)
+    else:
+        source = {"movies": repos.movies, "comments": repos.comments}[collection]
+        documents = source.scan(id_filter, EXPORT_BATCH_SIZE)
+    return StreamingResponse(stream_documents(documents), media_type="application/x-ndjson")
@@ -0,0 +1,76 @@
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Literal
+from fastapi import APIRouter, Depends, Query
+from schemas import schemas
+from cache import TTLCache
+from repositories import MovieRepo, Repositories, get_repos
+from serialization import MOVIE_FIELDS, MOVIE_STAT_FIELDS, BSONResponse
+from routers.movie import movie_out, movie_projection
+
+logger = logging.getLogger("leaderboard")
+
+router = APIRouter(tags=["Leaderboards"])
+
+LEADERBOARD_TTL_SECONDS = float(os.getenv("LEADERBOARD_TTL_SECONDS", "60"))
+# Number of "virtual" votes at the global mean that every movie starts with
+BAYESIAN_PRIOR_WEIGHT = float(os.getenv("BAYESIAN_PRIOR_WEIGHT", "10"))
+# Weight of one comment relative to a maximum-score rating in the trending score
+TRENDING_COMMENT_WEIGHT = float(os.getenv("TRENDING_COMMENT_WEIGHT", "0.5"))
+
+TRENDING_WINDOWS = {
+    "1h": timedelta(hours=1),
+    "24h": timedelta(hours=24),
+    "7d": timedelta(days=7),
+    "30d": timedelta(days=30),
+}
+
+leaderboard_cache = TTLCache(maxsize=64, ttl=LEADERBOARD_TTL_SECONDS)
+
+async def build_entries(movies: MovieRepo, rows: list) -> List[dict]:
+    found = await movies.get_many([row["_id"] for row in rows], movie_projection(MOVIE_FIELDS, MOVIE_STAT_FIELDS))
+    movies_by_id = {str(movie["_id"]): movie for movie in found}
+
+    entries = []
+    for row in rows:
+        movie = movies_by_id.get(row["_id"])
+        if movie is None:
+            continue
+        rating_count = row.get("rating_count", 0)
+        # Mapped like the movie endpoints, so documents with null fields still serialize
+        entries.append({
+            "movie": movie_out(movie, MOVIE_FIELDS, MOVIE_STAT_FIELDS),
+            "score": row["score"],
+            "rating_count": rating_count,
+            "avg_rating": row["rating_sum"] / rating_count if rating_count else None,
+            "comment_count": row.get("comment_count"),
+        })
+    return entries
+
+@router.get("/movies/top", response_model=List[schemas.LeaderboardEntry])
+async def get_top_movies(limit: int = Query(10, ge=1, le=100), repos: Repositories = Depends(get_repos)):
+    logger.info("Received request to retrieve top rated movies")
+    key = ("top", limit)
+    entries = leaderboard_cache.get(key)
+    if entries is None:
+        rows = await repos.leaderboards.top_rated(limit, BAYESIAN_PRIOR_WEIGHT)
+        entries = await build_entries(repos.movies, rows)
+        leaderboard_cache.set(key, entries)
+    return BSONResponse(entries)
+
+@router.get("/movies/trending", response_model=List[schemas.LeaderboardEntry])
+async def get_trending_movies(
+    window: Literal["1h", "24h", "7d", "30d"] = "24h",
+    limit: int = Query(10, ge=1, le=100),
+    repos: Repositories = Depends(get_repos)
+):
+    logger.info("Received request to retrieve trending movies for window %s", window)
+    key = ("trending", window, limit)
+    entries = leaderboard_cache.get(key)
+    if entries is None:
+        since = datetime.now(timezone.utc) - TRENDING_WINDOWS[window]
+        rows = await repos.leaderboards.trending(since, limit, TRENDING_COMMENT_WEIGHT)
+        entries = await build_entries(repos.movies, rows)
+        leaderboard_cache.set(key, entries)
+    return BSONResponse(entries)
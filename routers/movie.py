@@ -1,85 +1,204 @@
 # routers/movie.py
-from fastapi import APIRouter, Depends, status, HTTPException
-from typing import List
-from bson import ObjectId
+from fastapi import APIRouter, Depends, status, HTTPException, Query, Request, Response
+from typing import List, Literal, Optional
+from datetime import datetime
 import logging
 from schemas import schemas
 from oauth2 import get_current_user
-from database.database import get_db
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from pagination import InvalidCursor, encode_cursor
+from repositories import MovieRepo, Repositories, get_repos
+import rating_stats
+import movie_import
+import batch
+from title_index import title_index
+import http_cache
+from cache import response_cache
+from serialization import MOVIE_FIELDS, MOVIE_STAT_FIELDS, BSONResponse, respond, select_fields, to_out
 
 logger = logging.getLogger("movies")
 
+# Movie counters the avg_rating/rating_count fields are derived from
+RATING_COUNTERS = ("rating_count", "rating_sum")
+
+def movie_fields(fields: Optional[str]):
+    """Split a `fields` selection into stored movie fields and rating fields."""
+    selected = select_fields(fields, MOVIE_FIELDS + MOVIE_STAT_FIELDS)
+    return (
+        tuple(field for field in selected if field not in MOVIE_STAT_FIELDS),
+        tuple(field for field in selected if field in MOVIE_STAT_FIELDS)
+    )
+
+def movie_projection(stored: tuple, computed: tuple) -> tuple:
+    return stored + RATING_COUNTERS if computed else stored
+
+def movie_out(movie: dict, stored: tuple, computed: tuple) -> dict:
+    out = to_out(movie, stored)
+    if computed:
+        stats = {"count": movie.get("rating_count"), "sum": movie.get("rating_sum")}
+        out.update((key, value) for key, value in rating_stats.rating_fields(stats).items() if key in computed)
+    return out
+
 router = APIRouter(tags=["Movies"])
 
+async def raise_missing_or_forbidden(movies: MovieRepo, movie_id: str, action: str):
+    # Writes filter on the owner, so a miss is either a missing movie or someone else's
+    if await movies.exists(movie_id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Not authorized to {action} this movie")
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Movie not found")
+
 @router.post("/movies", response_model=schemas.MovieResponse)
 async def create_movie_endpoint(
     request: schemas.Movie,
-    db: AsyncIOMotorDatabase = Depends(get_db),
+    repos: Repositories = Depends(get_repos),
     get_current_user: schemas.User = Depends(get_current_user)
 ):
     logger.info("Received request to create a new movie")
     movie_data = request.dict()
     movie_data["user_id"] = str(get_current_user.id)
     
-    result = await db["movies"].insert_one(movie_data)
-    created_movie = await db["movies"].find_one({"_id": result.inserted_id})
-    
-    # Convert MongoDB _id to id and map the movie fields
-    movie_data = {
-        "id": str(created_movie["_id"]),  # Convert ObjectId to string
-        **{key: created_movie[key] for key in created_movie if key != "_id"}  # Include other fields
-    }
+    movie_id = await repos.movies.insert(movie_data)
+    title_index.add(movie_id, movie_data["title"])
+    await response_cache.invalidate(tags=[http_cache.MOVIES_KEY])
+    await http_cache.bump(repos.versions, http_cache.MOVIES_KEY)
     
-    return schemas.MovieResponse(**movie_data)
+    # insert stores the generated _id on movie_data, so no re-read is needed
+    return schemas.MovieResponse(
+        id=movie_id,
+        **{key: movie_data[key] for key in movie_data if key != "_id"}
+    )
 
-@router.get("/movies", response_model=List[schemas.MovieResponse])
-async def get_movies_endpoint(db: AsyncIOMotorDatabase = Depends(get_db)):
-    logger.info("Received request to retrieve all movies")
-    movies = await db["movies"].find().to_list(length=100)
-    
-    # Convert MongoDB _id to id for each movie
-    movie_list = [
-        schemas.MovieResponse(
-            id=str(movie["_id"]),
-            **{key: movie[key] for key in movie if key != "_id"}
-        ) for movie in movies
-    ]
-    return movie_list
+@router.post("/movies/bulk", response_model=schemas.ImportReport)
+async def bulk_import_movies_endpoint(
+    request: Request,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    offset: int = Query(0, ge=0),
+    batch_size: int = Query(movie_import.DEFAULT_BATCH_SIZE, ge=1, le=10000),
+    repos: Repositories = Depends(get_repos),
+    get_current_user: schemas.User = Depends(get_current_user)
+):
+    logger.info("Received request to bulk import movies from %s", format)
+    rows = movie_import.iter_rows(movie_import.iter_lines(request.stream()), format)
+    report = await movie_import.import_movies(repos.movies, rows, str(get_current_user.id), offset, batch_size)
+    if report.inserted:
+        await response_cache.invalidate(tags=[http_cache.MOVIES_KEY])
+        await http_cache.bump(repos.versions, http_cache.MOVIES_KEY)
+    logger.info("Bulk import finished with %s inserted and %s failed", report.inserted, report.failed)
+    return report
+
+@router.get("/movies", response_model=schemas.MoviePage)
+async def get_movies_endpoint(
+    request: Request,
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    sort: Literal["_id", "release_date"] = "_id",
+    order: Literal["asc", "desc"] = "asc",
+    genre: Optional[str] = None,
+    language: Optional[str] = None,
+    director: Optional[str] = None,
+    released_from: Optional[datetime] = None,
+    released_to: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    repos: Repositories = Depends(get_repos)
+):
+    logger.info("Received request to retrieve movies")
+    stored, computed = movie_fields(fields)
+    not_modified = await http_cache.conditional(request, response, repos.versions, http_cache.MOVIES_KEY)
+    if not_modified:
+        return not_modified
+
+    async def load():
+        filters = {field: value for field, value in (("genre", genre), ("language", language), ("director", director)) if value is not None}
+        try:
+            # Fetch one extra document to learn whether another page exists
+            movies = await repos.movies.list(
+                filters, released_from, released_to,
+                sort=sort, descending=order == "desc", cursor=cursor, limit=limit + 1, fields=movie_projection(stored, computed)
+            )
+        except InvalidCursor:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        next_cursor = encode_cursor(movies[limit - 1], sort, order == "desc") if len(movies) > limit else None
+        movie_list = [movie_out(movie, stored, computed) for movie in movies[:limit]]
+        return {"items": movie_list, "next_cursor": next_cursor}
+
+    # Every filter/page combination is its own entry; any movie write drops them all
+    page = await response_cache.get_or_load(f"movies?{request.url.query}", load, tags=[http_cache.MOVIES_KEY], variant=http_cache.cache_variant(response))
+    return respond(page, response)
+
+@router.get("/movies/search", response_model=List[schemas.MovieResponse])
+async def search_movies_endpoint(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    fields: Optional[str] = None,
+    repos: Repositories = Depends(get_repos)
+):
+    logger.info("Received request to search movies for %r", q)
+    stored, computed = movie_fields(fields)
+    movies = await repos.movies.search(q, limit, movie_projection(stored, computed))
+    return BSONResponse([movie_out(movie, stored, computed) for movie in movies])
+
+@router.post("/movies/batch-get", response_model=schemas.MovieBatch)
+async def batch_get_movies_endpoint(
+    request: schemas.BatchGet,
+    fields: Optional[str] = None,
+    repos: Repositories = Depends(get_repos)
+):
+    logger.info("Received request to retrieve %s movies by id", len(request.ids))
+    batch.check_size(request.ids)
+    stored, computed = movie_fields(fields)
+    movies = await repos.movies.get_many(request.ids, movie_projection(stored, computed))
+    found = {str(movie["_id"]): movie_out(movie, stored, computed) for movie in movies}
+    items, missing = batch.in_order(request.ids, found)
+    return BSONResponse({"items": items, "missing": missing})
+
+@router.get("/movies/suggest", response_model=List[schemas.TitleSuggestion])
+async def suggest_movies_endpoint(
+    prefix: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+    repos: Repositories = Depends(get_repos)
+):
+    if title_index.ready:
+        return [schemas.TitleSuggestion(id=movie_id, title=title) for movie_id, title in title_index.suggest(prefix, limit)]
+
+    # The in-memory index is still loading; answer from Mongo meanwhile
+    movies = await repos.movies.titles_with_prefix(prefix, limit)
+    return [schemas.TitleSuggestion(id=str(movie["_id"]), title=movie["title"]) for movie in movies]
 
 @router.get("/movies/{movie_id}", response_model=schemas.MovieResponse)
-async def get_movie_endpoint(movie_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
-    logger.info(f"Received request to retrieve movie with id {movie_id}")
-    movie = await db["movies"].find_one({"_id": ObjectId(movie_id)})
-    
-    if not movie:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Movie not found")
-    
-    return schemas.MovieResponse(
-        id=str(movie["_id"]),
-        **{key: movie[key] for key in movie if key != "_id"}
-    )
+async def get_movie_endpoint(movie_id: str, request: Request, response: Response, fields: Optional[str] = None, repos: Repositories = Depends(get_repos)):
+    logger.info("Received request to retrieve movie with id %s", movie_id)
+    stored, computed = movie_fields(fields)
+    not_modified = await http_cache.conditional(request, response, repos.versions, http_cache.movie_key(movie_id))
+    if not_modified:
+        return not_modified
+
+    async def load():
+        movie = await repos.movies.get(movie_id, movie_projection(stored, computed))
+        
+        if not movie:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Movie not found")
+        
+        return movie_out(movie, stored, computed)
+
+    return respond(await response_cache.get_or_load(http_cache.movie_key(movie_id), load, variant=http_cache.cache_variant(response)), response)
 
 @router.put("/movies/{movie_id}", response_model=schemas.MovieResponse)
 async def update_movie_endpoint(
     movie_id: str,
     request: schemas.UpdateMovie,
-    db: AsyncIOMotorDatabase = Depends(get_db),
+    repos: Repositories = Depends(get_repos),
     get_current_user: schemas.User = Depends(get_current_user)
 ):
-    logger.info(f"Received request to update movie with id {movie_id}")
-    movie = await db["movies"].find_one({"_id": ObjectId(movie_id)})
-    
-    if not movie:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Movie not found")
-    
-    if str(movie["user_id"]) != str(get_current_user.id):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to update this movie")
-    
+    logger.info("Received request to update movie with id %s", movie_id)
     update_data = request.dict(exclude_unset=True)
-    await db["movies"].update_one({"_id": ObjectId(movie_id)}, {"$set": update_data})
+    updated_movie = await repos.movies.update_owned(movie_id, str(get_current_user.id), update_data)
     
-    updated_movie = await db["movies"].find_one({"_id": ObjectId(movie_id)})
+    if not updated_movie:
+        await raise_missing_or_forbidden(repos.movies, movie_id, "update")
+    
+    title_index.add(movie_id, updated_movie["title"])
+    await response_cache.invalidate(keys=[http_cache.movie_key(movie_id)], tags=[http_cache.MOVIES_KEY])
+    await http_cache.bump(repos.versions, http_cache.movie_key(movie_id), http_cache.MOVIES_KEY)
     return schemas.MovieResponse(
         id=str(updated_movie["_id"]),
         **{key: updated_movie[key] for key in updated_movie if key != "_id"}
@@ -88,17 +207,18 @@ async def update_movie_endpoint(
 @router.delete("/movies/{movie_id}")
 async def delete_movie_endpoint(
     movie_id: str,
-    db: AsyncIOMotorDatabase = Depends(get_db),
+    repos: Repositories = Depends(get_repos),
     get_current_user: schemas.User = Depends(get_current_user)
 ):
-    logger.info(f"Received request to delete movie with id {movie_id}")
-    movie = await db["movies"].find_one({"_id": ObjectId(movie_id)})
-    
-    if not movie:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Movie not found")
+    logger.info("Received request to delete movie with id %s", movie_id)
+    deleted = await repos.movies.delete_owned(movie_id, str(get_current_user.id))
     
-    if str(movie["user_id"]) != str(get_current_user.id):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to delete this movie")
+    if not deleted:
+        await raise_missing_or_forbidden(repos.movies, movie_id, "delete")
     
-    await db["movies"].delete_one({"_id": ObjectId(movie_id)})
+    await repos.ratings.delete_stats(movie_id)
+    await repos.neighbors.delete(movie_id)
+    title_index.remove(movie_id)
+    await response_cache.invalidate(keys=[http_cache.movie_key(movie_id)], tags=[http_cache.MOVIES_KEY])
+    await http_cache.bump(repos.versions, http_cache.movie_key(movie_id), http_cache.MOVIES_KEY)
     return {"detail": "Movie deleted successfully"}
@@ -0,0 +1,28 @@
+import logging
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from schemas import schemas
+import profiling
+
+logger = logging.getLogger("profiles")
+
+router = APIRouter(tags=["Admin"])
+
+def require_profile_token(x_profile_token: Optional[str] = Header(None)):
+    if not profiling.token_matches(x_profile_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to read profiles")
+
+@router.get("/admin/profiles", response_model=List[schemas.ProfileSummary], dependencies=[Depends(require_profile_token)])
+async def list_profiles():
+    return [
+        schemas.ProfileSummary(**{key: profile[key] for key in profile if key != "stacks"})
+        for profile in reversed(profiling.profiles)
+    ]
+
+@router.get("/admin/profiles/{profile_id}", response_class=PlainTextResponse, dependencies=[Depends(require_profile_token)])
+async def get_profile(profile_id: int):
+    for profile in profiling.profiles:
+        if profile["id"] == profile_id:
+            return PlainTextResponse(profiling.collapsed_stacks(profile))
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
@@ -1,11 +1,15 @@
+import asyncio
 import logging
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
-from motor.motor_asyncio import AsyncIOMotorDatabase
-from database.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from typing import List, Optional
 from schemas import schemas
-from bson import ObjectId
 import oauth2
+import rating_stats
+import batch
+import http_cache
+from cache import response_cache
+from serialization import RATING_FIELDS, respond, select_fields, to_out
+from repositories import Repositories, get_repos
 
 logger = logging.getLogger("ratings")
 
@@ -13,37 +17,91 @@ router = APIRouter(
     tags=["Ratings"]
 )
 
-# Dependency to get the MongoDB database
-def get_db() -> AsyncIOMotorDatabase:
-    from database.database import get_db
-    return get_db()
-
 @router.post("/movie/{movie_id}/rate", response_model=schemas.Rating)
-async def rate_movie(movie_id: str, request: schemas.Rating, db: AsyncIOMotorDatabase = Depends(get_db), get_current_user: schemas.User = Depends(oauth2.get_current_user)):
-    logger.info(f"Received request to rate movie with id {movie_id}")
+async def rate_movie(movie_id: str, request: schemas.Rating, repos: Repositories = Depends(get_repos), get_current_user: schemas.User = Depends(oauth2.get_current_user)):
+    logger.info("Received request to rate movie with id %s", movie_id)
     
-    # Create a new rating
+    # A user has one rating per movie; rating again replaces it
     new_rating = {
         "rating": request.rating,
         "movie_id": movie_id,
         "user_id": str(get_current_user.id)
     }
     
-    result = await db["ratings"].insert_one(new_rating)
-    created_rating = await db["ratings"].find_one({"_id": result.inserted_id})
+    previous = await repos.ratings.upsert(new_rating)
+    if previous != request.rating:
+        # The movie's avg_rating/rating_count counters change along with its ratings list
+        keys = [http_cache.ratings_key(movie_id), http_cache.user_ratings_key(new_rating["user_id"]), http_cache.movie_key(movie_id)]
+        await response_cache.invalidate(keys=keys, tags=[http_cache.MOVIES_KEY])
+        await http_cache.bump(repos.versions, *keys, http_cache.MOVIES_KEY)
     
-    logger.info(f"Rating created successfully for movie with id {movie_id}")
-    return schemas.Rating(**created_rating)
+    if previous is None:
+        logger.info("Rating created successfully for movie with id %s", movie_id)
+    else:
+        logger.info("Rating for movie with id %s changed from %s to %s", movie_id, previous, request.rating)
+    return schemas.Rating(**new_rating)
 
 @router.get("/movie/{movie_id}/ratings", response_model=List[schemas.Rating])
-async def get_all_ratings(movie_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
-    logger.info(f"Received request to retrieve ratings for movie with id {movie_id}")
-    
-    ratings = await db["ratings"].find({"movie_id": movie_id}).to_list(length=100)
-    
-    if not ratings:
-        logger.info(f"No ratings found for movie with id {movie_id}")
-    else:
-        logger.info(f"Ratings retrieved successfully for movie with id {movie_id}")
-    
-    return [schemas.RatingResponse(**rating) for rating in ratings]
+async def get_all_ratings(movie_id: str, request: Request, response: Response, fields: Optional[str] = None, repos: Repositories = Depends(get_repos)):
+    logger.info("Received request to retrieve ratings for movie with id %s", movie_id)
+    selected = select_fields(fields, RATING_FIELDS)
+    not_modified = await http_cache.conditional(request, response, repos.versions, http_cache.ratings_key(movie_id))
+    if not_modified:
+        return not_modified
+
+    async def load():
+        ratings = await repos.ratings.list_for_movie(movie_id, selected)
+        
+        if not ratings:
+            logger.info("No ratings found for movie with id %s", movie_id)
+        else:
+            logger.info("Ratings retrieved successfully for movie with id %s", movie_id)
+        
+        return [to_out(rating, selected, with_id=False) for rating in ratings]
+
+    return respond(await response_cache.get_or_load(http_cache.ratings_key(movie_id), load, variant=http_cache.cache_variant(response)), response)
+
+@router.get("/user/{user_id}/ratings", response_model=List[schemas.Rating])
+async def get_user_ratings(
+    user_id: str,
+    request: Request,
+    response: Response,
+    after: Optional[str] = Query(None, description="Return ratings for movie ids after this one"),
+    limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[str] = None,
+    repos: Repositories = Depends(get_repos)
+):
+    logger.info("Received request to retrieve ratings by user with id %s", user_id)
+    selected = select_fields(fields, RATING_FIELDS)
+    not_modified = await http_cache.conditional(request, response, repos.versions, http_cache.user_ratings_key(user_id))
+    if not_modified:
+        return not_modified
+
+    async def load():
+        # Ordered by movie_id, so the last movie_id of a page is the next `after`
+        ratings = await repos.ratings.list_for_user(user_id, selected, after, limit)
+        return [to_out(rating, selected, with_id=False) for rating in ratings]
+
+    return respond(await response_cache.get_or_load(http_cache.user_ratings_key(user_id), load, variant=http_cache.cache_variant(response)), response)
+
+@router.get("/movie/{movie_id}/rating-summary", response_model=schemas.RatingSummary)
+async def get_rating_summary(movie_id: str, repos: Repositories = Depends(get_repos)):
+    logger.info("Received request to retrieve rating summary for movie with id %s", movie_id)
+    stats = await repos.ratings.stats(movie_id)
+    return rating_stats.summary_from_stats(movie_id, stats)
+
+@router.post("/rating-summaries/batch-get", response_model=schemas.RatingSummaryBatch)
+async def get_rating_summaries(request: schemas.BatchGet, repos: Repositories = Depends(get_repos)):
+    logger.info("Received request to retrieve rating summaries for %s movies", len(request.ids))
+    batch.check_size(request.ids)
+    # Movies without ratings still get an empty summary; only unknown movies are missing
+    movies, stats = await asyncio.gather(
+        repos.movies.get_many(request.ids, fields=()),
+        repos.ratings.stats_many(request.ids)
+    )
+    found = {
+        str(movie["_id"]): rating_stats.summary_from_stats(str(movie["_id"]), stats.get(str(movie["_id"])))
+        for movie in movies
+    }
+    items, missing = batch.in_order(request.ids, found)
+    return schemas.RatingSummaryBatch(items=items, missing=missing)
@@ -0,0 +1,26 @@
+import logging
+from typing import List
+from fastapi import APIRouter, Depends, Query
+from schemas import schemas
+import recommendations
+from repositories import Repositories, get_repos
+
+logger = logging.getLogger("recommendations")
+
+router = APIRouter(tags=["Recommendations"])
+
+# Both read the neighbor lists the refresh job precomputes, so they lag new
+# ratings by up to one refresh. Fetch movie details with /movies/batch-get.
+
+@router.get("/movies/{movie_id}/similar", response_model=List[schemas.ScoredMovie])
+async def get_similar_movies(movie_id: str, limit: int = Query(10, ge=1, le=recommendations.RECOMMEND_NEIGHBORS), repos: Repositories = Depends(get_repos)):
+    logger.info("Received request to retrieve movies similar to movie with id %s", movie_id)
+    neighbors = await repos.neighbors.get(movie_id)
+    return neighbors[:limit]
+
+@router.get("/user/{user_id}/recommendations", response_model=List[schemas.ScoredMovie])
+async def get_recommendations(user_id: str, limit: int = Query(20, ge=1, le=100), repos: Repositories = Depends(get_repos)):
+    logger.info("Received request to retrieve recommendations for user with id %s", user_id)
+    ratings = await repos.ratings.list_for_user(user_id, ("movie_id", "rating"), limit=recommendations.RECOMMEND_MAX_USER_RATINGS)
+    neighbors = await repos.neighbors.get_many(rating["movie_id"] for rating in ratings)
+    return recommendations.recommend(ratings, neighbors, limit)
@@ -1,6 +1,6 @@
 from datetime import datetime
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
 from bson import ObjectId 
 
 class User(BaseModel):
@@ -32,6 +32,11 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     id: str  # Changed to str to match MongoDB ObjectId type
+    # Profile claims, only present on tokens issued in stateless auth mode
+    username: Optional[str] = None
+    email: Optional[str] = None
+    firstName: Optional[str] = None
+    lastName: Optional[str] = None
 
 class Movie(BaseModel):
     title: str
@@ -52,20 +57,75 @@ class MovieResponse(BaseModel):
     synopsis: str
     language: str
     release_date: datetime
+    avg_rating: Optional[float] = None
+    rating_count: Optional[int] = None
+    comment_count: Optional[int] = None
+    last_activity_at: Optional[datetime] = None
     
     class Config:
         orm_mode = True
 
+class MoviePage(BaseModel):
+    items: List[MovieResponse]
+    next_cursor: Optional[str] = None
+
+class BatchGet(BaseModel):
+    ids: List[str]
+
+class MovieBatch(BaseModel):
+    items: List[MovieResponse]
+    missing: List[str] = []
+
+class TitleSuggestion(BaseModel):
+    id: str
+    title: str
+
+class LeaderboardEntry(BaseModel):
+    movie: MovieResponse
+    score: float
+    rating_count: int = 0
+    avg_rating: Optional[float] = None
+    comment_count: Optional[int] = None
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class ImportReport(BaseModel):
+    inserted: int = 0
+    failed: int = 0
+    errors: List[ImportRowError] = []
+    # Row to pass as `offset` to resume after this import
+    next_offset: int = 0
+
 class UpdateMovie(Movie):
     pass
 
 class Rating(BaseModel):
-    rating: float
+    rating: float = Field(..., ge=0, le=10)
     movie_id: str  # Changed to str to match MongoDB ObjectId type
     
     class Config:
         orm_mode = True
 
+class ScoredMovie(BaseModel):
+    movie_id: str
+    # Similarity for similar movies, predicted rating for recommendations
+    score: float
+
+class RatingSummary(BaseModel):
+    movie_id: str
+    count: int = 0
+    sum: float = 0.0
+    mean: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    histogram: List[int]
+
+class RatingSummaryBatch(BaseModel):
+    items: List[RatingSummary]
+    missing: List[str] = []
+
 class Comment(BaseModel):
     content: str
     movie_id: str  # Changed to str to match MongoDB ObjectId type
@@ -76,7 +136,30 @@ class CommentResponse(BaseModel):
     content: str
     movie_id: str  
     user_id: str
+    reply_count: Optional[int] = None
     class Config:
         orm_mode = True
 
+class CommentNode(CommentResponse):
+    parent_id: Optional[str] = None
+    depth: int = 0
+    replies: List["CommentNode"] = []
+
+class CommentTree(BaseModel):
+    items: List[CommentNode]
+    truncated: bool = False
+
+class ProfileSummary(BaseModel):
+    id: int
+    method: str
+    path: str
+    route: Optional[str] = None
+    status: int
+    reason: str
+    started_at: datetime
+    duration_ms: float
+    samples: int
+    breakdown_ms: Dict[str, float]
+
 CommentResponse.update_forward_refs()
+CommentNode.update_forward_refs()
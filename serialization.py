@@ -0,0 +1,57 @@
+from typing import Any, Optional, Tuple
+import orjson
+from bson import ObjectId
+from fastapi import HTTPException, Response, status
+from schemas import schemas
+
+# Read endpoints map trusted Mongo documents straight onto these field lists
+# and dump them with orjson instead of validating them through the response
+# model. The models stay the source of truth for field names and the docs.
+# Derived from the movie's rating_count/rating_sum counters
+MOVIE_STAT_FIELDS = ("avg_rating", "rating_count")
+MOVIE_FIELDS = tuple(field for field in schemas.MovieResponse.__fields__ if field != "id" and field not in MOVIE_STAT_FIELDS)
+COMMENT_FIELDS = tuple(field for field in schemas.CommentResponse.__fields__ if field != "id")
+RATING_FIELDS = tuple(schemas.Rating.__fields__)
+
+def _default(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps(content: Any) -> bytes:
+    # orjson handles datetime natively; ObjectId goes through _default
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+def select_fields(fields: Optional[str], allowed: Tuple[str, ...]) -> Tuple[str, ...]:
+    """Parse a comma separated `fields` query parameter into a subset of `allowed`.
+
+    Returns `allowed` when no fields are requested; the id is always sent.
+    """
+    requested = {field.strip() for field in (fields or "").split(",") if field.strip()} - {"id"}
+    if not requested:
+        return allowed
+    unknown = requested - set(allowed)
+    if unknown:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(field for field in allowed if field in requested)
+
+def to_out(document: dict, fields: Tuple[str, ...], with_id: bool = True) -> dict:
+    """Map a Mongo document onto response fields; missing fields become null."""
+    out = {"id": str(document["_id"])} if with_id else {}
+    for field in fields:
+        out[field] = document.get(field)
+    return out
+
+class BSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def respond(content: Any, response: Response) -> BSONResponse:
+    """Wrap content in a BSONResponse carrying the headers set on the injected
+    `response` (ETag, Cache-Control), which FastAPI drops when a handler
+    returns its own Response."""
+    out = BSONResponse(content)
+    out.headers.raw.extend(response.headers.raw)
+    return out
@@ -0,0 +1,11 @@
+import os
+import tempfile
+
+# Read at import time by log, jwt_token and hashing. Logs stay out of the
+# tracked app.log, and only warnings are written.
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "movie-listing-tests.log"))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
@@ -1,93 +1,98 @@
+import json
+from datetime import datetime, timedelta, timezone
 import pytest
+from bson import ObjectId
 from fastapi.testclient import TestClient
-from pymongo import MongoClient
-from datetime import datetime
-from ..main import app
-from schemas.schemas import User, Movie, Comment, Rating
-from jwt_token import create_access_token
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# MongoDB test database setup
-MONGO_DB_URL = os.getenv("MONGO_DB_URL")
-client = MongoClient(MONGO_DB_URL)
-db = client["test_database"]
-
-# Create a test client
+from main import app
+from cache import MemoryBackend, configure_response_cache
+from repositories import get_repos, memory_repositories
+from routers.leaderboard import leaderboard_cache
+import http_cache
+import oauth2
+
+# No `with` block: the lifespan (Mongo, indexes, title index) is not run
 test_client = TestClient(app)
 
-# Override the database dependency with test database
-def override_get_db():
-    try:
-        yield db
-    finally:
-        # No need to close MongoDB client explicitly
-        pass
-
-app.dependency_overrides[get_db] = override_get_db
+MOVIE = {
+    "title": "Test Movie",
+    "release_date": "2024-08-14",
+    "genre": "Drama",
+    "director": "John Doe",
+    "synopsis": "A drama-packed movie.",
+    "runtime": 150,
+    "language": "English",
+}
 
 @pytest.fixture(scope="function", autouse=True)
 def setup_database():
-    # Drop collections before each test
-    db.users.drop()
-    db.movies.drop()
-    db.ratings.drop()
-    db.comments.drop()
-    yield
-    # Drop collections after each test
-    db.users.drop()
-    db.movies.drop()
-    db.ratings.drop()
-    db.comments.drop()
-
-def authenticate_test_user():
+    # A fresh in-memory store per test, and no state cached from the last one
+    repos = memory_repositories()
+    app.dependency_overrides[get_repos] = lambda: repos
+    configure_response_cache(MemoryBackend())
+    http_cache.version_cache.clear()
+    leaderboard_cache.clear()
+    oauth2.clear_user_cache()
+    yield repos
+    app.dependency_overrides.clear()
+
+def signup(username="testuser"):
+    return test_client.post("/signup", json={
+        "id": "",
+        "username": username,
+        "password": "password123",
+        "email": f"{username}@example.com",
+        "firstName": "Test",
+        "lastName": "User"
+    })
+
+def authenticate_test_user(username="testuser"):
+    signup(username)
     response = test_client.post(
         "/login",
-        data={"username": "testuser", "password": "password123"},
+        data={"username": username, "password": "password123"},
     )
     assert response.status_code == 200, "Authentication failed"
     token_data = response.json()
     assert "access_token" in token_data, f"Expected 'access_token' in response, got {token_data}"
     return token_data["access_token"]
 
-@pytest.fixture(scope="module")
+@pytest.fixture
 def token():
     return authenticate_test_user()
 
+def auth(token):
+    return {"Authorization": f"Bearer {token}"}
+
+def create_movie(token, **fields):
+    response = test_client.post("/movies", headers=auth(token), json={**MOVIE, **fields})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def rate(token, movie_id, rating):
+    return test_client.post(f"/movie/{movie_id}/rate", headers=auth(token), json={"rating": rating, "movie_id": movie_id})
+
+def rate_movie(token, rating=5):
+    movie = create_movie(token, title="Test Movie for Rating")
+    response = rate(token, movie["id"], rating)
+    assert response.status_code == 200, response.text
+    return movie
+
 def test_signup():
-    response = test_client.post("/signup", json={
-        "username": "testuser",
-        "password": "password123",
-        "email": "testuser@example.com",
-        "firstName": "Test",
-        "lastName": "User"
-    })
+    response = signup()
     assert response.status_code == 201
     assert response.json()["username"] == "testuser"
 
+    response = signup()
+    assert response.status_code == 400
+
 def test_get_user():
-    # First create a user
-    test_client.post("/signup", json={
-        "username": "testuser",
-        "password": "password123",
-        "email": "testuser@example.com",
-        "firstName": "Test",
-        "lastName": "User"
-    })
-    response = test_client.get("/user/1")
+    user_id = signup().json()["id"]
+    response = test_client.get(f"/user/{user_id}")
     assert response.status_code == 200
     assert response.json()["username"] == "testuser"
 
 def test_login():
-    test_client.post("/signup", json={
-        "username": "testuser",
-        "password": "password123",
-        "email": "testuser@example.com",
-        "firstName": "Test",
-        "lastName": "User"
-    })
+    signup()
     response = test_client.post("/login", data={
         "username": "testuser",
         "password": "password123",
@@ -97,14 +102,7 @@ def test_login():
     assert response.json()["token_type"] == "bearer"
 
 def test_login_invalid_password():
-    # First create a user
-    test_client.post("/signup", json={
-        "username": "testuser",
-        "password": "password123",
-        "email": "testuser@example.com",
-        "firstName": "Test",
-        "lastName": "User"
-    })
+    signup()
     response = test_client.post("/login", data={
         "username": "testuser",
         "password": "wrongpassword",
@@ -113,157 +111,308 @@ def test_login_invalid_password():
     assert response.json()["detail"] == "Invalid username or password"
 
 def test_create_movie(token):
+    movie = create_movie(token)
+    assert movie["title"] == "Test Movie"
+    assert movie["rating_count"] == 0
+
+    response = test_client.post("/movies", json=MOVIE)
+    assert response.status_code == 401
+
+def test_get_movies(token):
+    create_movie(token)
+
+    response = test_client.get("/movies")
+    assert response.status_code == 200
+    assert len(response.json()["items"]) > 0
+
+def test_get_movies_paginated(token):
+    # Create two movies so the first page has a follow-up
+    create_movie(token)
+    create_movie(token)
+
+    response = test_client.get("/movies", params={"limit": 1, "genre": "Drama"})
+    assert response.status_code == 200
+    first_page = response.json()
+    assert len(first_page["items"]) == 1
+    assert first_page["next_cursor"] is not None
+
+    response = test_client.get("/movies", params={"limit": 1, "genre": "Drama", "cursor": first_page["next_cursor"]})
+    assert response.status_code == 200
+    second_page = response.json()
+    assert len(second_page["items"]) == 1
+    assert second_page["items"][0]["id"] != first_page["items"][0]["id"]
+
+def test_get_movies_invalid_cursor():
+    response = test_client.get("/movies", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+def test_get_movies_sparse_fields(token):
+    create_movie(token)
+
+    response = test_client.get("/movies", params={"fields": "title,avg_rating"})
+    assert response.status_code == 200
+    assert set(response.json()["items"][0]) == {"id", "title", "avg_rating"}
+
+    response = test_client.get("/movies", params={"fields": "password"})
+    assert response.status_code == 400
+
+def test_bulk_import_movies(token):
+    body = "\n".join([
+        '{"title": "Bulk One", "release_date": "2024-08-14", "genre": "Drama", "director": "John Doe", "synopsis": "One.", "language": "English"}',
+        '{"title": "Missing fields"}',
+        'not json',
+        '{"title": "Bulk Two", "release_date": "2024-08-15", "genre": "Drama", "director": "John Doe", "synopsis": "Two.", "language": "English"}',
+    ])
     response = test_client.post(
-        "/movies/",
-        headers={"Authorization": f"Bearer {token}"},
-        json={
-            "title": "Test Movie",
-            "release_date": "2024-08-14",
-            "genre": "Drama",
-            "director": "John Doe",
-            "synopsis": "A drama-packed movie.",
-            "runtime": 150,
-            "language": "English",
-        }
+        "/movies/bulk",
+        headers={**auth(token), "Content-Type": "application/x-ndjson"},
+        content=body
     )
     assert response.status_code == 200, response.text
-    assert response.json()["title"] == "Test Movie"
+    report = response.json()
+    assert report["inserted"] == 2
+    assert report["failed"] == 2
+    assert [error["row"] for error in report["errors"]] == [1, 2]
+    assert report["next_offset"] == 4
+
+    titles = [movie["title"] for movie in test_client.get("/movies").json()["items"]]
+    assert sorted(titles) == ["Bulk One", "Bulk Two"]
 
-def test_get_movies():
-    # Create a movie to ensure there's data
-    test_create_movie(token)
+def test_batch_get_movies(token):
+    first = create_movie(token)["id"]
+    missing = "000000000000000000000000"
 
-    response = test_client.get("/movies/")
+    response = test_client.post("/movies/batch-get", json={"ids": [missing, first, "not-an-id"]})
     assert response.status_code == 200
-    assert len(response.json()) > 0
+    batch = response.json()
+    assert [movie["id"] for movie in batch["items"]] == [first]
+    assert batch["missing"] == [missing, "not-an-id"]
+
+def test_search_movies(token):
+    create_movie(token)
+
+    response = test_client.get("/movies/search", params={"q": "drama"})
+    assert response.status_code == 200
+    assert response.json()[0]["title"] == "Test Movie"
+
+def test_suggest_movies(token):
+    create_movie(token)
+
+    response = test_client.get("/movies/suggest", params={"prefix": "test m"})
+    assert response.status_code == 200
+    assert response.json()[0]["title"] == "Test Movie"
+
+def test_get_movies_not_modified(token):
+    create_movie(token)
+
+    response = test_client.get("/movies")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = test_client.get("/movies", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    # A write bumps the version, so the old tag no longer matches
+    create_movie(token)
+    response = test_client.get("/movies", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert len(response.json()["items"]) == 2
 
-def test_get_movie():
-    # Create a movie first
-    test_create_movie(token)
+def test_get_movie(token):
+    movie_id = create_movie(token)["id"]
 
-    movie_id = "1"  # Replace with dynamic ID retrieval if necessary
     response = test_client.get(f"/movies/{movie_id}")
     assert response.status_code == 200
     assert response.json()["title"] == "Test Movie"
 
-def test_update_movie():
-    # Create a movie first
-    test_create_movie(token)
+    response = test_client.get("/movies/000000000000000000000000")
+    assert response.status_code == 404
+
+def test_update_movie(token):
+    movie_id = create_movie(token)["id"]
 
-    movie_id = "1"  # Replace with dynamic ID retrieval if necessary
     response = test_client.put(
         f"/movies/{movie_id}",
-        headers={"Authorization": f"Bearer {token}"},
-        json={"title": "Updated Movie Title"}
+        headers=auth(token),
+        json={**MOVIE, "title": "Updated Movie Title"}
     )
     assert response.status_code == 200
     assert response.json()["title"] == "Updated Movie Title"
+    assert test_client.get(f"/movies/{movie_id}").json()["title"] == "Updated Movie Title"
 
-def test_delete_movie():
-    # Create a movie first
-    test_create_movie(token)
-
-    movie_id = "1"  # Replace with dynamic ID retrieval if necessary
-    response = test_client.delete(
+    # Only the owner may change a movie
+    response = test_client.put(
         f"/movies/{movie_id}",
-        headers={"Authorization": f"Bearer {token}"}
+        headers=auth(authenticate_test_user("otheruser")),
+        json={**MOVIE, "title": "Hijacked"}
     )
+    assert response.status_code == 403
+
+def test_delete_movie(token):
+    movie_id = create_movie(token)["id"]
+
+    response = test_client.delete(f"/movies/{movie_id}", headers=auth(token))
     assert response.status_code == 200
-    assert response.json() == {"message": "Movie deleted successfully"}
+    assert response.json() == {"detail": "Movie deleted successfully"}
 
     # Check if the movie is really deleted
     response = test_client.get(f"/movies/{movie_id}")
     assert response.status_code == 404
 
-def test_rate_movie():
-    # First, authenticate the user
-    token = authenticate_test_user()
-
-    # Create a movie to rate
-    test_client.post(
-        "/movies/",
-        headers={"Authorization": f"Bearer {token}"},
-        json={
-            "title": "Test Movie for Rating",
-            "release_date": "2024-08-14",
-            "genre": "Drama",
-            "director": "John Doe",
-            "synopsis": "A drama-packed movie.",
-            "runtime": 150,
-            "language": "English",
-        }
-    )
+def test_rate_movie(token):
+    movie = create_movie(token)
 
-    # Rate the movie
-    response = test_client.post(
-        "/movie/1/rate",
-        headers={"Authorization": f"Bearer {token}"},
-        json={"rating": 5}
-    )
+    response = rate(token, movie["id"], 5)
     assert response.status_code == 200
     assert response.json()["rating"] == 5
 
-def test_get_all_ratings():
-    # Create a movie and rate it
-    test_rate_movie()
+    rated = test_client.get(f"/movies/{movie['id']}").json()
+    assert rated["rating_count"] == 1
+    assert rated["avg_rating"] == 5
 
-    response = test_client.get("/movie/1/ratings")
+def test_get_all_ratings(token):
+    movie_id = rate_movie(token)["id"]
+
+    response = test_client.get(f"/movie/{movie_id}/ratings")
     assert response.status_code == 200
     assert len(response.json()) > 0
     assert response.json()[0]["rating"] == 5
 
-def test_create_comment():
-    # First, authenticate the user
-    token = authenticate_test_user()
-
-    # Create a movie to comment on
-    test_client.post(
-        "/movies/",
-        headers={"Authorization": f"Bearer {token}"},
-        json={
-            "title": "Test Movie for Comment",
-            "release_date": "2024-08-14",
-            "genre": "Comedy",
-            "director": "Jane Smith",
-            "synopsis": "A comedy-packed movie.",
-            "runtime": 110,
-            "language": "English",
-        }
-    )
+def test_rating_again_replaces_rating(token):
+    movie_id = rate_movie(token)["id"]
 
-    # Add a comment to the movie
-    response = test_client.post(
-        "/movie/1/comment",
-        headers={"Authorization": f"Bearer {token}"},
-        json={
-            "content": "Great movie!",
-            "parent_id": None
-        }
+    response = rate(token, movie_id, 8)
+    assert response.status_code == 200
+    ratings = test_client.get(f"/movie/{movie_id}/ratings").json()
+    assert [rating["rating"] for rating in ratings] == [8]
+    assert test_client.get(f"/movie/{movie_id}/rating-summary").json()["count"] == 1
+
+def test_get_user_ratings():
+    user_id = signup().json()["id"]
+    movie_id = rate_movie(authenticate_test_user())["id"]
+
+    response = test_client.get(f"/user/{user_id}/ratings")
+    assert response.status_code == 200
+    assert [rating["movie_id"] for rating in response.json()] == [movie_id]
+
+def test_get_rating_summary(token):
+    movie_id = rate_movie(token)["id"]
+
+    response = test_client.get(f"/movie/{movie_id}/rating-summary")
+    assert response.status_code == 200
+    summary = response.json()
+    assert summary["count"] > 0
+    assert summary["mean"] == 5
+    assert summary["histogram"][5] > 0
+
+def test_batch_get_rating_summaries(token):
+    first = rate_movie(token)["id"]
+
+    response = test_client.post("/rating-summaries/batch-get", json={"ids": [first, "not-an-id"]})
+    assert response.status_code == 200
+    batch = response.json()
+    assert batch["items"][0]["movie_id"] == first
+    assert batch["missing"] == ["not-an-id"]
+
+def test_get_top_movies(token):
+    rate_movie(token)
+
+    response = test_client.get("/movies/top")
+    assert response.status_code == 200
+    assert len(response.json()) > 0
+    assert response.json()[0]["movie"]["title"] == "Test Movie for Rating"
+
+def test_top_movies_serialize_movies_with_null_fields(setup_database, token):
+    movie_id = rate_movie(token)["id"]
+    setup_database.movies.documents[ObjectId(movie_id)].update(synopsis=None, language=None)
+
+    response = test_client.get("/movies/top")
+    assert response.status_code == 200
+    assert response.json()[0]["movie"]["synopsis"] is None
+
+def test_get_trending_movies(token):
+    rate_movie(token)
+
+    response = test_client.get("/movies/trending", params={"window": "1h"})
+    assert response.status_code == 200
+    assert len(response.json()) > 0
+
+def test_export_ratings(token):
+    rate_movie(token)
+
+    response = test_client.get("/export/ratings", headers=auth(token))
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0]["rating"] == 5
+
+    response = test_client.get(
+        "/export/ratings",
+        headers=auth(token),
+        params={"after_id": lines[-1]["id"]}
     )
     assert response.status_code == 200
-    assert response.json()["content"] == "Great movie!"
+    assert response.text == ""
+
+    response = test_client.get("/export/ratings", headers=auth(token), params={"after_id": "not-an-id"})
+    assert response.status_code == 400
+
+def test_export_ratings_since_includes_re_ratings(setup_database, token):
+    movie_id = rate_movie(token)["id"]
+    [rating] = setup_database.ratings.by_movie[movie_id].values()
+    rating["updated_at"] = datetime(2000, 1, 1, tzinfo=timezone.utc)
+    since = (datetime.now(timezone.utc) - timedelta(minutes=1)).isoformat()
+
+    response = test_client.get("/export/ratings", headers=auth(token), params={"since": since})
+    assert response.text == ""
+
+    # Re-rating keeps the rating's _id, which predates `since`
+    rate(token, movie_id, 8)
+    response = test_client.get("/export/ratings", headers=auth(token), params={"since": since})
+    assert [json.loads(line)["rating"] for line in response.text.splitlines()] == [8]
+
+def create_comment(token, movie_id, content="Great movie!", parent_id=None):
+    path = f"/movie/{movie_id}/comment" + (f"/{parent_id}" if parent_id else "")
+    response = test_client.post(path, headers=auth(token), json={"content": content, "movie_id": movie_id})
+    assert response.status_code == 200, response.text
+    return response.json()
 
-def test_get_comments():
-    # Create a comment
-    test_create_comment()
+def test_create_comment(token):
+    movie_id = create_movie(token, title="Test Movie for Comment", genre="Comedy")["id"]
 
-    response = test_client.get("/movie/1/comments")
+    comment = create_comment(token, movie_id)
+    assert comment["content"] == "Great movie!"
+    assert test_client.get(f"/movies/{movie_id}").json()["comment_count"] == 1
+
+def test_get_comments(token):
+    movie_id = create_movie(token)["id"]
+    create_comment(token, movie_id)
+
+    response = test_client.get(f"/movie/{movie_id}/comments")
     assert response.status_code == 200
     assert len(response.json()) > 0
     assert response.json()[0]["content"] == "Great movie!"
 
-def test_create_nested_comment():
-    # First, authenticate the user
-    token = authenticate_test_user()
+def test_create_nested_comment(token):
+    movie_id = create_movie(token)["id"]
+    root = create_comment(token, movie_id)
 
-    # Create a comment to nest under
-    test_create_comment()
+    reply = create_comment(token, movie_id, "I agree!", parent_id=root["id"])
+    assert reply["content"] == "I agree!"
+    response = test_client.get(f"/movie/{movie_id}/comment/{root['id']}")
+    assert [comment["content"] for comment in response.json()] == ["I agree!"]
 
-    # Add a nested comment to the existing comment
-    response = test_client.post(
-        "/movie/1/comment/1",
-        headers={"Authorization": f"Bearer {token}"},
-        json={"content": "I agree!"}
-    )
+def test_get_comment_tree(token):
+    movie_id = create_movie(token)["id"]
+
+    # Create a root comment and a reply to it
+    root = create_comment(token, movie_id)
+    create_comment(token, movie_id, "I agree!", parent_id=root["id"])
+
+    response = test_client.get(f"/movie/{movie_id}/comments/tree")
     assert response.status_code == 200
-    assert response.json()["content"] == "I agree!"
+    tree = response.json()
+    assert tree["truncated"] is False
+    assert tree["items"][0]["content"] == "Great movie!"
+    assert tree["items"][0]["replies"][0]["content"] == "I agree!"
@@ -0,0 +1,24 @@
+from benchmarks.baseline import compare, percentile, summarize
+
+def test_percentile_uses_nearest_rank():
+    samples = list(range(1, 101))
+    assert percentile(samples, 50) == 50
+    assert percentile(samples, 95) == 95
+    assert percentile(samples, 99) == 99
+    assert percentile([], 50) == 0.0
+
+def test_compare_flags_only_regressions_beyond_tolerance():
+    reference = {"load.get_movie": summarize([0.010] * 100, 1.0)}
+    slightly_slower = {"load.get_movie": summarize([0.011] * 95, 1.0)}
+    much_slower = {"load.get_movie": summarize([0.020] * 50, 1.0)}
+    assert compare(slightly_slower, reference, tolerance=0.25) == []
+    assert len(compare(much_slower, reference, tolerance=0.25)) == 2
+    assert compare({"load.new": much_slower["load.get_movie"]}, reference) == []
+
+def test_main_fails_without_a_baseline(tmp_path, monkeypatch):
+    from benchmarks import __main__ as cli, micro
+    monkeypatch.setattr(micro, "run", lambda scale: {"micro.noop": summarize([0.001] * 10, 1.0)})
+    path = str(tmp_path / "baseline.json")
+    assert cli.main(["--suite", "micro", "--baseline", path]) == 2
+    assert cli.main(["--suite", "micro", "--baseline", path, "--update-baseline"]) == 0
+    assert cli.main(["--suite", "micro", "--baseline", path]) == 0
@@ -0,0 +1,126 @@
+import time
+from cache import TTLCache
+
+def test_get_and_set():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.get("missing") is None
+
+def test_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+
+def test_entries_expire():
+    cache = TTLCache(maxsize=2, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+def test_delete():
+    cache = TTLCache()
+    cache.set("a", 1)
+    cache.delete("a")
+    cache.delete("a")
+    assert "a" not in cache
+
+def test_response_cache_single_flight_and_invalidation():
+    import asyncio
+    from cache import LocalKVStore, MemoryBackend, ResponseCache, SharedBackend
+
+    async def scenario(backend):
+        cache = ResponseCache(backend)
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"calls": calls}
+
+        results = await asyncio.gather(*(cache.get_or_load("movie:1", loader, tags=["movies"]) for _ in range(5)))
+        assert results == [{"calls": 1}] * 5
+        assert await cache.get_or_load("movie:1", loader, tags=["movies"]) == {"calls": 1}
+
+        await cache.invalidate(tags=["movies"])
+        assert await cache.get_or_load("movie:1", loader, tags=["movies"]) == {"calls": 2}
+        await cache.invalidate(keys=["movie:1"])
+        assert await cache.get_or_load("movie:1", loader, tags=["movies"]) == {"calls": 3}
+
+    asyncio.run(scenario(MemoryBackend()))
+    asyncio.run(scenario(SharedBackend(LocalKVStore())))
+
+def test_response_cache_does_not_store_failures():
+    import asyncio
+    from cache import MemoryBackend, ResponseCache
+
+    async def scenario():
+        cache = ResponseCache(MemoryBackend())
+
+        async def failing():
+            raise ValueError("boom")
+
+        async def loader():
+            return 1
+
+        try:
+            await cache.get_or_load("k", failing)
+        except ValueError:
+            pass
+        assert await cache.get_or_load("k", loader) == 1
+
+    asyncio.run(scenario())
+
+def test_response_cache_variants_share_invalidation():
+    import asyncio
+    from cache import MemoryBackend, ResponseCache
+
+    async def scenario():
+        cache = ResponseCache(MemoryBackend())
+
+        async def title():
+            return {"title": "Alien"}
+
+        async def full():
+            return {"title": "Alien", "genre": "Horror"}
+
+        assert await cache.get_or_load("movie:1", title, variant="title") == {"title": "Alien"}
+        assert await cache.get_or_load("movie:1", full) == {"title": "Alien", "genre": "Horror"}
+
+        async def changed():
+            return {"title": "Aliens"}
+
+        assert await cache.get_or_load("movie:1", changed, variant="title") == {"title": "Alien"}
+        await cache.invalidate(keys=["movie:1"])
+        assert await cache.get_or_load("movie:1", changed, variant="title") == {"title": "Aliens"}
+
+    asyncio.run(scenario())
+
+def test_memory_backend_evicting_tag_versions_never_revives_stale_entries():
+    import asyncio
+    from cache import MemoryBackend, ResponseCache
+
+    async def scenario():
+        backend = MemoryBackend(max_tags=2)
+        cache = ResponseCache(backend)
+        value = "old"
+
+        async def loader():
+            return value
+
+        assert await cache.get_or_load("movie:1", loader) == "old"
+        value = "new"
+        await cache.invalidate(keys=["movie:1"])
+        # Push movie:1's tag version out of the bounded table
+        await cache.invalidate(keys=["movie:2", "movie:3"])
+        assert len(backend.versions) == 2
+        assert await cache.get_or_load("movie:1", loader) == "new"
+
+    asyncio.run(scenario())
@@ -0,0 +1,55 @@
+import asyncio
+import time
+import pytest
+from fastapi.testclient import TestClient
+from passlib.context import CryptContext
+import hashing
+from hashing import Hash, HashQueueFull
+from main import app
+from repositories import get_repos, memory_repositories
+
+def test_jobs_beyond_max_pending_are_rejected(monkeypatch):
+    monkeypatch.setattr(hashing, "HASH_MAX_PENDING", 1)
+
+    async def scenario():
+        rejected = Hash.metrics()["rejected"]
+        busy = asyncio.ensure_future(Hash._submit(time.sleep, 0.1))
+        # Let the first job take the only slot
+        await asyncio.sleep(0)
+        with pytest.raises(HashQueueFull):
+            await Hash.bcrypt_async("password123")
+        await busy
+        assert Hash.metrics()["rejected"] == rejected + 1
+        assert Hash.metrics()["pending"] == 0
+        # The slot is free again
+        assert Hash.verify(await Hash.bcrypt_async("password123"), "password123")
+
+    asyncio.run(scenario())
+
+def test_login_upgrades_an_outdated_hash(monkeypatch):
+    repos = memory_repositories()
+    app.dependency_overrides[get_repos] = lambda: repos
+    try:
+        client = TestClient(app)
+        client.post("/signup", json={
+            "id": "", "username": "rehash", "password": "password123",
+            "email": "rehash@example.com", "firstName": "Re", "lastName": "Hash"
+        })
+        original = asyncio.run(repos.users.get_by_username("rehash"))["password"]
+
+        # Raise the cost factor, as a deploy with a higher BCRYPT_ROUNDS would
+        # bcrypt hashes read $2b$<rounds>$<salt and digest>
+        rounds = int(original.split("$")[2])
+        monkeypatch.setattr(hashing, "pwd_context", CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds + 1))
+        response = client.post("/login", data={"username": "rehash", "password": "password123"})
+        assert response.status_code == 200
+        upgraded = asyncio.run(repos.users.get_by_username("rehash"))["password"]
+        assert upgraded != original
+        assert int(upgraded.split("$")[2]) == rounds + 1
+
+        # The upgraded hash verifies and is left alone
+        response = client.post("/login", data={"username": "rehash", "password": "password123"})
+        assert response.status_code == 200
+        assert asyncio.run(repos.users.get_by_username("rehash"))["password"] == upgraded
+    finally:
+        app.dependency_overrides.clear()
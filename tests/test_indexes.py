@@ -0,0 +1,30 @@
+import asyncio
+import pytest
+from pymongo.errors import OperationFailure
+from database.indexes import INDEXES, ensure_indexes
+
+class FakeCollection:
+    def __init__(self, failing):
+        self.failing = failing
+
+    async def list_indexes(self):
+        for info in [{"name": "_id_", "key": {"_id": 1}}]:
+            yield info
+
+    async def create_indexes(self, indexes):
+        if indexes[0].document["name"] in self.failing:
+            raise OperationFailure("E11000 duplicate key error")
+
+class FakeDB:
+    def __init__(self, failing=()):
+        self.collections = {name: FakeCollection(set(failing)) for name in INDEXES}
+
+    def __getitem__(self, name):
+        return self.collections[name]
+
+def test_startup_fails_when_a_unique_index_cannot_be_built():
+    with pytest.raises(RuntimeError, match="users.username_unique"):
+        asyncio.run(ensure_indexes(FakeDB(failing=["username_unique"])))
+
+def test_startup_tolerates_other_index_failures():
+    asyncio.run(ensure_indexes(FakeDB(failing=["movie_text"])))
@@ -0,0 +1,44 @@
+import json
+import logging
+import sys
+from types import SimpleNamespace
+import log
+from log import JsonFormatter, SamplingFilter, parse_sample_rates
+
+def record(name="movies", level=logging.INFO, exc_info=None, **extra):
+    entry = logging.LogRecord(name, level, __file__, 1, "Retrieved %s movies", (3,), exc_info)
+    entry.__dict__.update(extra)
+    return entry
+
+def test_parse_sample_rates():
+    assert parse_sample_rates("movies=0.1, comments = 0.05,") == {"movies": 0.1, "comments": 0.05}
+    assert parse_sample_rates("") == {}
+
+def test_sampling_filter_keeps_a_fraction_of_info_records(monkeypatch):
+    sampling = SamplingFilter({"movies": 0.25})
+    monkeypatch.setattr(log, "random", SimpleNamespace(random=lambda: 0.5))
+    assert not sampling.filter(record())
+    assert not sampling.filter(record(level=logging.DEBUG))
+    # Warnings and unsampled loggers always pass
+    assert sampling.filter(record(level=logging.WARNING))
+    assert sampling.filter(record(name="comments"))
+
+    monkeypatch.setattr(log, "random", SimpleNamespace(random=lambda: 0.1))
+    assert sampling.filter(record())
+
+def test_json_formatter_writes_one_object_with_extras():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        exc_info = sys.exc_info()
+    line = JsonFormatter().format(record(level=logging.ERROR, exc_info=exc_info, movie_id="m1"))
+
+    # The traceback is escaped, so a record stays on one line
+    assert "\n" not in line
+    entry = json.loads(line)
+    assert entry["level"] == "ERROR"
+    assert entry["logger"] == "movies"
+    assert entry["message"] == "Retrieved 3 movies"
+    assert entry["movie_id"] == "m1"
+    assert "ValueError: boom" in entry["exc_info"]
+    assert entry["time"].endswith("+00:00")
@@ -0,0 +1,58 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import metrics
+from metrics import CallbackCounter, Counter, Histogram
+
+def test_counter_renders_one_series_per_label_set():
+    counter = Counter("jobs_total", "Jobs run.", ("kind",))
+    counter.inc("import")
+    counter.inc("import", amount=2)
+    counter.inc('say "hi"')
+    assert list(counter.render()) == [
+        "# HELP jobs_total Jobs run.",
+        "# TYPE jobs_total counter",
+        'jobs_total{kind="import"} 3',
+        'jobs_total{kind="say \\"hi\\""} 1',
+    ]
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("job_seconds", "Job duration.", ("kind",), buckets=(0.5, 1.0))
+    for value in (0.25, 1.0, 4.0):
+        histogram.observe(value, "import")
+    assert list(histogram.render()) == [
+        "# HELP job_seconds Job duration.",
+        "# TYPE job_seconds histogram",
+        'job_seconds_bucket{kind="import",le="0.5"} 1',
+        # Bounds are inclusive
+        'job_seconds_bucket{kind="import",le="1.0"} 2',
+        'job_seconds_bucket{kind="import",le="+Inf"} 3',
+        'job_seconds_sum{kind="import"} 5.25',
+        'job_seconds_count{kind="import"} 3',
+    ]
+
+def test_callback_counter_reads_its_total_at_scrape_time():
+    total = [0]
+    counter = CallbackCounter("rejected_total", "Rejected jobs.", lambda: total[0])
+    total[0] = 4
+    assert list(counter.render())[1:] == ["# TYPE rejected_total counter", "rejected_total 4"]
+    assert "# TYPE password_hash_jobs_rejected_total counter" in metrics.registry.render()
+
+def test_requests_are_labelled_by_route_template():
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    def get_item(item_id: str):
+        return {"id": item_id}
+
+    def requests(route, status):
+        return metrics.http_requests_total._values.get(("GET", route, status), 0)
+
+    before = requests("/items/{item_id}", "200"), requests("unmatched", "404")
+    client = TestClient(app)
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/nowhere")
+    assert requests("/items/{item_id}", "200") == before[0] + 2
+    assert requests("unmatched", "404") == before[1] + 1
+    assert ("GET", "/items/1", "200") not in metrics.http_requests_total._values
@@ -0,0 +1,47 @@
+import asyncio
+import movie_import
+from repositories import memory_repositories
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+async def chunks(*parts: bytes):
+    for part in parts:
+        yield part
+
+def import_body(fmt, *parts):
+    async def scenario():
+        repos = memory_repositories()
+        rows = movie_import.iter_rows(movie_import.iter_lines(chunks(*parts)), fmt)
+        report = await movie_import.import_movies(repos.movies, rows, "owner")
+        movies = await repos.movies.list({}, limit=10, fields=("title", "synopsis"))
+        return report, {movie["title"]: movie["synopsis"] for movie in movies}
+
+    return run(scenario())
+
+HEADER = b"title,release_date,genre,director,synopsis,language\n"
+
+def test_csv_quoted_fields_may_span_lines():
+    report, synopses = import_body(
+        "csv",
+        HEADER,
+        b'Alien,1979-05-25,Horror,Ridley Scott,"In space,\n',
+        b'no one can hear you ""scream""",English\r\n',
+        b"Heat,1995-12-15,Crime,Michael Mann,Cops and robbers,English\n",
+    )
+    assert (report.inserted, report.failed, report.next_offset) == (2, 0, 2)
+    assert synopses["Alien"] == 'In space,\nno one can hear you "scream"'
+
+def test_csv_unterminated_quote_is_a_row_error():
+    report, synopses = import_body("csv", HEADER, b'Alien,1979-05-25,Horror,Ridley Scott,"In space,\n')
+    assert (report.inserted, report.failed) == (0, 1)
+    assert report.errors[0].error == "Unterminated quoted field"
+
+def test_undecodable_rows_are_reported_without_aborting_the_import():
+    good = b'{"title": "%s", "release_date": "2024-08-14", "genre": "Drama", "director": "Jane Doe", "synopsis": "S.", "language": "English"}\n'
+    # The bad byte lands in a chunk of its own, in the middle of a line
+    report, synopses = import_body("ndjson", good % b"One", b'{"title": "Caf', b"\xff", b'"}\n', good % b"Two")
+    assert (report.inserted, report.failed, report.next_offset) == (2, 1, 3)
+    assert report.errors[0].row == 1
+    assert "utf-8" in report.errors[0].error
+    assert sorted(synopses) == ["One", "Two"]
@@ -0,0 +1,49 @@
+import asyncio
+from bson import ObjectId
+import pytest
+from fastapi import HTTPException
+import oauth2
+from jwt_token import create_access_token
+from repositories import memory_repositories
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+@pytest.fixture(autouse=True)
+def empty_user_cache():
+    oauth2.clear_user_cache()
+    yield
+    oauth2.clear_user_cache()
+
+def user(username="alice"):
+    return {"username": username, "password": "hash", "email": f"{username}@example.com", "firstName": "Alice", "lastName": "Doe"}
+
+def test_current_user_is_served_from_cache_until_invalidated():
+    async def scenario():
+        repos = memory_repositories()
+        user_id = await repos.users.insert(user())
+        token = create_access_token({"sub": user_id})
+        assert (await oauth2.get_current_user(token, repos)).email == "alice@example.com"
+
+        # A cache hit does not read the users repository
+        repos.users.documents[ObjectId(user_id)]["email"] = "changed@example.com"
+        assert (await oauth2.get_current_user(token, repos)).email == "alice@example.com"
+
+        oauth2.invalidate_user(user_id)
+        assert (await oauth2.get_current_user(token, repos)).email == "changed@example.com"
+
+    run(scenario())
+
+def test_unknown_user_is_rejected_and_not_cached():
+    async def scenario():
+        repos = memory_repositories()
+        user_id = str(ObjectId())
+        token = create_access_token({"sub": user_id})
+        with pytest.raises(HTTPException) as raised:
+            await oauth2.get_current_user(token, repos)
+        assert raised.value.status_code == 401
+
+        await repos.users.insert({"_id": ObjectId(user_id), **user()})
+        assert (await oauth2.get_current_user(token, repos)).id == user_id
+
+    run(scenario())
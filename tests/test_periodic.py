@@ -0,0 +1,32 @@
+import asyncio
+import logging
+import periodic
+
+def test_failed_runs_are_logged_and_retried(caplog):
+    runs = []
+
+    async def job():
+        runs.append(len(runs))
+        if len(runs) == 1:
+            raise ValueError("boom")
+        if len(runs) == 3:
+            raise asyncio.CancelledError
+
+    async def scenario():
+        try:
+            await periodic.run_periodically(job, 0.001, logging.getLogger("test"), "Test job")
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(scenario())
+    assert runs == [0, 1, 2]
+    assert "Test job failed" in caplog.text
+
+def test_an_interval_of_zero_runs_once():
+    runs = []
+
+    async def job():
+        runs.append(1)
+
+    asyncio.run(periodic.run_periodically(job, 0, logging.getLogger("test"), "Test job"))
+    assert runs == [1]
@@ -0,0 +1,63 @@
+import collections
+import time
+from datetime import datetime, timezone
+import pytest
+from fastapi.testclient import TestClient
+import profiling
+from main import app
+
+class FixedSampler:
+    """Stands in for the sampler thread with two samples per request."""
+
+    def ensure_started(self):
+        pass
+
+    def window(self, start, end):
+        return [
+            (("base_events.py:_run_once", "movie.py:get_movie_endpoint"), "python"),
+            (("base_events.py:_run_once", "selectors.py:select"), "io_wait"),
+        ]
+
+@pytest.fixture
+def profiled(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "secret")
+    monkeypatch.setattr(profiling, "sampler", FixedSampler())
+    monkeypatch.setattr(profiling, "profiles", collections.deque(maxlen=5))
+    return TestClient(app)
+
+def test_classify():
+    assert profiling.classify(("a.py:f", "selectors.py:select"), ("a.py", "selectors.py")) == "io_wait"
+    assert profiling.classify(("a.py:f",), ("site-packages/pydantic/main.py",)) == "pydantic"
+    assert profiling.classify(("a.py:f",), ("a.py",)) == "python"
+
+def test_requests_with_the_profile_header_are_captured(profiled):
+    profiled.get("/")
+    assert len(profiling.profiles) == 0
+
+    profiled.get("/", headers={"x-profile": "secret"})
+    [profile] = profiling.profiles
+    assert (profile["route"], profile["status"], profile["reason"]) == ("/", 200, "header")
+    assert profile["samples"] == 2
+    assert profile["breakdown_ms"]["io_wait"] == profiling.PROFILE_INTERVAL_MS
+
+def test_profiles_export_as_collapsed_stacks(profiled):
+    profiled.get("/", headers={"x-profile": "secret"})
+
+    assert profiled.get("/admin/profiles").status_code == 403
+    [summary] = profiled.get("/admin/profiles", headers={"x-profile-token": "secret"}).json()
+    response = profiled.get(f"/admin/profiles/{summary['id']}", headers={"x-profile-token": "secret"})
+    assert response.status_code == 200
+    assert sorted(response.text.splitlines()) == [
+        "base_events.py:_run_once;movie.py:get_movie_endpoint 1",
+        "base_events.py:_run_once;selectors.py:select 1",
+    ]
+    assert profiled.get("/admin/profiles/0", headers={"x-profile-token": "secret"}).status_code == 404
+
+def test_started_at_is_when_the_request_began(profiled):
+    end = time.perf_counter()
+    profiling.record_profile({"method": "GET", "path": "/"}, 200, end - 2, end, "slow")
+    [profile] = profiling.profiles
+    started_at = datetime.fromisoformat(profile["started_at"])
+    assert abs((datetime.now(timezone.utc) - started_at).total_seconds() - 2) < 0.5
+    assert profile["duration_ms"] == pytest.approx(2000)
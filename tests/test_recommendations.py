@@ -0,0 +1,83 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+from recommendations import RatingMatrix, compute_lists, neighbor_lists, recommend
+from repositories import memory_repositories
+
+RATINGS = [
+    # u1..u3 like the two space movies and dislike the romance
+    ("u1", "alien", 9), ("u1", "aliens", 8), ("u1", "notebook", 2),
+    ("u2", "alien", 8), ("u2", "aliens", 9), ("u2", "notebook", 3),
+    ("u3", "alien", 10), ("u3", "aliens", 9), ("u3", "notebook", 1), ("u3", "solaris", 8),
+    ("u4", "notebook", 9), ("u4", "solaris", 2),
+    ("u5", "notebook", 8), ("u5", "solaris", 3), ("u5", "alien", 4),
+]
+
+def matrix(ratings=RATINGS):
+    built = RatingMatrix()
+    for user_id, movie_id, rating in ratings:
+        built.add(user_id, movie_id, rating)
+    return built.compress()
+
+def test_matrix_rows_and_columns_hold_centred_ratings():
+    built = matrix()
+    assert sorted(built.by_user[built.user_index["u4"]].data) == [-3.5, 3.5]
+    assert built.by_movie[:, built.movie_index["solaris"]].nnz == 3
+
+def test_ratings_added_after_a_merge_replace_earlier_ones():
+    built = RatingMatrix()
+    for user_id, movie_id, rating in RATINGS:
+        built.add(user_id, movie_id, rating)
+    built.merge()
+    # u4 re-rates solaris and rates a new movie
+    built.add("u4", "solaris", 9)
+    built.add("u4", "stalker", 2)
+    built.compress()
+    assert len(built.ratings) == len(RATINGS) + 1
+    assert sorted(built.by_user[built.user_index["u4"]].data) == pytest.approx([-4 - 2 / 3, 2 + 1 / 3, 2 + 1 / 3])
+    assert neighbor_lists(built) == neighbor_lists(matrix(RATINGS[:-4] + [("u4", "notebook", 9), ("u4", "solaris", 9), ("u4", "stalker", 2)] + RATINGS[-3:]))
+
+def test_neighbors_rank_movies_liked_by_the_same_users():
+    lists = neighbor_lists(matrix(), k=2)
+    assert [neighbor["movie_id"] for neighbor in lists["alien"]] == ["aliens", "solaris"]
+    assert lists["alien"][0]["score"] == pytest.approx(lists["aliens"][0]["score"])
+    # Opposite tastes never count as similar
+    assert all(neighbor["movie_id"] != "notebook" for neighbor in lists["alien"])
+    assert neighbor_lists(matrix(), k=2, min_overlap=4)["alien"] == []
+
+def test_incremental_refresh_covers_movies_co_rated_with_the_users_movies():
+    built = matrix(RATINGS + [("u6", "stalker", 7), ("u6", "mirror", 9)])
+    assert set(neighbor_lists(built, users=["u6", "unknown"])) == {"mirror", "stalker"}
+    # u4's mean moves every movie they rated, and every list scoring one of those
+    assert set(neighbor_lists(built, users=["u4"])) == {"alien", "aliens", "notebook", "solaris"}
+
+def test_compute_lists_runs_in_a_child_process():
+    built = RatingMatrix()
+    for user_id, movie_id, rating in RATINGS:
+        built.add(user_id, movie_id, rating)
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        lists = pool.submit(compute_lists, built, ["u1"]).result()
+    assert lists == neighbor_lists(matrix(), users=["u1"])
+
+def test_recommend_predicts_from_neighbors_and_skips_rated_movies():
+    neighbors = {
+        "alien": [{"movie_id": "aliens", "score": 0.9}, {"movie_id": "notebook", "score": 0.1}],
+        "notebook": [{"movie_id": "titanic", "score": 0.8}, {"movie_id": "alien", "score": 0.1}],
+    }
+    ratings = [{"movie_id": "alien", "rating": 9}, {"movie_id": "notebook", "rating": 3}]
+    picks = recommend(ratings, neighbors, limit=5)
+    assert [pick["movie_id"] for pick in picks] == ["aliens", "titanic"]
+    assert picks[0]["score"] == pytest.approx(9)
+    assert picks[1]["score"] == pytest.approx(3)
+    assert recommend([], neighbors, limit=5) == []
+
+def test_memory_neighbor_repo_round_trips_lists():
+    async def scenario():
+        repos = memory_repositories()
+        await repos.neighbors.replace(neighbor_lists(matrix()))
+        assert (await repos.neighbors.get("alien"))[0]["movie_id"] == "aliens"
+        assert list(await repos.neighbors.get_many(["alien", "missing"])) == ["alien"]
+        await repos.neighbors.delete("alien")
+        assert await repos.neighbors.get("alien") == []
+
+    asyncio.run(scenario())
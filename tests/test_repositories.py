@@ -0,0 +1,229 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+import pytest
+import counters
+import rating_stats
+from pagination import InvalidCursor, encode_cursor, keyset_filter
+from repositories import DuplicateKey, memory_repositories
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def movie(title, genre="Drama", year=2024, user_id="owner"):
+    return {
+        "title": title,
+        "genre": genre,
+        "director": "Jane Doe",
+        "synopsis": f"{title} synopsis",
+        "language": "English",
+        "release_date": datetime(year, 1, 1),
+        "user_id": user_id,
+    }
+
+def test_movie_list_filters_and_pages_by_release_date():
+    async def scenario():
+        repos = memory_repositories()
+        for year in (2020, 2022, 2021):
+            await repos.movies.insert(movie(f"Drama {year}", year=year))
+        await repos.movies.insert(movie("Comedy", genre="Comedy"))
+
+        first = await repos.movies.list({"genre": "Drama"}, sort="release_date", limit=2, fields=("title",))
+        assert [doc["title"] for doc in first] == ["Drama 2020", "Drama 2021"]
+        cursor = encode_cursor(first[-1], "release_date")
+        rest = await repos.movies.list({"genre": "Drama"}, sort="release_date", cursor=cursor, limit=2, fields=("title",))
+        assert [doc["title"] for doc in rest] == ["Drama 2022"]
+
+        with pytest.raises(InvalidCursor):
+            await repos.movies.list({}, cursor="not-a-cursor")
+
+    run(scenario())
+
+def test_movie_list_pages_past_movies_without_a_release_date():
+    async def scenario():
+        repos = memory_repositories()
+        for year in (2021, 2020):
+            await repos.movies.insert(movie(f"Drama {year}", year=year))
+        undated = movie("Undated")
+        del undated["release_date"]
+        await repos.movies.insert(undated)
+
+        for descending, expected in ((False, ["Undated", "Drama 2020", "Drama 2021"]), (True, ["Drama 2021", "Drama 2020", "Undated"])):
+            titles, cursor = [], None
+            while True:
+                page = await repos.movies.list({}, sort="release_date", descending=descending, cursor=cursor, limit=1, fields=("title",))
+                if not page:
+                    break
+                titles.append(page[0]["title"])
+                cursor = encode_cursor(page[0], "release_date", descending)
+            assert titles == expected
+
+        # A cursor only pages the sort it was issued for
+        cursor = encode_cursor((await repos.movies.list({}, limit=1))[0], "_id")
+        with pytest.raises(InvalidCursor):
+            await repos.movies.list({}, sort="release_date", cursor=cursor)
+        with pytest.raises(InvalidCursor):
+            await repos.movies.list({}, descending=True, cursor=cursor)
+
+    run(scenario())
+
+def test_keyset_filter_matches_nulls_the_way_mongo_orders_them():
+    oid = ObjectId()
+    dated = encode_cursor({"_id": oid, "release_date": datetime(2020, 1, 1)}, "release_date", descending=True)
+    assert keyset_filter(dated, "release_date", descending=True) == {"$or": [
+        {"release_date": {"$lt": datetime(2020, 1, 1)}},
+        {"release_date": datetime(2020, 1, 1), "_id": {"$lt": oid}},
+        {"release_date": None},
+    ]}
+    undated = encode_cursor({"_id": oid}, "release_date")
+    assert keyset_filter(undated, "release_date") == {"$or": [
+        {"release_date": {"$ne": None}},
+        {"release_date": None, "_id": {"$gt": oid}},
+    ]}
+
+def test_movie_writes_are_owner_scoped_and_reindexed():
+    async def scenario():
+        repos = memory_repositories()
+        movie_id = await repos.movies.insert(movie("Alien", genre="Horror"))
+        assert await repos.movies.update_owned(movie_id, "someone-else", {"genre": "Drama"}) is None
+        updated = await repos.movies.update_owned(movie_id, "owner", {"genre": "Drama"})
+        assert updated["genre"] == "Drama"
+        assert await repos.movies.list({"genre": "Horror"}) == []
+        assert [doc["title"] for doc in await repos.movies.list({"genre": "Drama"})] == ["Alien"]
+        assert not await repos.movies.delete_owned(movie_id, "someone-else")
+        assert await repos.movies.delete_owned(movie_id, "owner")
+        assert not await repos.movies.exists(movie_id)
+        assert await repos.movies.get("not-an-id") is None
+
+    run(scenario())
+
+def test_title_prefix_fallback_matches_the_stored_title_key():
+    async def scenario():
+        repos = memory_repositories()
+        alien = await repos.movies.insert(movie("Alien"))
+        await repos.movies.insert(movie("The  Matrix"))
+        await repos.movies.insert(movie("Aliens"))
+        assert [doc["title"] for doc in await repos.movies.titles_with_prefix("ALIEN", 10)] == ["Alien", "Aliens"]
+        assert [doc["title"] for doc in await repos.movies.titles_with_prefix("the m", 10)] == ["The  Matrix"]
+
+        updated = await repos.movies.update_owned(alien, "owner", {"title": "Prometheus"})
+        assert updated["title_key"] == "prometheus"
+        assert updated["title_updated_at"] is not None
+        assert [doc["title"] for doc in await repos.movies.titles_with_prefix("alien", 10)] == ["Aliens"]
+
+    run(scenario())
+
+def test_ratings_keep_movie_stats():
+    async def scenario():
+        repos = memory_repositories()
+        for user_id, value in (("u1", 4), ("u2", 8)):
+            await repos.ratings.upsert({"movie_id": "m1", "user_id": user_id, "rating": value})
+        stats = await repos.ratings.stats("m1")
+        assert (stats["count"], stats["sum"], stats["min"], stats["max"]) == (2, 12, 4, 8)
+        assert stats["histogram"] == {"4": 1, "8": 1}
+        assert list(await repos.ratings.stats_many(["m1", "m2"])) == ["m1"]
+
+    run(scenario())
+
+def test_rating_again_replaces_the_previous_rating():
+    async def scenario():
+        repos = memory_repositories()
+        movie_id = await repos.movies.insert(movie("Alien"))
+        assert await repos.ratings.upsert({"movie_id": movie_id, "user_id": "u1", "rating": 2}) is None
+        await repos.ratings.upsert({"movie_id": movie_id, "user_id": "u2", "rating": 5})
+        assert await repos.ratings.upsert({"movie_id": movie_id, "user_id": "u1", "rating": 9}) == 2
+
+        assert sorted(doc["rating"] for doc in await repos.ratings.list_for_movie(movie_id)) == [5, 9]
+        stats = await repos.ratings.stats(movie_id)
+        # The old minimum is gone, so min is recomputed rather than kept
+        assert (stats["count"], stats["sum"], stats["min"], stats["max"]) == (2, 14, 5, 9)
+        assert stats["histogram"] == {"2": 0, "5": 1, "9": 1}
+        stored = await repos.movies.get(movie_id, ("rating_count", "rating_sum"))
+        assert (stored["rating_count"], stored["rating_sum"]) == (2, 14)
+
+        await repos.ratings.upsert({"movie_id": "000", "user_id": "u1", "rating": 7})
+        assert [doc["movie_id"] for doc in await repos.ratings.list_for_user("u1", ("movie_id",))] == ["000", movie_id]
+        assert [doc["movie_id"] for doc in await repos.ratings.list_for_user("u1", ("movie_id",), after="000")] == [movie_id]
+
+    run(scenario())
+
+def test_rerating_a_lone_rating_moves_both_extremes():
+    async def scenario():
+        repos = memory_repositories()
+        await repos.ratings.upsert({"movie_id": "m1", "user_id": "u1", "rating": 3})
+        await repos.ratings.upsert({"movie_id": "m1", "user_id": "u1", "rating": 7})
+        stats = await repos.ratings.stats("m1")
+        assert (stats["count"], stats["min"], stats["max"]) == (1, 7, 7)
+        assert rating_stats.stale_extremes({"min": 3, "max": 3}, 3, 7) == ["min"]
+        assert rating_stats.stale_extremes({"min": 2, "max": 9}, 5, 7) == []
+
+    run(scenario())
+
+def test_comment_thread_is_ordered_by_depth():
+    async def scenario():
+        repos = memory_repositories()
+        root = {"movie_id": "m1", "content": "root", "parent_id": None, "ancestors": [], "depth": 0}
+        root_id = await repos.comments.insert(root)
+        reply = {"movie_id": "m1", "content": "reply", "parent_id": root_id, "ancestors": [root_id], "depth": 1}
+        reply_id = await repos.comments.insert(reply)
+        nested = {"movie_id": "m1", "content": "nested", "parent_id": reply_id, "ancestors": [root_id, reply_id], "depth": 2}
+        await repos.comments.insert(nested)
+
+        assert [doc["content"] for doc in await repos.comments.thread("m1")] == ["root", "reply", "nested"]
+        assert [doc["content"] for doc in await repos.comments.thread("m1", root_id, max_depth=1)] == ["reply"]
+        assert [doc["content"] for doc in await repos.comments.children("m1", None)] == ["root"]
+        assert await repos.comments.get("m2", root_id) is None
+
+    run(scenario())
+
+def test_usernames_are_unique():
+    async def scenario():
+        repos = memory_repositories()
+        user_id = await repos.users.insert({"username": "ada", "password": "hash"})
+        with pytest.raises(DuplicateKey):
+            await repos.users.insert({"username": "ada", "password": "other"})
+        await repos.users.set_password(user_id, "new-hash")
+        assert (await repos.users.get_by_username("ada"))["password"] == "new-hash"
+
+    run(scenario())
+
+def test_writes_maintain_counters():
+    async def scenario():
+        repos = memory_repositories()
+        movie_id = await repos.movies.insert(movie("Alien"))
+        assert (await repos.movies.get(movie_id, ("comment_count", "rating_count", "last_activity_at"))) == {
+            "_id": ObjectId(movie_id), "comment_count": 0, "rating_count": 0, "last_activity_at": None
+        }
+        for user_id, value in (("u1", 6), ("u2", 9)):
+            await repos.ratings.upsert({"movie_id": movie_id, "user_id": user_id, "rating": value})
+        root_id = await repos.comments.insert({"movie_id": movie_id, "content": "root", "parent_id": None, "ancestors": [], "depth": 0})
+        await repos.comments.insert({"movie_id": movie_id, "content": "reply", "parent_id": root_id, "ancestors": [root_id], "depth": 1})
+
+        stored = await repos.movies.get(movie_id)
+        assert (stored["rating_count"], stored["rating_sum"], stored["comment_count"]) == (2, 15, 2)
+        assert stored["last_activity_at"] is not None
+        assert (await repos.comments.get(movie_id, root_id))["reply_count"] == 1
+
+    run(scenario())
+
+def test_trending_windows_ratings_on_when_they_were_last_set():
+    async def scenario():
+        repos = memory_repositories()
+        movie_id = await repos.movies.insert(movie("Heat"))
+        await repos.ratings.upsert({"movie_id": movie_id, "user_id": "u1", "rating": 6})
+        repos.ratings.by_movie[movie_id]["u1"]["updated_at"] = datetime(2000, 1, 1, tzinfo=timezone.utc)
+        since = datetime.now(timezone.utc) - timedelta(hours=1)
+        assert await repos.leaderboards.trending(since, 10, 0.5) == []
+
+        # Re-rating keeps the rating's _id but brings it back into the window
+        await repos.ratings.upsert({"movie_id": movie_id, "user_id": "u1", "rating": 8})
+        [row] = await repos.leaderboards.trending(since, 10, 0.5)
+        assert (row["_id"], row["rating_count"], row["rating_sum"]) == (movie_id, 1, 8)
+
+    run(scenario())
+
+def test_reconciler_ignores_float_rounding_in_rating_sum():
+    assert not counters._differs("rating_sum", 0.1 + 0.2, 0.3)
+    assert counters._differs("rating_sum", 7.5, 8)
+    assert counters._differs("rating_sum", None, 0)
+    assert counters._differs("rating_count", 2, 3)
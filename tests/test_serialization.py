@@ -0,0 +1,40 @@
+from datetime import datetime
+from bson import ObjectId
+from serialization import MOVIE_FIELDS, dumps, to_out
+
+def test_to_out_maps_document_onto_response_fields():
+    movie_id = ObjectId()
+    document = {
+        "_id": movie_id,
+        "title": "Alien",
+        "genre": "Horror",
+        "synopsis": "In space",
+        "language": "English",
+        "release_date": datetime(1979, 5, 25),
+        "user_id": "owner",
+    }
+    out = to_out(document, MOVIE_FIELDS)
+    assert out["id"] == str(movie_id)
+    assert "user_id" not in out
+    assert dumps(out).startswith(b'{"id":"' + str(movie_id).encode())
+    assert b'"release_date":"1979-05-25T00:00:00"' in dumps(out)
+
+def test_to_out_fills_missing_fields_with_null():
+    out = to_out({"_id": ObjectId(), "title": "Alien"}, MOVIE_FIELDS)
+    assert out["synopsis"] is None
+
+def test_dumps_handles_object_ids():
+    movie_id = ObjectId()
+    assert dumps({"movie": movie_id}) == b'{"movie":"' + str(movie_id).encode() + b'"}'
+
+def test_select_fields_keeps_schema_order_and_rejects_unknown_fields():
+    from fastapi import HTTPException
+    from serialization import select_fields
+    assert select_fields(None, MOVIE_FIELDS) == MOVIE_FIELDS
+    assert select_fields("genre, title,id", MOVIE_FIELDS) == ("title", "genre")
+    try:
+        select_fields("title,password", MOVIE_FIELDS)
+    except HTTPException as exc:
+        assert exc.status_code == 400
+    else:
+        raise AssertionError("unknown field accepted")
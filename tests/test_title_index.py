@@ -0,0 +1,92 @@
+import asyncio
+from bson import ObjectId
+import title_index
+from title_index import TitleIndex
+
+def test_suggest_matches_prefix_case_insensitively():
+    index = TitleIndex()
+    index.add("1", "The Matrix")
+    index.add("2", "The Matrix Reloaded")
+    index.add("3", "Theory of Everything")
+    index.add("4", "Alien")
+    assert index.suggest("the matrix") == [("1", "The Matrix"), ("2", "The Matrix Reloaded")]
+    assert index.suggest("THE", limit=2) == [("1", "The Matrix"), ("2", "The Matrix Reloaded")]
+    assert index.suggest("zz") == []
+
+def test_add_replaces_existing_title():
+    index = TitleIndex()
+    index.add("1", "Old Title")
+    index.add("1", "New Title")
+    assert len(index) == 1
+    assert index.suggest("old") == []
+    assert index.suggest("new") == [("1", "New Title")]
+
+def test_remove():
+    index = TitleIndex()
+    index.add("1", "Alien")
+    index.add("2", "Aliens")
+    index.remove("1")
+    index.remove("missing")
+    assert index.suggest("alien") == [("2", "Aliens")]
+
+def test_replace_marks_ready():
+    index = TitleIndex()
+    assert not index.ready
+    index.replace({"1": "Heat", "2": "Her"})
+    assert index.ready
+    assert index.suggest("he") == [("1", "Heat"), ("2", "Her")]
+
+def test_replace_keeps_writes_made_during_the_build():
+    index = TitleIndex()
+    index.add("1", "Heat")
+    index.begin_build()
+    # The scan already read "1" and "2" and misses "3"
+    index.add("3", "Hero")
+    index.remove("2")
+    index.add("1", "Heat 2")
+    index.replace({"1": "Heat", "2": "Her"})
+    assert index.suggest("he") == [("1", "Heat 2"), ("3", "Hero")]
+
+    # Later writes are applied in place only
+    index.add("4", "Hell")
+    index.replace({"1": "Heat"})
+    assert index.suggest("he") == [("1", "Heat")]
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def batch_size(self, size):
+        return self
+
+    async def __aiter__(self):
+        for document in self.documents:
+            yield document
+
+class FakeMovies:
+    def __init__(self, documents):
+        self.documents = documents
+        self.queries = []
+
+    def find(self, query, fields):
+        self.queries.append(query)
+        return FakeCursor(self.documents)
+
+def test_refresh_reads_only_recent_writes(monkeypatch):
+    index = TitleIndex()
+    monkeypatch.setattr(title_index, "title_index", index)
+    movies = FakeMovies([{"_id": ObjectId(), "title": "Heat"}])
+    db = {"movies": movies}
+
+    asyncio.run(title_index.build(db))
+    built_at = index.refreshed_at
+    assert movies.queries == [{}]
+    assert not title_index.rebuild_due(3600)
+
+    movies.documents = [{"_id": ObjectId(), "title": "Hero"}]
+    assert asyncio.run(title_index.refresh(db)) == 1
+    since = built_at - title_index.REFRESH_OVERLAP
+    assert movies.queries[-1] == {"$or": [{"_id": {"$gte": ObjectId.from_datetime(since)}}, {"title_updated_at": {"$gte": since}}]}
+    assert index.refreshed_at > built_at
+    assert index.built_at == built_at
+    assert [title for _, title in index.suggest("he")] == ["Heat", "Hero"]
@@ -0,0 +1,172 @@
+import bisect
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import UpdateOne
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from dotenv import load_dotenv
+import periodic
+
+load_dotenv()
+
+logger = logging.getLogger("title_index")
+
+# Each worker holds its own index and applies its own writes in place. A
+# periodic refresh reads only the movies created or retitled through other
+# workers since the last one; movies deleted elsewhere are dropped by the much
+# rarer full rebuild. A refresh interval of 0 builds once at startup, and a
+# rebuild interval of 0 never rebuilds.
+TITLE_INDEX_REFRESH_INTERVAL_SECONDS = float(os.getenv("TITLE_INDEX_REFRESH_INTERVAL_SECONDS", "300"))
+TITLE_INDEX_REBUILD_INTERVAL_SECONDS = float(os.getenv("TITLE_INDEX_REBUILD_INTERVAL_SECONDS", "86400"))
+# ObjectIds and clocks from other processes can lag this one, so each refresh
+# re-reads this much of the window before the previous one
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+def normalize(title: str) -> str:
+    return " ".join(title.casefold().split())
+
+def title_fields(title: str, retitled_at: Optional[datetime] = None) -> dict:
+    """Stored next to `title` on movies: the indexed key behind the Mongo
+    suggest fallback, and when an edit last changed the title."""
+    fields = {"title_key": normalize(title)}
+    if retitled_at is not None:
+        fields["title_updated_at"] = retitled_at
+    return fields
+
+class TitleIndex:
+    """Sorted in-memory index of movie titles for prefix (typeahead) lookups.
+
+    Lookups are a binary search plus a scan of at most `limit` entries.
+    Inserts and removals keep the arrays sorted, so the write endpoints can
+    update the index in place instead of triggering a rebuild. Writes made
+    between `begin_build()` and `replace()` are replayed onto the rebuilt
+    titles, since the scan feeding `replace()` may have read past them.
+    """
+
+    def __init__(self):
+        self._keys: List[Tuple[str, str]] = []
+        self._titles: Dict[str, str] = {}
+        # (movie_id, title or None for a removal) while a build is running
+        self._pending: Optional[List[Tuple[str, Optional[str]]]] = None
+        self.ready = False
+        # Start times of the last full build and of the last build or refresh
+        self.built_at: Optional[datetime] = None
+        self.refreshed_at: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, movie_id: str, title: str):
+        self._discard(movie_id)
+        bisect.insort(self._keys, (normalize(title), movie_id))
+        self._titles[movie_id] = title
+        if self._pending is not None:
+            self._pending.append((movie_id, title))
+
+    def remove(self, movie_id: str):
+        self._discard(movie_id)
+        if self._pending is not None:
+            self._pending.append((movie_id, None))
+
+    def _discard(self, movie_id: str):
+        title = self._titles.pop(movie_id, None)
+        if title is None:
+            return
+        key = (normalize(title), movie_id)
+        position = bisect.bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            del self._keys[position]
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[Tuple[str, str]]:
+        """Return up to `limit` (movie_id, title) pairs whose title starts with `prefix`."""
+        prefix = normalize(prefix)
+        position = bisect.bisect_left(self._keys, (prefix, ""))
+        matches = []
+        for key, movie_id in self._keys[position:position + limit]:
+            if not key.startswith(prefix):
+                break
+            matches.append((movie_id, self._titles[movie_id]))
+        return matches
+
+    def begin_build(self):
+        self._pending = []
+
+    def replace(self, titles: Dict[str, str]):
+        for movie_id, title in self._pending or ():
+            if title is None:
+                titles.pop(movie_id, None)
+            else:
+                titles[movie_id] = title
+        self._pending = None
+        self._keys = sorted((normalize(title), movie_id) for movie_id, title in titles.items())
+        self._titles = titles
+        self.ready = True
+
+title_index = TitleIndex()
+
+async def build(db: AsyncIOMotorDatabase, batch_size: int = 10000):
+    started = datetime.now(timezone.utc)
+    titles = {}
+    title_index.begin_build()
+    async for movie in db["movies"].find({}, {"title": 1}).batch_size(batch_size):
+        if movie.get("title"):
+            titles[str(movie["_id"])] = movie["title"]
+    title_index.replace(titles)
+    title_index.built_at = title_index.refreshed_at = started
+    logger.info("Title index built with %s titles", len(titles))
+
+async def refresh(db: AsyncIOMotorDatabase, batch_size: int = 10000) -> int:
+    """Apply movies created or retitled since the last build or refresh.
+
+    Served by the `_id` and `title_updated_at` indexes, so the cost follows
+    the number of writes rather than the size of the collection. Returns the
+    number of titles applied.
+    """
+    started = datetime.now(timezone.utc)
+    since = title_index.refreshed_at - REFRESH_OVERLAP
+    query = {"$or": [{"_id": {"$gte": ObjectId.from_datetime(since)}}, {"title_updated_at": {"$gte": since}}]}
+    applied = 0
+    async for movie in db["movies"].find(query, {"title": 1}).batch_size(batch_size):
+        if movie.get("title"):
+            title_index.add(str(movie["_id"]), movie["title"])
+            applied += 1
+    title_index.refreshed_at = started
+    logger.info("Title index refreshed with %s titles", applied)
+    return applied
+
+def rebuild_due(rebuild_interval: float) -> bool:
+    if not title_index.ready:
+        return True
+    if rebuild_interval <= 0:
+        return False
+    return datetime.now(timezone.utc) - title_index.built_at >= timedelta(seconds=rebuild_interval)
+
+async def run_refresher(db: AsyncIOMotorDatabase, interval: Optional[float] = None, rebuild_interval: Optional[float] = None):
+    """Build at startup, then refresh every `interval` seconds and rebuild every
+    `rebuild_interval` seconds; runs as a background task."""
+    interval = TITLE_INDEX_REFRESH_INTERVAL_SECONDS if interval is None else interval
+    rebuild_interval = TITLE_INDEX_REBUILD_INTERVAL_SECONDS if rebuild_interval is None else rebuild_interval
+
+    async def update():
+        if rebuild_due(rebuild_interval):
+            await build(db)
+        else:
+            await refresh(db)
+
+    await periodic.run_periodically(update, interval, logger, "Title index refresh")
+
+async def backfill_title_keys(db: AsyncIOMotorDatabase, batch_size: int = 1000) -> int:
+    """Store `title_key` on movies written before it existed, so the suggest
+    fallback can find them. Returns the number of movies changed."""
+    updated = 0
+    updates = []
+    async for movie in db["movies"].find({"title_key": {"$exists": False}, "title": {"$type": "string"}}, {"title": 1}):
+        updates.append(UpdateOne({"_id": movie["_id"]}, {"$set": title_fields(movie["title"])}))
+        if len(updates) >= batch_size:
+            updated += (await db["movies"].bulk_write(updates, ordered=False)).modified_count
+            updates = []
+    if updates:
+        updated += (await db["movies"].bulk_write(updates, ordered=False)).modified_count
+    return updated